@@ -1,19 +1,39 @@
-from flask import Flask, request
-from twilio.twiml.voice_response import VoiceResponse, Gather
-from twilio.rest import Client
-import anthropic
+from flask import Flask, Response, g, request
+from twilio.twiml.voice_response import VoiceResponse
+import hmac
+import importlib
 import os
+import sys
+import threading
+import time
 from datetime import datetime
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 import json
 from datetime import timedelta
 import pytz
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from outbox import Outbox
+from smtp_pool import SMTPPool
+from google_clients import GoogleClientRegistry
+from sheets_sink import SheetsSink
+from call_records import CALL_RECORD_HEADER, CallRecordStore, parse_day
+from calendar_cache import AvailabilityCache
+from reservations import SlotLeaseTable, SQLiteSlotLeaseTable
+from sessions import make_session_backend
+from faq_cache import FAQCache
+from knowledge_base import KnowledgeBase, format_chunks
+from answer_stream import StreamRegistry, remaining_text
+from speculation import Speculator
+from latency_budget import LatencyBudget
+from context_window import ContextWindow, estimate_tokens
+from intents import IntentMatcher, load_vocabulary
+from twiml import TwimlTemplates
+from metrics import metrics, current_call
+from resilience import Dependency, guarded
 
 # Load environment variables from .env file
 load_dotenv()
@@ -30,8 +50,31 @@ BUSINESS_HOURS_END = 18    # 6 PM
 BUSINESS_DAYS = [0, 1, 2, 3, 4]  # Monday to Friday
 EASTERN = pytz.timezone('America/New_York')
 
+# Calendar, Sheets, SMTP and Anthropic each get a per-request timeout, a circuit
+# breaker and a bulkhead: after BREAKER_FAILURES failures in a row calls fail fast
+# for BREAKER_RESET seconds, and at most <NAME>_MAX_CONCURRENT calls to a service
+# run at once (others wait up to BULKHEAD_WAIT seconds, then fail), so one slow
+# service can't take every worker thread
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.environ.get('BREAKER_RESET', 30))
+BULKHEAD_WAIT = float(os.environ.get('BULKHEAD_WAIT', 0.5))
+
+def dependency(name, timeout, max_concurrent):
+    prefix = name.upper()
+    return Dependency(name, timeout=float(os.environ.get(prefix + '_TIMEOUT', timeout)),
+                      max_concurrent=int(os.environ.get(prefix + '_MAX_CONCURRENT', max_concurrent)),
+                      max_wait=BULKHEAD_WAIT, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET)
+
+calendar_dependency = dependency('calendar', 10, 4)
+sheets_dependency = dependency('sheets', 15, 2)
+
+# The Anthropic, Google and Twilio SDKs take most of a second to import, so
+# they are loaded on first use (or by warm_up() in the background at startup)
+# instead of when this module is imported.
+
 def get_google_credentials(scopes):
     """Get Google credentials from env var (Render) or file (local)."""
+    from google.oauth2.service_account import Credentials
     if GOOGLE_CREDENTIALS_JSON:
         info = json.loads(GOOGLE_CREDENTIALS_JSON)
         if 'private_key' in info:
@@ -40,98 +83,130 @@ def get_google_credentials(scopes):
     else:
         return Credentials.from_service_account_file(GOOGLE_CREDENTIALS_FILE, scopes=scopes)
 
+discovery_documents = {}
+discovery_lock = threading.Lock()
+
+def discovery_document(api, version):
+    """The API's discovery document as bundled with google-api-python-client, parsed once per process."""
+    key = (api, version)
+    with discovery_lock:
+        if key not in discovery_documents:
+            import googleapiclient
+            path = os.path.join(os.path.dirname(googleapiclient.__file__), 'discovery_cache', 'documents',
+                                f'{api}.{version}.json')
+            try:
+                with open(path) as f:
+                    discovery_documents[key] = json.load(f)
+            except OSError:
+                discovery_documents[key] = None
+        return discovery_documents[key]
+
+def build_calendar_service(creds):
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build, build_from_document
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=calendar_dependency.timeout))
+    document = discovery_document('calendar', 'v3')
+    if document is None:
+        # Older client library without bundled documents
+        return build('calendar', 'v3', http=http, cache_discovery=False)
+    return build_from_document(document, http=http)
+
+def build_sheets_client(creds):
+    import gspread
+    client = gspread.authorize(creds)
+    client.set_timeout(sheets_dependency.timeout)
+    return client
+
+# One credential load and one client build per thread, reused across calls
+google_clients = GoogleClientRegistry(get_google_credentials)
+google_clients.register('sheets', ['https://www.googleapis.com/auth/spreadsheets'], build_sheets_client)
+google_clients.register('calendar', ['https://www.googleapis.com/auth/calendar'], build_calendar_service)
+
 def get_sheets_client():
     try:
-        scopes = ['https://www.googleapis.com/auth/spreadsheets']
-        creds = get_google_credentials(scopes)
-        return gspread.authorize(creds)
+        return google_clients.get('sheets')
     except Exception as e:
         print(f"Google Sheets connection error: {e}")
         return None
 
 def get_calendar_service():
     try:
-        scopes = ['https://www.googleapis.com/auth/calendar']
-        creds = get_google_credentials(scopes)
-        return build('calendar', 'v3', credentials=creds)
+        return google_clients.get('calendar')
     except Exception as e:
         print(f"Google Calendar connection error: {e}")
         return None
 
-def get_available_slots(days_ahead=3):
+# Busy intervals are cached locally and refreshed incrementally with sync tokens
+CALENDAR_SYNC_INTERVAL = float(os.environ.get('CALENDAR_SYNC_INTERVAL', 60))
+calendar_cache = AvailabilityCache(get_calendar_service, GOOGLE_CALENDAR_ID, sync_interval=CALENDAR_SYNC_INTERVAL,
+                                   dependency=calendar_dependency)
+
+# Slots offered to a caller are leased so simultaneous escalations get different
+# ones; the lease table is shared through SQLite when sessions are shared
+SLOT_LEASE_SECONDS = float(os.environ.get('SLOT_LEASE_SECONDS', 120))
+SLOT_LEASE_DB = os.environ.get('SLOT_LEASE_DB') or ('slot_leases.db' if os.environ.get('SESSION_BACKEND', 'memory') != 'memory' else '')
+SLOT_SEARCH_LIMIT = int(os.environ.get('SLOT_SEARCH_LIMIT', 20))
+if SLOT_LEASE_DB:
+    slot_leases = SQLiteSlotLeaseTable(SLOT_LEASE_DB, lease_seconds=SLOT_LEASE_SECONDS)
+else:
+    slot_leases = SlotLeaseTable(lease_seconds=SLOT_LEASE_SECONDS)
+
+def is_business_hour(slot):
+    return slot.weekday() in BUSINESS_DAYS and BUSINESS_HOURS_START <= slot.hour < BUSINESS_HOURS_END
+
+def get_available_slots(days_ahead=3, limit=4):
     """Get next available 1-hour slots within business hours."""
     try:
-        service = get_calendar_service()
-        if not service:
+        if not calendar_cache.sync_if_stale():
             return []
-
-        now = datetime.now(EASTERN)
-        end_date = now + timedelta(days=days_ahead)
-
-        # Get existing events
-        events_result = service.events().list(
-            calendarId=GOOGLE_CALENDAR_ID,
-            timeMin=now.isoformat(),
-            timeMax=end_date.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        events = events_result.get('items', [])
-
-        # Build list of busy times
-        busy = []
-        for event in events:
-            start = event['start'].get('dateTime')
-            end = event['end'].get('dateTime')
-            if start and end:
-                busy.append((
-                    datetime.fromisoformat(start).astimezone(EASTERN),
-                    datetime.fromisoformat(end).astimezone(EASTERN)
-                ))
-
-        # Find free 1-hour slots
-        slots = []
-        check = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-        while check < end_date and len(slots) < 4:
-            if check.weekday() in BUSINESS_DAYS and BUSINESS_HOURS_START <= check.hour < BUSINESS_HOURS_END:
-                slot_end = check + timedelta(hours=1)
-                conflict = any(b[0] < slot_end and b[1] > check for b in busy)
-                if not conflict:
-                    slots.append(check)
-            check += timedelta(hours=1)
-        return slots
+        return cached_slots(days_ahead, limit)
     except Exception as e:
         print(f"Calendar availability error: {e}")
         return []
 
+def cached_slots(days_ahead=3, limit=4):
+    """Open business-hour slots according to the availability cache, without syncing it."""
+    now = datetime.now(EASTERN)
+    end_date = now + timedelta(days=days_ahead)
+    first = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return calendar_cache.free_slots(first, end_date, is_business_hour, limit=limit)
+
+def appointment_event(caller_phone, slot_datetime, service_interest='consultation'):
+    """Calendar event body for a 1-hour consultation."""
+    end_time = slot_datetime + timedelta(hours=1)
+    return {
+        'summary': f'World Teach Pathways - Consultation with {caller_phone}',
+        'description': f'Consultation request from {caller_phone}\nService interest: {service_interest}\nBooked via AI phone system.',
+        'start': {
+            'dateTime': slot_datetime.isoformat(),
+            'timeZone': 'America/New_York'
+        },
+        'end': {
+            'dateTime': end_time.isoformat(),
+            'timeZone': 'America/New_York'
+        },
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'email', 'minutes': 60},
+                {'method': 'popup', 'minutes': 30}
+            ]
+        }
+    }
+
 def book_appointment(caller_phone, slot_datetime, service_interest='consultation'):
     """Book a 1-hour appointment on Google Calendar."""
     try:
-        service = get_calendar_service()
-        if not service:
-            return False
-
-        end_time = slot_datetime + timedelta(hours=1)
-        event = {
-            'summary': f'World Teach Pathways - Consultation with {caller_phone}',
-            'description': f'Consultation request from {caller_phone}\nService interest: {service_interest}\nBooked via AI phone system.',
-            'start': {
-                'dateTime': slot_datetime.isoformat(),
-                'timeZone': 'America/New_York'
-            },
-            'end': {
-                'dateTime': end_time.isoformat(),
-                'timeZone': 'America/New_York'
-            },
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'email', 'minutes': 60},
-                    {'method': 'popup', 'minutes': 30}
-                ]
-            }
-        }
-        service.events().insert(calendarId=GOOGLE_CALENDAR_ID, body=event).execute()
+        with calendar_dependency.call():
+            service = get_calendar_service()
+            if not service:
+                return False
+
+            event = appointment_event(caller_phone, slot_datetime, service_interest)
+            with metrics.span('calendar', 'insert'):
+                created = service.events().insert(calendarId=GOOGLE_CALENDAR_ID, body=event).execute()
+        calendar_cache.add_busy(created.get('id'), slot_datetime, slot_datetime + timedelta(hours=1))
         print(f"Appointment booked for {caller_phone} at {slot_datetime}")
         return True
     except Exception as e:
@@ -150,28 +225,72 @@ def format_slots_for_speech(slots):
         parts.append(f"{day} at {hour}")
     return "I have openings " + ", or ".join(parts) + ". Which works best for you?"
 
+SHEET_HEADER = ['Date', 'Time', 'Caller Phone', 'Call Type', 'Conversation', 'Voicemail Transcript']
+
+def open_call_log_sheet():
+    client = get_sheets_client()
+    if not client:
+        raise RuntimeError("Google Sheets client unavailable")
+    return client.open_by_key(GOOGLE_SHEET_ID).sheet1
+
+# Rows are batched and written with one append_rows call per flush. Each row is
+# appended to the spill file before log_to_sheets returns, so waiting rows
+# survive a crash or restart. At most SHEETS_MAX_BUFFER rows wait there; past
+# that, rows are dropped from the sheet (call_records still has every call)
+sheets_sink = SheetsSink(
+    open_call_log_sheet, SHEET_HEADER,
+    max_batch=int(os.environ.get('SHEETS_BATCH_SIZE', 50)),
+    flush_interval=float(os.environ.get('SHEETS_FLUSH_INTERVAL', 5)),
+    max_buffer=int(os.environ.get('SHEETS_MAX_BUFFER', 1000)),
+    spill_path=os.environ.get('SHEETS_SPILL_PATH', 'sheets_spill.jsonl'),
+    dependency=sheets_dependency
+)
+
 def log_to_sheets(caller_id, call_type, conversation_text, voicemail_text=''):
+    """Queue a call log row; the sheets sink writes it out in the next batch."""
+    now = datetime.now()
+    row = [
+        now.strftime('%Y-%m-%d'),
+        now.strftime('%I:%M %p EST'),
+        caller_id,
+        call_type,
+        conversation_text,
+        voicemail_text
+    ]
+    sheets_sink.add(row)
+
+def write_sheet_row(row):
+    """Outbox handler for rows queued before batching was introduced."""
+    sheets_sink.add(row)
+
+# Every call, turn, escalation outcome and voicemail also goes to a local SQLite
+# store, written in batches by a background thread. Query it with
+# `python call_records.py` or GET /calls (only when CALL_RECORDS_TOKEN is set);
+# `python call_records.py export` copies finished calls to a worksheet in bulk
+CALL_RECORDS_PATH = os.environ.get('CALL_RECORDS_PATH', 'call_records.db')
+CALL_RECORDS_TOKEN = os.environ.get('CALL_RECORDS_TOKEN', '')
+call_records = CallRecordStore(
+    CALL_RECORDS_PATH,
+    max_batch=int(os.environ.get('CALL_RECORDS_BATCH_SIZE', 200)),
+    flush_interval=float(os.environ.get('CALL_RECORDS_FLUSH_INTERVAL', 1)),
+    max_buffer=int(os.environ.get('CALL_RECORDS_MAX_BUFFER', 10000))
+)
+
+def open_call_records_worksheet(title):
+    from gspread import WorksheetNotFound
+    client = get_sheets_client()
+    if not client:
+        raise RuntimeError("Google Sheets client unavailable")
+    spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
     try:
-        client = get_sheets_client()
-        if not client:
-            return
-        sheet = client.open_by_key(GOOGLE_SHEET_ID).sheet1
-        # Add header row if sheet is empty
-        if sheet.row_count == 0 or sheet.cell(1, 1).value != 'Date':
-            sheet.insert_row(['Date', 'Time', 'Caller Phone', 'Call Type', 'Conversation', 'Voicemail Transcript'], 1)
-        now = datetime.now()
-        row = [
-            now.strftime('%Y-%m-%d'),
-            now.strftime('%I:%M %p EST'),
-            caller_id,
-            call_type,
-            conversation_text,
-            voicemail_text
-        ]
-        sheet.append_row(row)
-        print(f"Logged to Google Sheets: {call_type} from {caller_id}")
-    except Exception as e:
-        print(f"Google Sheets logging error: {e}")
+        return spreadsheet.worksheet(title)
+    except WorksheetNotFound:
+        return spreadsheet.add_worksheet(title, rows=1000, cols=len(CALL_RECORD_HEADER))
+
+def export_call_records(store, title, settle=1800):
+    """Append finished calls that haven't been exported yet to the given worksheet of the call log spreadsheet."""
+    with sheets_dependency.call():
+        return store.export_to_worksheet(open_call_records_worksheet(title), settle=settle)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'default-secret')
@@ -181,98 +300,185 @@ TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
 YOUR_PHONE_NUMBER = os.environ.get('YOUR_PHONE_NUMBER')
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
+ANTHROPIC_MODEL = os.environ.get('ANTHROPIC_MODEL', 'claude-sonnet-4-5-20250929')
 GMAIL_ADDRESS = os.environ.get('GMAIL_ADDRESS')
 GMAIL_APP_PASSWORD = os.environ.get('GMAIL_APP_PASSWORD')
 NOTIFICATION_EMAIL = os.environ.get('NOTIFICATION_EMAIL')
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') == '1'
+# Logged-in SMTP connections are pooled between emails; see smtp_pool.py
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 2))
+SMTP_CHECK_AFTER = float(os.environ.get('SMTP_CHECK_AFTER', 30))
+SMTP_MAX_IDLE = float(os.environ.get('SMTP_MAX_IDLE', 240))
+smtp_dependency = dependency('smtp', 15, SMTP_POOL_SIZE)
+# Seconds to collect notifications into a single digest email (0 sends each one on its own)
+EMAIL_DIGEST_WINDOW = float(os.environ.get('EMAIL_DIGEST_WINDOW', 0))
+EMAIL_DIGEST_MAX = int(os.environ.get('EMAIL_DIGEST_MAX', 20))
 
 # Your public server URL (e.g. from Railway, Render, Heroku, ngrok)
 # Set this in your .env file as: BASE_URL=https://your-app-name.up.railway.app
 BASE_URL = os.environ.get('BASE_URL', '').rstrip('/')
 
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN) if TWILIO_ACCOUNT_SID else None
-anthropic_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
-conversations = {}
+sdk_clients = {}
+sdk_lock = threading.Lock()
 
+def get_anthropic_client():
+    """The shared Anthropic client (and its connection pool), created on first use."""
+    if not ANTHROPIC_API_KEY:
+        return None
+    client = sdk_clients.get('anthropic')
+    if client is None:
+        with sdk_lock:
+            client = sdk_clients.get('anthropic')
+            if client is None:
+                import anthropic
+                client = sdk_clients['anthropic'] = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    return client
+
+# Call state lives in a session backend: 'memory' for a single process,
+# 'sqlite' for several worker processes on one host, 'redis' across hosts.
+# In memory, idle calls are evicted and stay readable for a while afterwards
+# so late transcription callbacks still work.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'memory')
+SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', 'sessions.db')
+SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+CONVERSATION_IDLE_TTL = float(os.environ.get('CONVERSATION_IDLE_TTL', 1800))
+CONVERSATION_FINISHED_TTL = float(os.environ.get('CONVERSATION_FINISHED_TTL', 900))
+CONVERSATION_MAX_ENTRIES = int(os.environ.get('CONVERSATION_MAX_ENTRIES', 5000))
+CONVERSATION_MAX_MB = int(os.environ.get('CONVERSATION_MAX_MB', 64))
+
+# Background outbox for notification emails and Sheets logging (kept off the webhook path)
+OUTBOX_PATH = os.environ.get('OUTBOX_PATH', 'outbox.db')
+OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', 2))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 6))
+outbox = Outbox(OUTBOX_PATH, workers=OUTBOX_WORKERS, max_attempts=OUTBOX_MAX_ATTEMPTS)
+
+# Always in the system prompt. Everything else the receptionist knows (services,
+# hours, pricing, booking, policies) lives in the documents under KNOWLEDGE_DIR;
+# each turn gets the KNOWLEDGE_TOP_K chunks that best match the caller's
+# question, or all of them with KNOWLEDGE_TOP_K=0. A prompt shorter than
+# PROMPT_CACHE_MIN_TOKENS isn't cached by the API, so the first documents'
+# chunks go into the system prompt until it reaches that length and only the
+# rest are retrieved per turn.
 BUSINESS_KNOWLEDGE = """
 WORLD TEACH PATHWAYS - AI CURRICULUM SYSTEMS ARCHITECT & COMPLIANCE STRATEGIST
 
 WHO WE ARE:
 We are AI Curriculum Systems Architects and Compliance Strategists specializing in education technology infrastructure and regulatory readiness for schools, training providers, and organizations.
 
-SERVICES OFFERED:
-- Curriculum Design & Instructional Systems Architecture
-- AI-Governed Curriculum & Compliance Consulting
-- LMS Setup & Integration (Canvas, Moodle, ProProfs)
-- Accreditation & Regulatory Readiness Support
-- Microlearning & Training Development for Organizations
-- Compliance Systems Design for Education Providers
-
 We serve: schools, training providers, workforce organizations, and institutional clients ONLY.
 We do NOT offer individual tutoring, GED prep, ESL classes, or personal academic coaching.
-
-BUSINESS HOURS:
-- Monday to Friday: 9 AM to 6 PM Eastern Time
-- Limited Saturday availability by appointment
-- AI answering service available 24/7
-
-LOCATION:
-- Fully online nationwide
-- In-person consulting available in Central Florida by request
-
-PRICING:
-- Curriculum & Compliance Consulting: Monthly retainer or project-based
-- LMS & Compliance Systems: Scope provided after consultation
-- Pricing is customized - discovery call recommended
-
-HOW TO BOOK:
-- Call for callback
-- Submit inquiry via website
-- Email: contact@worldteachpathways.com
-- All inquiries reviewed within one business day
-
-SPECIALIZATIONS:
-- Workforce curriculum architecture
-- AI-driven instructional design
-- Compliance and accreditation systems
-- LMS platform integration
-- AI-governed curriculum systems
-
-WHO WE SERVE:
-- Schools and training organizations (compliance and LMS)
-- Education professionals and institutional clients (systems architecture)
-- Workforce development organizations
-- Corporate training departments
-
-CANCELLATION POLICY:
-24-hour notice required for consulting sessions. Late cancellations may be subject to fee.
-
-FREE CONSULTATION:
-Yes - short discovery consultation available to assess fit and scope
-
-KEY DIFFERENTIATOR:
-We specialize in AI-governed curriculum systems and compliance strategy for education providers and organizations.
-
-IF SOMEONE ASKS ABOUT INDIVIDUAL TUTORING, GED, ESL, OR PERSONAL ACADEMIC HELP:
-Politely let them know we focus exclusively on institutional and organizational clients, and suggest they search for local tutoring services or community colleges for individual academic support.
 """
+KNOWLEDGE_DIR = os.environ.get('KNOWLEDGE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledge'))
+KNOWLEDGE_INDEX_PATH = os.environ.get('KNOWLEDGE_INDEX_PATH', 'knowledge_index.json')
+KNOWLEDGE_TOP_K = int(os.environ.get('KNOWLEDGE_TOP_K', 4))
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get('PROMPT_CACHE_MIN_TOKENS', 1024))
+knowledge_base = KnowledgeBase(KNOWLEDGE_DIR, KNOWLEDGE_INDEX_PATH,
+                               chunk_words=int(os.environ.get('KNOWLEDGE_CHUNK_WORDS', 120)),
+                               check_interval=float(os.environ.get('KNOWLEDGE_CHECK_INTERVAL', 30)))
+
+OUT_OF_SCOPE_ANSWER = "We focus exclusively on schools, training providers and organizations, so we don't offer individual tutoring, GED prep or ESL classes. A local tutoring service or community college would be a great place to look for that kind of support."
+
+# Approved answers for the questions callers ask most, served without an LLM
+# call when a question matches closely enough. Keep these in line with the
+# knowledge documents - the cache is cleared whenever they change.
+APPROVED_FAQ = [
+    (["What are your hours?", "When are you open?", "What time do you close?", "Are you open on Saturday?",
+      "What are your business hours?"],
+     "We're available Monday through Friday, 9 AM to 6 PM Eastern, with limited Saturday availability by appointment. Would you like to schedule a free discovery call?"),
+    (["How much do you charge?", "What are your prices?", "How much does it cost?", "What is your pricing?"],
+     "Our pricing is customized to the scope of each project - consulting is available on a monthly retainer or per project. The best next step is a free discovery call so we can give you specific pricing. Would you like to set one up?"),
+    (["Do you offer tutoring?", "Do you do GED prep?", "Do you have ESL classes?", "Can you tutor my child?",
+      "Do you offer GED classes?"],
+     OUT_OF_SCOPE_ANSWER),
+    (["Where are you located?", "Where is your office?", "What is your address?", "Do you meet in person?"],
+     "We work fully online nationwide, and in-person consulting is available in Central Florida by request. Is there a project you'd like to talk through with us?"),
+    (["Do you offer a free consultation?", "Is the consultation free?", "Do you have a free discovery call?"],
+     "Yes! We offer a short, free discovery consultation to understand your needs and see if we're a good fit. Would you like to schedule one?"),
+]
 
 class ConversationManager:
+    __slots__ = ('caller_id', 'attempt_count', 'turns', 'summary', 'summarized', 'intents',
+                 'prefetched_slots', 'prefetched_at')
+
+    # The caller's third question goes to a person instead of the model
+    ESCALATE_AFTER = 3
+
     def __init__(self, caller_id):
         self.caller_id = caller_id
         self.attempt_count = 0
-        self.conversation_history = []
-        self.caller_questions = []
+        # (role, text) pairs - each utterance is stored exactly once
+        self.turns = []
+        # Running summary of the first `summarized` turns, which are no longer sent verbatim
+        self.summary = ''
+        self.summarized = 0
+        # Every intent detected so far in the call, accumulated one utterance at a time
+        self.intents = set()
+        # Open calendar slots fetched in the background, as ISO strings
+        self.prefetched_slots = []
+        self.prefetched_at = None
 
     def add_question(self, question):
         self.attempt_count += 1
-        self.caller_questions.append(question)
-        self.conversation_history.append({"role": "user", "content": question})
+        self.turns.append(('user', question))
 
     def add_response(self, response):
-        self.conversation_history.append({"role": "assistant", "content": response})
+        self.turns.append(('assistant', response))
+
+    @property
+    def caller_questions(self):
+        return [text for role, text in self.turns if role == 'user']
+
+    @property
+    def conversation_history(self):
+        return [{"role": role, "content": text} for role, text in self.turns]
+
+    def set_prefetched_slots(self, slots):
+        self.prefetched_slots = [slot.isoformat() for slot in slots]
+        self.prefetched_at = time.time()
+
+    def fresh_slots(self, max_age):
+        """Prefetched slots still in the future, or None if there are none younger than max_age."""
+        if self.prefetched_at is None or time.time() - self.prefetched_at > max_age:
+            return None
+        now = datetime.now(EASTERN)
+        slots = [slot for slot in map(datetime.fromisoformat, self.prefetched_slots) if slot > now]
+        return slots or None
+
+    def to_dict(self):
+        return {'caller_id': self.caller_id, 'attempt_count': self.attempt_count, 'turns': self.turns,
+                'summary': self.summary, 'summarized': self.summarized, 'intents': sorted(self.intents),
+                'prefetched_slots': self.prefetched_slots, 'prefetched_at': self.prefetched_at}
+
+    @classmethod
+    def from_dict(cls, data):
+        conversation = cls(data['caller_id'])
+        conversation.attempt_count = data['attempt_count']
+        conversation.turns = [(role, text) for role, text in data['turns']]
+        conversation.summary = data.get('summary', '')
+        conversation.summarized = data.get('summarized', 0)
+        conversation.intents = set(data.get('intents', []))
+        conversation.prefetched_slots = data.get('prefetched_slots', [])
+        conversation.prefetched_at = data.get('prefetched_at')
+        return conversation
+
+    def approx_size(self):
+        return sys.getsizeof(self.turns) + sum(56 + sys.getsizeof(text) for _, text in self.turns)
+
+    def response_to(self, turn):
+        """The assistant reply to the caller's turn-th question, if it has been stored yet."""
+        asked = 0
+        for i, (role, text) in enumerate(self.turns):
+            if role == 'user':
+                asked += 1
+                if asked == turn:
+                    following = self.turns[i + 1] if i + 1 < len(self.turns) else None
+                    return following[1] if following and following[0] == 'assistant' else None
+        return None
 
     def should_escalate(self):
-        return self.attempt_count >= 3
+        return self.attempt_count >= self.ESCALATE_AFTER
 
     def get_summary(self):
         summary = "Caller: " + self.caller_id + "\n"
@@ -284,20 +490,17 @@ class ConversationManager:
     def get_full_conversation(self):
         return "\n".join(self.caller_questions)
 
-class AIAgent:
-    def answer_question(self, question, conversation_history=None):
-        if not anthropic_client:
-            return "I apologize, our system is having trouble right now."
-
-        system_prompt = f"""You are a professional receptionist for World Teach Pathways, an AI Curriculum Systems Architecture and Compliance Strategy firm.
+def build_system_prompt(knowledge):
+    """System prompt as cacheable content blocks - built once, not per turn."""
+    text = f"""You are a professional receptionist for World Teach Pathways, an AI Curriculum Systems Architecture and Compliance Strategy firm.
 
 IMPORTANT - USE THIS BUSINESS INFORMATION TO ANSWER QUESTIONS:
-{BUSINESS_KNOWLEDGE}
+{knowledge}
 
 Communication Guidelines:
 - Keep answers natural, conversational, and brief (perfect for phone)
 - Speak like a real person - warm, professional, and knowledgeable
-- Use the business information above to give accurate answers
+- Use the business information in this prompt to give accurate answers
 - Emphasize we're AI Curriculum Systems Architects and Compliance Strategists
 - If asked about something not in the knowledge base, say: "That's a great question. Let me have one of our strategists call you back with details."
 - IMPORTANT: End each response naturally. Only ask a follow-up question if it makes sense in context. For example, after answering about services you might ask "Would you like to schedule a free discovery call?" but do NOT robotically add "Is there anything else I can help you with?" every single time. Keep it conversational and natural.
@@ -324,137 +527,697 @@ For hours:
 - We're available Monday through Friday, 9 AM to 6 PM Eastern
 - Limited Saturday availability by appointment
 
-Always be helpful, accurate, professional, and use the information provided above."""
+Always be helpful, accurate, professional, and use the information provided in this prompt."""
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
 
-        messages = conversation_history or []
+def with_cache_breakpoint(messages, notes=''):
+    """Mark the last message so the whole conversation prefix is cached for the next turn.
+
+    notes (this turn's retrieved knowledge and call summary) go after the
+    breakpoint in the same user turn, so they never become part of a prefix
+    that a later turn has to match.
+    """
+    messages = [dict(m) for m in messages]
+    last = messages[-1]
+    last["content"] = [{"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}]
+    if notes:
+        last["content"].append({"type": "text", "text": notes})
+    return messages
+
+class AIAgent:
+    def __init__(self, knowledge, budget, faq=None, approved_faq=(), knowledge_base=None, top_k=4,
+                 cache_min_tokens=1024, max_tracked_calls=1000, dependency=None):
+        self.budget = budget
+        self.dependency = dependency
+        self.faq = faq
+        self.approved_faq = approved_faq
+        self.knowledge_base = knowledge_base
+        self.top_k = top_k
+        self.cache_min_tokens = cache_min_tokens
+        self.pinned_chunks = 0
+        self.max_tracked_calls = max_tracked_calls
+        self.usage_by_call = OrderedDict()
+        self.totals = {'calls': 0, 'input_tokens': 0, 'output_tokens': 0,
+                       'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+        self.fallbacks = {'faq': 0, 'canned': 0}
+        self._lock = threading.Lock()
+        self.set_knowledge(knowledge)
+
+    def set_knowledge(self, knowledge):
+        """Rebuild the system prompt; call whenever the business knowledge changes."""
+        self.knowledge = knowledge
+        self.knowledge_version = self.knowledge_base.version if self.knowledge_base else ''
+        self.pinned_chunks = 0
+        if self.knowledge_base and self.top_k:
+            chunks = self.knowledge_base.chunks()
+            tokens = estimate_tokens(build_system_prompt(knowledge)[0]["text"])
+            while self.pinned_chunks < len(chunks) and tokens < self.cache_min_tokens:
+                tokens += estimate_tokens(format_chunks([chunks[self.pinned_chunks]]))
+                self.pinned_chunks += 1
+            if self.pinned_chunks:
+                knowledge += "\n" + format_chunks(chunks[:self.pinned_chunks]) + "\n"
+            if self.pinned_chunks < len(chunks):
+                knowledge += "\nMore details relevant to the caller's question (services, hours, pricing, booking, policies) are given with their latest message.\n"
+        elif self.knowledge_base:
+            knowledge += "\n" + self.knowledge_base.full_text() + "\n"
+        self.system_prompt = build_system_prompt(knowledge)
+        if self.faq:
+            self.faq.load(self.knowledge + self.knowledge_version, self.approved_faq)
+
+    def relevant_knowledge(self, question, messages):
+        """The top_k knowledge chunks for this turn; follow-ups with nothing to match on use the previous question too."""
+        chunks = self.knowledge_base.search(question, self.top_k, skip=self.pinned_chunks)
+        earlier = [m["content"] for m in messages[:-1] if m["role"] == "user"]
+        if not chunks and earlier:
+            chunks = self.knowledge_base.search(earlier[-1] + " " + question, self.top_k, skip=self.pinned_chunks)
+        return chunks
+
+    def record_usage(self, call_sid, usage, elapsed, context=None):
+        """Keep per-call token counts, including prompt cache reads and writes."""
+        counts = {
+            'input_tokens': usage.input_tokens or 0,
+            'output_tokens': usage.output_tokens or 0,
+            'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', None) or 0,
+            'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', None) or 0,
+        }
+        with self._lock:
+            self.totals['calls'] += 1
+            for key, value in counts.items():
+                self.totals[key] += value
+            if call_sid is None:
+                return
+            turns = self.usage_by_call.setdefault(call_sid, [])
+            self.usage_by_call.move_to_end(call_sid)
+            counts['latency_ms'] = round(elapsed * 1000)
+            if context:
+                counts.update(context)
+            turns.append(counts)
+            while len(self.usage_by_call) > self.max_tracked_calls:
+                self.usage_by_call.popitem(last=False)
+        print(f"LLM usage for {call_sid}: {counts}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.totals)
+        prompt_tokens = stats['input_tokens'] + stats['cache_read_input_tokens'] + stats['cache_creation_input_tokens']
+        stats['cache_hit_ratio'] = round(stats['cache_read_input_tokens'] / prompt_tokens, 3) if prompt_tokens else None
+        stats['outcomes'] = self.budget.stats()
+        stats['fallbacks'] = dict(self.fallbacks)
+        return stats
+
+    def faq_answer(self, question, call_sid=None):
+        if not self.faq:
+            return None
+        started = time.monotonic()
+        match = self.faq.lookup(question)
+        if not match:
+            return None
+        answer, confidence = match
+        print(f"FAQ answer for {call_sid} (confidence {confidence:.2f}, {(time.monotonic() - started) * 1000:.1f} ms)")
+        return answer
+
+    def message_params(self, question, conversation_history=None, summary=''):
+        """Keyword arguments for messages.create, shared by the sync and async clients."""
+        messages = list(conversation_history or [])
         if not messages or messages[-1]["content"] != question:
             messages.append({"role": "user", "content": question})
 
+        if self.knowledge_base:
+            self.knowledge_base.refresh_if_due()
+            if self.knowledge_base.version != self.knowledge_version:
+                self.set_knowledge(self.knowledge)
+        # Both change from turn to turn, so they go after the last cache breakpoint
+        notes = []
+        if self.knowledge_base and self.top_k:
+            chunks = self.relevant_knowledge(question, messages)
+            if chunks:
+                notes.append("BUSINESS INFORMATION FOR THIS QUESTION:\n" + format_chunks(chunks))
+        if summary:
+            notes.append("Earlier in this call:\n" + summary)
+        if notes:
+            notes.insert(0, "(Notes for the receptionist, not said by the caller)")
+        return {
+            'model': ANTHROPIC_MODEL,
+            'max_tokens': 350,
+            'system': self.system_prompt,
+            'messages': with_cache_breakpoint(messages, '\n\n'.join(notes))
+        }
+
+    def answer_question(self, question, conversation_history=None, call_sid=None, summary='', context=None):
+        answer = self.faq_answer(question, call_sid)
+        if answer:
+            return answer
+
+        if not get_anthropic_client():
+            return "I apologize, our system is having trouble right now."
+
+        params = self.message_params(question, conversation_history, summary)
+        outcome, answer, elapsed = self.budget.run(lambda: self.create_message(params, call_sid, context))
+        print(f"LLM {outcome} for {call_sid} in {elapsed * 1000:.0f} ms")
+        if answer is not None:
+            return answer
+        return self.fallback_answer(question)
+
+    def stream_answer(self, answer, question, conversation_history=None, call_sid=None, summary='', context=None):
+        """Stream the reply into a StreamedAnswer as the model writes it. Returns the finished text."""
+        cached = self.faq_answer(question, call_sid)
+        client = get_anthropic_client()
+        if cached or not client:
+            answer.feed(cached or "I apologize, our system is having trouble right now.")
+            answer.finish()
+            return answer.final_text()
+
+        params = self.message_params(question, conversation_history, summary)
+        started = time.monotonic()
+        client = client.with_options(timeout=self.budget.budget, max_retries=0)
         try:
-            response = anthropic_client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=350,
-                system=system_prompt,
-                messages=messages
-            )
-            return response.content[0].text
+            with guarded(self.dependency), metrics.span('anthropic', 'messages.stream', call_sid):
+                with client.messages.stream(**params) as stream:
+                    for text in stream.text_stream:
+                        if not answer.feed(text):
+                            raise TimeoutError("nobody is waiting for the rest of the answer")
+                        if time.monotonic() - started > self.budget.budget:
+                            raise TimeoutError(f"no complete answer in {self.budget.budget:g}s")
+                    message = stream.get_final_message()
         except Exception as e:
-            return "Sorry, I'm having a little trouble right now."
+            print(f"LLM stream error for {call_sid}: {e}")
+            answer.fail(self.fallback_answer(question))
+            streamed_answers.record(answer, ok=False)
+            return answer.final_text()
+        answer.finish()
+        streamed_answers.record(answer, ok=True)
+        self.record_usage(call_sid, message.usage, time.monotonic() - started, context)
+        return answer.final_text()
+
+    def create_message(self, params, call_sid, context=None):
+        started = time.monotonic()
+        # Retries and the HTTP timeout are bounded by the turn budget instead
+        client = get_anthropic_client().with_options(timeout=self.budget.budget, max_retries=0)
+        with guarded(self.dependency), metrics.span('anthropic', 'messages.create', call_sid):
+            response = client.messages.create(**params)
+        self.record_usage(call_sid, response.usage, time.monotonic() - started, context)
+        return response.content[0].text
+
+    def fallback_answer(self, question):
+        """Best answer we can give without the model: a looser FAQ match, else a callback offer."""
+        # Looser on score, but the approved question's content words must all have been asked about
+        match = self.faq.lookup(question, threshold=LLM_FALLBACK_CONFIDENCE, all_terms=True) if self.faq else None
+        with self._lock:
+            self.fallbacks['faq' if match else 'canned'] += 1
+        if match:
+            return match[0]
+        return "That's a great question. Let me have one of our strategists call you back with details."
+
+# Repeat questions are answered from APPROVED_FAQ when the match is confident enough
+FAQ_CACHE_ENABLED = os.environ.get('FAQ_CACHE_ENABLED', '1') == '1'
+FAQ_CONFIDENCE = float(os.environ.get('FAQ_CONFIDENCE', 0.5))
+FAQ_CACHE_SIZE = int(os.environ.get('FAQ_CACHE_SIZE', 500))
+faq_cache = FAQCache(threshold=FAQ_CONFIDENCE, max_entries=FAQ_CACHE_SIZE) if FAQ_CACHE_ENABLED else None
+
+# Each turn's model call must finish within LLM_TURN_BUDGET seconds (Twilio gives
+# up on a webhook after 15). With LLM_HEDGE_AFTER set, a second request is sent
+# if the first is still running after that many seconds.
+LLM_TURN_BUDGET = float(os.environ.get('LLM_TURN_BUDGET', 8))
+LLM_HEDGE_AFTER = float(os.environ.get('LLM_HEDGE_AFTER', 0)) or None
+LLM_FALLBACK_CONFIDENCE = float(os.environ.get('LLM_FALLBACK_CONFIDENCE', 0.45))
+LLM_POOL_SIZE = int(os.environ.get('LLM_POOL_SIZE', 16))
+llm_budget = LatencyBudget(LLM_TURN_BUDGET, hedge_after=LLM_HEDGE_AFTER, max_workers=LLM_POOL_SIZE)
+# The turn budget is the model call's timeout; while the breaker is open turns get the fallback answer
+anthropic_dependency = Dependency('anthropic', timeout=LLM_TURN_BUDGET,
+                                  max_concurrent=int(os.environ.get('ANTHROPIC_MAX_CONCURRENT', LLM_POOL_SIZE)),
+                                  max_wait=BULKHEAD_WAIT, failure_threshold=BREAKER_FAILURES,
+                                  reset_timeout=BREAKER_RESET)
+
+ai_agent = AIAgent(BUSINESS_KNOWLEDGE, llm_budget, faq=faq_cache, approved_faq=APPROVED_FAQ,
+                   knowledge_base=knowledge_base, top_k=KNOWLEDGE_TOP_K,
+                   cache_min_tokens=PROMPT_CACHE_MIN_TOKENS, dependency=anthropic_dependency)
+
+def finish_conversation(call_sid, conversation):
+    """Session finalizer: log the finished call and drop per-call state it no longer needs."""
+    discard_speculation(call_sid)
+    print(f"Call {call_sid} finished: {conversation.attempt_count} questions, "
+          f"intents {sorted(conversation.intents) or 'none'}")
+
+sessions = make_session_backend(
+    SESSION_BACKEND, ConversationManager.from_dict,
+    idle_ttl=CONVERSATION_IDLE_TTL,
+    finished_ttl=CONVERSATION_FINISHED_TTL,
+    max_entries=CONVERSATION_MAX_ENTRIES,
+    max_bytes=CONVERSATION_MAX_MB * 1024 * 1024,
+    sqlite_path=SESSION_DB_PATH,
+    redis_url=SESSION_REDIS_URL,
+    finalizer=finish_conversation
+)
+
+# Only the last CONTEXT_KEEP_TURNS turns (within CONTEXT_MAX_TOKENS) go to the model
+# verbatim; older turns are folded into a short running summary
+context_window = ContextWindow(
+    max_tokens=int(os.environ.get('CONTEXT_MAX_TOKENS', 1500)),
+    keep_turns=int(os.environ.get('CONTEXT_KEEP_TURNS', 6)),
+    summary_tokens=int(os.environ.get('CONTEXT_SUMMARY_TOKENS', 300))
+)
+
+# Intent vocabularies (scheduling, pricing, out-of-scope, human handoff) compiled
+# into one matcher; INTENT_VOCABULARY_FILE can extend or override them. With
+# INTENT_ROUTING=1, handoff requests escalate straight away and out-of-scope
+# requests get the referral answer without an LLM call.
+intent_matcher = IntentMatcher(load_vocabulary(os.environ.get('INTENT_VOCABULARY_FILE')))
+INTENT_ROUTING = os.environ.get('INTENT_ROUTING', '0') == '1'
+
+def no_change(conversation):
+    pass
+
+# SPECULATIVE_ANSWERS=1 asks Twilio for interim transcripts (/partial_speech) and
+# starts answering once one is stable. If the final SpeechResult matches it within
+# SPECULATION_THRESHOLD the answer already under way is used, otherwise it's dropped
+SPECULATIVE_ANSWERS = os.environ.get('SPECULATIVE_ANSWERS', '0') == '1'
+speculator = Speculator(
+    threshold=float(os.environ.get('SPECULATION_THRESHOLD', 0.85)),
+    min_words=int(os.environ.get('SPECULATION_MIN_WORDS', 3)),
+    max_unstable=int(os.environ.get('SPECULATION_MAX_UNSTABLE', 2)),
+    max_attempts=int(os.environ.get('SPECULATION_MAX_ATTEMPTS', 2))
+) if SPECULATIVE_ANSWERS else None
+
+# ASYNC_TURNS=1 answers on a worker pool: the webhook returns a short <Pause> and a
+# <Redirect> to /answer_ready, which Twilio follows until the answer is stored
+ASYNC_TURNS = os.environ.get('ASYNC_TURNS', '0') == '1'
+# At least a second: Twilio's <Pause> is in whole seconds and the poll limit divides by it
+TURN_POLL_PAUSE = max(1, int(os.environ.get('TURN_POLL_PAUSE', 1)))
+TURN_POLL_LIMIT = int(LLM_TURN_BUDGET // TURN_POLL_PAUSE) + 5
+# Static TwiML is rendered once; answers and holds fill pre-rendered templates
+# that are checked byte-for-byte against the twilio library at startup
+twiml_templates = TwimlTemplates(BASE_URL, pause=TURN_POLL_PAUSE, partial_callback=SPECULATIVE_ANSWERS)
+
+turn_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('TURN_WORKERS', 32)), thread_name_prefix='turn')
+
+# STREAM_ANSWERS=1 streams the model's reply: the webhook speaks the first complete
+# sentence as soon as it arrives, then redirects to /answer_ready for the rest,
+# which waits up to STREAM_POLL_WAIT seconds for each further sentence
+STREAM_ANSWERS = os.environ.get('STREAM_ANSWERS', '0') == '1'
+STREAM_POLL_WAIT = float(os.environ.get('STREAM_POLL_WAIT', 4))
+streamed_answers = StreamRegistry()
+
+# Availability is fetched in the background when a call starts (or a scheduling
+# request first comes up) so the escalation turn only has to book
+CALENDAR_PREFETCH_TTL = float(os.environ.get('CALENDAR_PREFETCH_TTL', 120))
+prefetch_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('PREFETCH_WORKERS', 4)), thread_name_prefix='prefetch')
+prefetching = set()
+prefetch_lock = threading.Lock()
+
+def start_slot_prefetch(call_sid, caller_id):
+    with prefetch_lock:
+        if call_sid in prefetching:
+            return
+        prefetching.add(call_sid)
+    prefetch_pool.submit(prefetch_slots, call_sid, caller_id)
 
-ai_agent = AIAgent()
+def prefetch_slots(call_sid, caller_id):
+    try:
+        slots = get_available_slots(days_ahead=5)
+        if slots:
+            sessions.update(call_sid, lambda c: c.set_prefetched_slots(slots), lambda: ConversationManager(caller_id))
+    except Exception as e:
+        print(f"Calendar prefetch error: {e}")
+    finally:
+        with prefetch_lock:
+            prefetching.discard(call_sid)
+
+def reserve_slot(conversation, call_sid):
+    """Lease the first open slot no other caller holds, from the prefetched slots or a wider cache lookup."""
+    # Use the slots prefetched earlier in the call, or check the calendar now
+    slots = conversation.fresh_slots(CALENDAR_PREFETCH_TTL) or get_available_slots(days_ahead=5)
+    slot = slot_leases.offer(slots, call_sid)
+    if slot is None and slots:
+        # Everything offered is leased to callers escalating right now - look further ahead
+        slot = slot_leases.offer(get_available_slots(days_ahead=5, limit=SLOT_SEARCH_LIMIT), call_sid)
+    return slot
+
+def book_slot(conversation, call_sid, caller_id):
+    """Lease a slot, confirm the lease and put the appointment on the calendar. Returns the slot, or None.
+
+    The lease is confirmed before the calendar insert; if it ran out and another
+    caller has the slot by then, the next free one is leased instead.
+    """
+    for _ in range(3):
+        slot = reserve_slot(conversation, call_sid)
+        if slot is None:
+            return None
+        if slot_leases.confirm(slot, call_sid):
+            break
+        print(f"Slot {slot} went to another caller before {call_sid} confirmed it")
+    else:
+        return None
+    if not book_appointment(caller_id, slot):
+        slot_leases.release(slot, call_sid)
+        return None
+    return slot
+
+# Every webhook is timed by route; dependency calls made while handling it are
+# also traced under its CallSid (see /metrics and /traces/<call_sid>)
+@app.before_request
+def start_request_timer():
+    g.started = time.time()
+    g.timer = time.perf_counter()
+    g.call_sid = request.values.get('CallSid')
+    g.call_token = current_call.set(g.call_sid)
+
+def observe_request(status):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe_request(endpoint, request.method, status, g.started, time.perf_counter() - g.timer, g.call_sid)
+    g.observed = True
+
+@app.after_request
+def record_request_time(response):
+    observe_request(response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request(error=None):
+    if 'timer' in g and not g.get('observed'):
+        observe_request(500)
+    if 'call_token' in g:
+        current_call.reset(g.pop('call_token'))
 
 @app.route("/voice", methods=['GET', 'POST'])
 def handle_incoming_call():
-    response = VoiceResponse()
     caller_id = request.values.get('From', 'Unknown')
     call_sid = request.values.get('CallSid', 'Unknown')
-    if call_sid not in conversations:
-        conversations[call_sid] = ConversationManager(caller_id)
-    response.say("Hi! Thanks for calling World Teach Pathways. How can I help you today?", voice='Google.en-US-Neural2-F', language='en-US')
-    # FIX: Use absolute URL so Twilio can find your server
-    gather = Gather(input='speech', action=BASE_URL + '/process_speech', speech_timeout='auto', language='en-US')
-    response.append(gather)
-    response.redirect(BASE_URL + '/voice')
-    return str(response)
+    conversation = sessions.update(call_sid, no_change, lambda: ConversationManager(caller_id))
+    call_records.call_started(call_sid, caller_id)
+    if conversation.fresh_slots(CALENDAR_PREFETCH_TTL) is None:
+        start_slot_prefetch(call_sid, caller_id)
+    return twiml_templates.greeting
 
 @app.route("/process_speech", methods=['POST'])
 def process_speech():
-    response = VoiceResponse()
     speech_result = request.values.get('SpeechResult', '').strip()
     call_sid = request.values.get('CallSid', 'Unknown')
     caller_id = request.values.get('From', 'Unknown')
-    if call_sid not in conversations:
-        conversations[call_sid] = ConversationManager(caller_id)
-    conversation = conversations[call_sid]
     if not speech_result:
-        response.say("Sorry, I didn't catch that. Could you repeat that?", voice='Google.en-US-Neural2-F')
-        # FIX: Use absolute URL
-        response.redirect(BASE_URL + '/voice')
-        return str(response)
-    conversation.add_question(speech_result)
-
-    is_appointment_request = any(word in speech_result.lower() for word in ['appointment', 'schedule', 'meeting', 'book', 'available', 'consultation', 'speak with', 'talk to'])
-
-    if conversation.should_escalate():
-        if is_appointment_request or any(word in q.lower() for q in conversation.caller_questions for word in ['appointment', 'schedule', 'consultation']):
-            # Check calendar for available slots
-            slots = get_available_slots(days_ahead=5)
-            if slots:
-                # Book the first available slot automatically
-                booked_slot = slots[0]
-                book_appointment(caller_id, booked_slot)
-                send_appointment_email(conversation, booked_slot)
-                slot_text = booked_slot.strftime('%A, %B %d at %I:%M %p Eastern')
-                response.say(f"I've gone ahead and scheduled a discovery consultation for you on {slot_text}. One of our strategists will call you then. Thanks for calling World Teach Pathways!", voice='Google.en-US-Neural2-F')
-            else:
-                send_appointment_email(conversation)
-                response.say("Perfect! I have all your information. One of our strategists will call you shortly to schedule a time. Thanks for calling!", voice='Google.en-US-Neural2-F')
-        else:
-            send_email_notification(conversation)
-            response.say("Let me take your information and someone from our team will get back to you soon.", voice='Google.en-US-Neural2-F')
-            # FIX: Use absolute URLs for voicemail action and transcription callback
-            response.record(
-                action=BASE_URL + '/handle_voicemail',
-                max_length=60,
-                transcribe=True,
-                transcribe_callback=BASE_URL + '/handle_transcription'
-            )
-            return str(response)
-        response.hangup()
-        return str(response)
-
-    ai_answer = ai_agent.answer_question(speech_result, conversation.conversation_history)
-    conversation.add_response(ai_answer)
-    response.say(ai_answer, voice='Google.en-US-Neural2-F', language='en-US')
-    # Let Claude's response end naturally - no robotic follow-up phrase added
-    gather = Gather(input='speech', action=BASE_URL + '/process_speech', speech_timeout='auto', timeout=6)
-    response.append(gather)
-    response.say("Thanks for calling World Teach Pathways! Have a great day!", voice='Google.en-US-Neural2-F')
+        discard_speculation(call_sid)
+        sessions.update(call_sid, no_change, lambda: ConversationManager(caller_id))
+        return twiml_templates.repeat
+    conversation, turn_intents, wants_booking, escalate = record_caller_turn(call_sid, caller_id, speech_result)
+
+    if escalate:
+        discard_speculation(call_sid)
+        if wants_booking:
+            return booking_response(conversation, call_sid, book_slot(conversation, call_sid, caller_id))
+        return voicemail_response(conversation, call_sid)
+
+    if INTENT_ROUTING and turn_intents == {'out_of_scope'}:
+        # Tutoring/GED/ESL requests get the standard referral without a model call
+        discard_speculation(call_sid)
+        store_response(call_sid, caller_id, OUT_OF_SCOPE_ANSWER)
+        return answer_response(OUT_OF_SCOPE_ANSWER)
+
+    speculation = speculator.take(call_sid, speech_result) if speculator else None
+    if speculation:
+        final_at = time.monotonic()
+        if (ASYNC_TURNS or STREAM_ANSWERS) and not speculation.handle.done():
+            # Not worth holding this thread for: finish it on the turn pool and let Twilio poll
+            turn_pool.submit(finish_speculation, call_sid, caller_id, speech_result, conversation, speculation,
+                             final_at)
+            return hold_response(conversation.attempt_count, 1)
+        try:
+            ai_answer, done_at = speculation.handle.result(timeout=LLM_TURN_BUDGET)
+        except Exception as e:
+            print(f"Speculative answer error for {call_sid}: {e}")
+            ai_answer = None
+        if ai_answer is not None:
+            return speculative_response(call_sid, caller_id, speculation, ai_answer, final_at, done_at)
+
+    if STREAM_ANSWERS:
+        answer = streamed_answers.start(call_sid, conversation.attempt_count)
+        turn_pool.submit(stream_turn, call_sid, caller_id, speech_result, conversation, answer)
+        return first_sentence_response(answer, conversation.attempt_count, speech_result)
+
+    if ASYNC_TURNS:
+        # Answer on the turn pool and let Twilio poll for it, so this thread is freed right away
+        turn_pool.submit(answer_turn, call_sid, caller_id, speech_result, conversation)
+        return hold_response(conversation.attempt_count, 1)
+
+    ai_answer = answer_turn(call_sid, caller_id, speech_result, conversation)
+    return answer_response(ai_answer)
+
+def record_caller_turn(call_sid, caller_id, speech_result, prefetch=start_slot_prefetch):
+    """Store the caller's turn and decide routing.
+
+    Returns (conversation, turn intents, wants_booking, escalate).
+    """
+    # Only the new utterance is classified; earlier turns' intents are already on the conversation
+    turn_intents = intent_matcher.classify(speech_result)
+    conversation = sessions.update(call_sid, lambda c: add_caller_turn(c, speech_result, turn_intents),
+                                   lambda: ConversationManager(caller_id))
+    call_records.turn(call_sid, caller_id, 'user', speech_result, turn_intents)
+
+    is_appointment_request = bool(turn_intents & {'scheduling', 'human_handoff'})
+    escalate = conversation.should_escalate() or (INTENT_ROUTING and 'human_handoff' in turn_intents)
+
+    if is_appointment_request and not escalate and conversation.fresh_slots(CALENDAR_PREFETCH_TTL) is None:
+        prefetch(call_sid, caller_id)
+    # Earlier turns only count if they asked for an appointment in so many words
+    wants_booking = is_appointment_request or 'explicit_booking' in conversation.intents
+    return conversation, turn_intents, wants_booking, escalate
+
+def booking_response(conversation, call_sid, booked_slot):
+    """Tell the caller about the booked slot (or the callback), notify the team and end the call."""
+    outcome = 'booked' if booked_slot else 'callback'
+    call_records.outcome(call_sid, conversation.caller_id, 'Consultation Request', outcome, booked_slot)
+    response = VoiceResponse()
+    if booked_slot:
+        send_appointment_email(conversation, booked_slot)
+        slot_text = booked_slot.strftime('%A, %B %d at %I:%M %p Eastern')
+        response.say(f"I've gone ahead and scheduled a discovery consultation for you on {slot_text}. One of our strategists will call you then. Thanks for calling World Teach Pathways!", voice='Google.en-US-Neural2-F')
+    else:
+        send_appointment_email(conversation)
+        response.say("Perfect! I have all your information. One of our strategists will call you shortly to schedule a time. Thanks for calling!", voice='Google.en-US-Neural2-F')
     response.hangup()
     return str(response)
 
-@app.route("/handle_voicemail", methods=['POST'])
-def handle_voicemail():
+def voicemail_response(conversation, call_sid):
+    call_records.outcome(call_sid, conversation.caller_id, 'Inquiry', 'voicemail')
+    send_email_notification(conversation)
     response = VoiceResponse()
-    response.say("Thank you. We'll call you back as soon as possible. Goodbye!", voice='Google.en-US-Neural2-F')
-    response.hangup()
+    response.say("Let me take your information and someone from our team will get back to you soon.", voice='Google.en-US-Neural2-F')
+    # FIX: Use absolute URLs for voicemail action and transcription callback
+    response.record(
+        action=BASE_URL + '/handle_voicemail',
+        max_length=60,
+        transcribe=True,
+        transcribe_callback=BASE_URL + '/handle_transcription'
+    )
     return str(response)
 
+def add_caller_turn(conversation, question, intents):
+    conversation.add_question(question)
+    conversation.intents |= intents
+    context_window.fold(conversation)
+
+def answer_turn(call_sid, caller_id, question, conversation):
+    history, context = context_window.messages(conversation)
+    print(f"Context for {call_sid}: {context}")
+    ai_answer = ai_agent.answer_question(question, history, call_sid, summary=conversation.summary, context=context)
+    store_response(call_sid, caller_id, ai_answer)
+    return ai_answer
+
+def stream_turn(call_sid, caller_id, question, conversation, answer):
+    history, context = context_window.messages(conversation)
+    print(f"Context for {call_sid}: {context}")
+    ai_answer = ai_agent.stream_answer(answer, question, history, call_sid, summary=conversation.summary, context=context)
+    store_response(call_sid, caller_id, ai_answer)
+    return ai_answer
+
+def store_response(call_sid, caller_id, ai_answer):
+    sessions.update(call_sid, lambda c: c.add_response(ai_answer), lambda: ConversationManager(caller_id))
+    call_records.turn(call_sid, caller_id, 'assistant', ai_answer)
+
+def worth_speculating(conversation, question):
+    """False if the caller's next turn won't need a model answer: it escalates, or intent routing answers it."""
+    if conversation.attempt_count + 1 >= ConversationManager.ESCALATE_AFTER:
+        return False
+    if INTENT_ROUTING:
+        intents = intent_matcher.classify(question)
+        return 'human_handoff' not in intents and intents != {'out_of_scope'}
+    return True
+
+def speculative_answer(call_sid, question, conversation):
+    """Answer an interim transcript. Returns (answer, monotonic time it was ready)."""
+    # The question isn't on the conversation yet; message_params adds it after the history
+    history, context = context_window.messages(conversation)
+    ai_answer = ai_agent.answer_question(question, history, call_sid, summary=conversation.summary, context=context)
+    return ai_answer, time.monotonic()
+
+def use_speculative_answer(call_sid, caller_id, speculation, ai_answer, final_at, done_at):
+    print(f"Speculative answer used for {call_sid} ({(final_at - speculation.started) * 1000:.0f} ms head start)")
+    speculator.record_saved(speculation, final_at, done_at)
+    store_response(call_sid, caller_id, ai_answer)
+
+def speculative_response(call_sid, caller_id, speculation, ai_answer, final_at, done_at):
+    use_speculative_answer(call_sid, caller_id, speculation, ai_answer, final_at, done_at)
+    return answer_response(ai_answer)
+
+def finish_speculation(call_sid, caller_id, question, conversation, speculation, final_at):
+    """Turn pool: store a speculative answer still under way when the final result came in, or answer afresh."""
+    try:
+        ai_answer, done_at = speculation.handle.result(timeout=LLM_TURN_BUDGET)
+    except Exception as e:
+        print(f"Speculative answer error for {call_sid}: {e}")
+        return answer_turn(call_sid, caller_id, question, conversation)
+    use_speculative_answer(call_sid, caller_id, speculation, ai_answer, final_at, done_at)
+    return ai_answer
+
+def discard_speculation(call_sid):
+    if speculator:
+        speculator.discard(call_sid)
+
+def partial_sequence(values):
+    sequence = values.get('SequenceNumber', '')
+    return int(sequence) if sequence.isdigit() else None
+
+@app.route("/partial_speech", methods=['POST'])
+def partial_speech():
+    """Twilio's partialResultCallback: starts answering once the interim transcript is stable enough."""
+    call_sid = request.values.get('CallSid', 'Unknown')
+    if not speculator:
+        return '', 204
+    text = speculator.observe(call_sid, request.values.get('StableSpeechResult', ''),
+                              request.values.get('UnstableSpeechResult', ''), partial_sequence(request.values))
+    if text:
+        conversation = sessions.get(call_sid)
+        if conversation and worth_speculating(conversation, text):
+            speculator.started(call_sid, text, turn_pool.submit(speculative_answer, call_sid, text, conversation))
+    return '', 204
+
+def first_sentence_response(answer, turn, question):
+    """Speak the start of a streamed answer as soon as its first sentence is complete."""
+    response = stream_response(answer, turn, 0, LLM_TURN_BUDGET)
+    if response is None:
+        # Not even a sentence within the budget: give up on the stream
+        answer.fail(ai_agent.fallback_answer(question))
+        response = stream_response(answer, turn, 0, 0)
+    return response
+
+def stream_response(answer, turn, said, wait):
+    """TwiML for the sentences after `said`: the rest of the answer, or the next part and a redirect."""
+    sentences, done = answer.wait(said, wait)
+    return streamed_twiml(sentences, done, turn, said)
+
+def streamed_twiml(sentences, done, turn, said):
+    """stream_response's TwiML for sentences already waited for; None if there are none yet."""
+    if done:
+        return answer_response(' '.join(sentences))
+    if sentences:
+        return twiml_templates.partial(' '.join(sentences), turn, said + len(sentences))
+    return None
+
+def answer_response(ai_answer):
+    return twiml_templates.answer(ai_answer)
+
+def hold_response(turn, attempt, said=0):
+    return twiml_templates.hold(turn, attempt, said)
+
+@app.route("/answer_ready", methods=['GET', 'POST'])
+def answer_ready():
+    """Poll target for ASYNC_TURNS and STREAM_ANSWERS: speaks the answer, or the rest of it, once it is ready."""
+    call_sid = request.values.get('CallSid', 'Unknown')
+    position = poll_position(request.values)
+    if position is None:
+        return twiml_templates.repeat
+    turn, attempt, said = position
+    answer = streamed_answers.get(call_sid, turn)
+    if answer:
+        response = stream_response(answer, turn, said, STREAM_POLL_WAIT)
+        if response:
+            return response
+    return poll_response(sessions.get(call_sid), turn, attempt, said)
+
+def poll_position(values):
+    """(turn, attempt, said) from a poll redirect's query string, or None if it is malformed."""
+    try:
+        turn, attempt, said = int(values.get('turn', 0)), int(values.get('attempt', 1)), int(values.get('said', 0))
+    except ValueError:
+        return None
+    if turn < 0 or attempt < 1 or said < 0:
+        return None
+    return turn, attempt, said
+
+def poll_response(conversation, turn, attempt, said=0):
+    ai_answer = conversation.response_to(turn) if conversation else None
+    if ai_answer is not None:
+        # said > 0 when the start of a streamed answer was already spoken, perhaps by another worker
+        return answer_response(remaining_text(ai_answer, said))
+    if conversation and attempt < TURN_POLL_LIMIT:
+        return hold_response(turn, attempt + 1, said)
+    # The answer never arrived (e.g. the worker process died) - don't leave the caller in silence
+    questions = conversation.caller_questions if conversation else []
+    question = questions[turn - 1] if 0 < turn <= len(questions) else ''
+    return answer_response(ai_agent.fallback_answer(question))
+
+@app.route("/handle_voicemail", methods=['POST'])
+def handle_voicemail():
+    return twiml_templates.voicemail_thanks
+
 @app.route("/handle_transcription", methods=['POST'])
 def handle_transcription():
     call_sid = request.values.get('CallSid', 'Unknown')
     transcription = request.values.get('TranscriptionText', '')
-    if call_sid in conversations:
-        send_email_with_voicemail(conversations[call_sid], transcription)
+    conversation = sessions.get(call_sid)
+    # Recorded even if the session has gone, so the transcript isn't lost
+    call_records.voicemail(call_sid, conversation.caller_id if conversation else request.values.get('From', 'Unknown'),
+                           transcription)
+    if conversation:
+        send_email_with_voicemail(conversation, transcription)
     return '', 200
 
 def send_email(subject, body, conversation):
-    """Helper to send email - handles connection properly and closes on error."""
+    """Queue an email for background delivery so the webhook can return immediately."""
     if not GMAIL_ADDRESS or not GMAIL_APP_PASSWORD or not NOTIFICATION_EMAIL:
         print("Email not configured - check GMAIL_ADDRESS, GMAIL_APP_PASSWORD, NOTIFICATION_EMAIL in .env")
         return
-    server = None
+    if EMAIL_DIGEST_WINDOW > 0:
+        outbox.enqueue('email_digest', {'subject': subject, 'body': body}, delay=EMAIL_DIGEST_WINDOW)
+    else:
+        outbox.enqueue('email', {'subject': subject, 'body': body})
+
+def open_smtp_connection():
+    """Connect, STARTTLS and log in; the pool reuses the result for later emails."""
+    with metrics.span('smtp', 'connect'):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=smtp_dependency.timeout)
     try:
-        msg = MIMEMultipart()
-        msg['From'] = GMAIL_ADDRESS
-        msg['To'] = NOTIFICATION_EMAIL
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-        # FIX: Use context-safe server handling so connection always closes
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
-        server.send_message(msg)
-        print(f"Email sent: {subject}")
-    except Exception as e:
-        print(f"Email error: {e}")
-    finally:
-        # FIX: Always close the SMTP connection, even if an error occurred
-        if server:
-            try:
-                server.quit()
-            except Exception:
-                pass
+        if SMTP_STARTTLS:
+            with metrics.span('smtp', 'starttls'):
+                server.starttls()
+        with metrics.span('smtp', 'login'):
+            server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+smtp_pool = SMTPPool(open_smtp_connection, size=SMTP_POOL_SIZE, check_after=SMTP_CHECK_AFTER, max_idle=SMTP_MAX_IDLE)
+
+def deliver_email(subject, body):
+    """Outbox handler: send one message over SMTP. Raises so failures are retried."""
+    msg = MIMEMultipart()
+    msg['From'] = GMAIL_ADDRESS
+    msg['To'] = NOTIFICATION_EMAIL
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    # An open breaker raises here too, so the outbox retries the email later
+    with smtp_dependency.call():
+        smtp_pool.send(msg)
+    print(f"Email sent: {subject}")
+
+def deliver_email_digest(messages):
+    """Outbox batch handler: one email for the notifications collected in the digest window."""
+    if len(messages) == 1:
+        deliver_email(**messages[0])
+        return
+    subject = f"World Teach Pathways - {len(messages)} notifications"
+    body = "\n\n".join(f"{i}. {message['subject']}\n" + "=" * 50 + "\n" + message['body']
+                        for i, message in enumerate(messages, 1))
+    deliver_email(subject, body)
 
 def send_appointment_email(conversation, booked_slot=None):
     log_to_sheets(conversation.caller_id, 'Consultation Request', conversation.get_full_conversation())
@@ -482,9 +1245,114 @@ def send_email_with_voicemail(conversation, voicemail_text):
     body = "New voicemail:\n\n" + conversation.get_summary() + "\nMessage: " + voicemail_text
     send_email("World Teach Pathways - New Voicemail", body, conversation)
 
+outbox.register('email', deliver_email)
+outbox.register('email_digest', deliver_email_digest, batch=EMAIL_DIGEST_MAX)
+outbox.register('sheets', write_sheet_row)
+
 @app.route("/status")
 def status():
-    return {"status": "running", "base_url": BASE_URL or "NOT SET - add BASE_URL to .env"}
+    return status_report()
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route("/traces/<call_sid>")
+def call_trace(call_sid):
+    spans = metrics.trace(call_sid)
+    if spans is None:
+        return {"error": "no trace for " + call_sid}, 404
+    return {"call_sid": call_sid, "spans": spans}
+
+@app.route("/calls")
+def list_calls():
+    return call_records_report(request.values, request.headers.get('Authorization', ''))
+
+def call_records_report(values, authorization):
+    """Calls filtered by caller, since, until (YYYY-MM-DD, local time) and type, or one call's turns with call_sid.
+
+    Off unless CALL_RECORDS_TOKEN is set; requests need 'Authorization: Bearer <token>'.
+    """
+    if not CALL_RECORDS_TOKEN:
+        return {"error": "call records endpoint is disabled"}, 404
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {CALL_RECORDS_TOKEN}".encode()):
+        return {"error": "unauthorized"}, 401
+    # Include this process's events that are still queued
+    call_records.flush()
+    if values.get('call_sid'):
+        record = call_records.call(values['call_sid'])
+        if record is None:
+            return {"error": "no call " + values['call_sid']}, 404
+        return record
+    try:
+        filters = dict(caller=values.get('caller') or None, since=parse_day(values.get('since') or None),
+                       until=parse_day(values.get('until') or None, end=True), call_type=values.get('type') or None,
+                       limit=min(int(values.get('limit', 100)), 1000))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return {"calls": call_records.calls(**filters)}
+
+def status_report():
+    return {
+        "status": "running",
+        "base_url": BASE_URL or "NOT SET - add BASE_URL to .env",
+        "dependencies": {service.name: service.stats() for service in
+                         (anthropic_dependency, calendar_dependency, sheets_dependency, smtp_dependency)},
+        "outbox": outbox.stats(),
+        "smtp": smtp_pool.stats(),
+        "google_clients": google_clients.stats(),
+        "sheets": sheets_sink.stats(),
+        "call_records": call_records.stats(),
+        "calendar": calendar_cache.stats(),
+        "slot_leases": slot_leases.stats(),
+        "sessions": sessions.stats(),
+        "llm": ai_agent.stats(),
+        "streaming": streamed_answers.stats() if STREAM_ANSWERS else None,
+        "speculation": speculator.stats() if speculator else None,
+        "faq": faq_cache.stats() if faq_cache else None,
+        "knowledge": knowledge_base.stats(),
+        "warm_up": warm_up_report
+    }
+
+# With WARM_UP=1 (the default) the servers call start_warm_up() at startup:
+# the SDKs are imported, Google tokens fetched, the calendar synced and the
+# call log sheet opened on a background thread, before the first caller needs them
+WARM_UP = os.environ.get('WARM_UP', '1') == '1'
+warm_up_report = {}
+
+def warm_anthropic():
+    client = get_anthropic_client()
+    if client:
+        # Opens the pooled HTTPS connection the first turn reuses; listing models costs no tokens
+        client.with_options(timeout=10, max_retries=0).models.list(limit=1)
+
+def warm_google_libraries():
+    # Imported even when the credentials can't be used yet, so a later client build doesn't pay for it
+    for module in ('gspread', 'googleapiclient.discovery'):
+        importlib.import_module(module)
+    discovery_document('calendar', 'v3')
+
+def warm_calendar():
+    if not calendar_cache.sync_if_stale():
+        raise RuntimeError("calendar sync failed")
+
+def warm_up():
+    """Load the integrations and open their connections ahead of the first call."""
+    steps = [('anthropic', warm_anthropic), ('google_libraries', warm_google_libraries),
+             ('calendar', warm_calendar), ('sheets', sheets_sink.warm_up)]
+    for name, step in steps:
+        started = time.monotonic()
+        try:
+            step()
+            outcome = 'ok'
+        except Exception as e:
+            outcome = f'error: {e}'
+        warm_up_report[name] = {'ms': round((time.monotonic() - started) * 1000), 'outcome': outcome}
+    print(f"Warm-up finished: {warm_up_report}")
+
+def start_warm_up():
+    if WARM_UP:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
 
 @app.route("/")
 def home():
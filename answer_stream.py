@@ -0,0 +1,180 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Sentence ends: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+# Words whose trailing period doesn't end a sentence
+ABBREVIATIONS = frozenset(['mr', 'mrs', 'ms', 'dr', 'st', 'vs', 'etc', 'e.g', 'i.e', 'inc', 'approx'])
+
+
+def split_sentences(text):
+    """Split text into sentences; the last one may be unfinished if text is still growing."""
+    sentences, tail = complete_sentences(text)
+    return sentences + [tail] if tail else sentences
+
+
+def complete_sentences(text):
+    """(sentences that have ended, the text after them)."""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        words = text[start:match.start()].split()
+        last = words[-1].lower() if words else ''
+        # 'A.M.', 'U.S.', 'e.g.': a single letter or a known abbreviation before the period
+        if text[match.start()] == '.' and (len(last.split('.')[-1]) <= 1 or last in ABBREVIATIONS):
+            continue
+        sentences.append(text[start:match.end()].strip())
+        start = match.end()
+    return sentences, text[start:].strip()
+
+
+def remaining_text(answer, said):
+    """The part of a finished answer after its first `said` sentences."""
+    if not said:
+        return answer
+    return ' '.join(split_sentences(answer)[said:])
+
+
+class StreamedAnswer:
+    """One turn's reply, filled in as the model streams it and read a sentence at a time.
+
+    The producer feeds text deltas and finishes (or fails) the answer; readers
+    wait for sentences beyond the ones already spoken, on a thread with wait()
+    or on an event loop with wait_async(). Only complete sentences are handed
+    out until the stream ends, when the final piece is released too.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.sentences = []
+        self.done = False
+        self.closed = False
+        self.started = time.monotonic()
+        self.first_sentence_at = None
+        self._changed = threading.Condition()
+        self._waiters = []
+
+    def feed(self, delta):
+        """Add streamed text. Returns False once the answer has been closed and nobody is listening."""
+        with self._changed:
+            if self.closed:
+                return False
+            self.text += delta
+            complete, _ = complete_sentences(self.text)
+            if len(complete) > len(self.sentences):
+                self.sentences = complete
+                if self.first_sentence_at is None:
+                    self.first_sentence_at = time.monotonic()
+                self._notify()
+            return True
+
+    def finish(self):
+        with self._changed:
+            if not self.closed:
+                self.sentences = split_sentences(self.text)
+                self._close()
+
+    def fail(self, fallback):
+        """End the stream early: keep the sentences already complete, or use fallback if there are none."""
+        with self._changed:
+            if not self.closed:
+                self.sentences = self.sentences or split_sentences(fallback)
+                self._close()
+
+    def _close(self):
+        self.done = self.closed = True
+        if self.first_sentence_at is None:
+            self.first_sentence_at = time.monotonic()
+        self._notify()
+
+    def _notify(self):
+        # Caller holds self._changed
+        self._changed.notify_all()
+        for loop, future in self._waiters:
+            loop.call_soon_threadsafe(_wake, future)
+        self._waiters = []
+
+    def wait(self, said, timeout):
+        """Sentences after the first `said`, once there are any or the answer is done. Returns (sentences, done)."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while not self.done and len(self.sentences) <= said:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._changed.wait(left)
+            return self.sentences[said:], self.done
+
+    async def wait_async(self, said, timeout):
+        """wait() for an event loop: suspends the coroutine instead of holding a thread."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._changed:
+                left = deadline - loop.time()
+                if self.done or len(self.sentences) > said or left <= 0:
+                    return self.sentences[said:], self.done
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            try:
+                await asyncio.wait_for(future, left)
+            except asyncio.TimeoutError:
+                with self._changed:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+
+    def final_text(self):
+        with self._changed:
+            return ' '.join(self.sentences)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class StreamRegistry:
+    """The answers being streamed in this process, by (call_sid, turn), for the last max_entries turns."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._answers = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'streams': 0, 'completed': 0, 'failed': 0}
+        self.first_sentence = {'count': 0, 'total_ms': 0, 'max_ms': 0}
+
+    def start(self, call_sid, turn):
+        answer = StreamedAnswer()
+        with self._lock:
+            self._answers[(call_sid, turn)] = answer
+            while len(self._answers) > self.max_entries:
+                self._answers.popitem(last=False)
+            self.counters['streams'] += 1
+        return answer
+
+    def get(self, call_sid, turn):
+        with self._lock:
+            return self._answers.get((call_sid, turn))
+
+    def discard(self, call_sid, turn):
+        with self._lock:
+            self._answers.pop((call_sid, turn), None)
+
+    def record(self, answer, ok):
+        """Count a finished stream and how long its first sentence took."""
+        ms = round((answer.first_sentence_at - answer.started) * 1000)
+        with self._lock:
+            self.counters['completed' if ok else 'failed'] += 1
+            self.first_sentence['count'] += 1
+            self.first_sentence['total_ms'] += ms
+            self.first_sentence['max_ms'] = max(self.first_sentence['max_ms'], ms)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['tracked'] = len(self._answers)
+            stats['first_sentence'] = dict(self.first_sentence)
+        return stats
@@ -0,0 +1,519 @@
+import asyncio
+import json
+import os
+import time
+from datetime import timedelta
+from urllib.parse import parse_qs, quote
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Same rule as run.py: several worker processes need a shared session store
+WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+if WORKERS > 1 and os.environ.get('SESSION_BACKEND', 'memory') == 'memory':
+    print("WEB_CONCURRENCY > 1 needs a shared session store - using SESSION_BACKEND=sqlite")
+    os.environ['SESSION_BACKEND'] = 'sqlite'
+
+import httpx
+
+from ai_phone_answering_system import (
+    ANTHROPIC_API_KEY, CALENDAR_PREFETCH_TTL, GOOGLE_CALENDAR_ID, INTENT_ROUTING, LLM_TURN_BUDGET,
+    OUT_OF_SCOPE_ANSWER, SESSION_BACKEND, SLOT_SEARCH_LIMIT, ASYNC_TURNS, STREAM_ANSWERS, STREAM_POLL_WAIT,
+    ConversationManager, ai_agent, anthropic_dependency, answer_response, appointment_event, booking_response,
+    cached_slots, calendar_cache, calendar_dependency, call_records, call_records_report, context_window,
+    discard_speculation, google_clients, hold_response, no_change, outbox, partial_sequence, poll_position,
+    poll_response, record_caller_turn, send_email_with_voicemail, sessions, slot_leases, speculative_response,
+    speculator, start_warm_up, status_report, store_response, streamed_answers, streamed_twiml, twiml_templates,
+    use_speculative_answer, voicemail_response, worth_speculating
+)
+from metrics import metrics, current_call
+
+# Sessions and slot leases kept in SQLite or Redis are called on a worker
+# thread; the in-memory ones are cheap enough to call on the event loop
+SHARED_STATE = SESSION_BACKEND != 'memory'
+
+
+async def offload(fn, *args):
+    if SHARED_STATE:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+class AsyncCalendar:
+    """Calendar reads and writes over httpx, feeding the same AvailabilityCache as the sync app.
+
+    Access tokens come from the shared GoogleClientRegistry, so both modes use
+    one credential load and the same background refresh.
+    """
+
+    SCOPES = ['https://www.googleapis.com/auth/calendar']
+
+    def __init__(self, registry, cache, calendar_id, base_url='https://www.googleapis.com/calendar/v3'):
+        self.registry = registry
+        self.cache = cache
+        self.events_url = f"{base_url}/calendars/{quote(calendar_id)}/events"
+        self.http = None
+        self._sync_lock = asyncio.Lock()
+
+    async def _headers(self):
+        token = await asyncio.to_thread(self.registry.token, self.SCOPES)
+        return {'Authorization': f'Bearer {token}'}
+
+    async def _list_pages(self, params):
+        pages = []
+        page_token = None
+        while True:
+            query = dict(params, pageToken=page_token) if page_token else params
+            headers = await self._headers()
+            with metrics.span('calendar', 'list'):
+                response = await self.http.get(self.events_url, params=query, headers=headers)
+            if response.status_code == 410:
+                raise SyncTokenExpired()
+            response.raise_for_status()
+            page = response.json()
+            pages.append(page)
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return pages
+
+    async def sync(self):
+        async with self._sync_lock:
+            if not self.cache.is_stale():
+                # Another request synced while this one waited for the lock
+                return
+            async with calendar_dependency.acall():
+                params, full = self.cache.sync_params()
+                if not full:
+                    try:
+                        self.cache.apply(await self._list_pages(params), full=False)
+                        return
+                    except SyncTokenExpired:
+                        print("Calendar sync token expired - doing a full resync")
+                params, full = self.cache.sync_params(full=True)
+                self.cache.apply(await self._list_pages(params), full=True)
+
+    async def available_slots(self, days_ahead=3, limit=4):
+        if self.cache.is_stale():
+            try:
+                await self.sync()
+            except Exception as e:
+                self.cache.sync_failed(e)
+        if not self.cache.has_data():
+            return []
+        return cached_slots(days_ahead, limit)
+
+    async def book(self, caller_phone, slot_datetime):
+        try:
+            async with calendar_dependency.acall():
+                headers = await self._headers()
+                with metrics.span('calendar', 'insert'):
+                    response = await self.http.post(self.events_url, json=appointment_event(caller_phone, slot_datetime),
+                                                    headers=headers)
+                    response.raise_for_status()
+            self.cache.add_busy(response.json().get('id'), slot_datetime, slot_datetime + timedelta(hours=1))
+            print(f"Appointment booked for {caller_phone} at {slot_datetime}")
+            return True
+        except Exception as e:
+            print(f"Calendar booking error: {e}")
+            return False
+
+
+class AsyncAIAgent:
+    """AIAgent.answer_question on AsyncAnthropic.
+
+    Prompt, FAQ fast path, fallbacks, usage accounting and the latency budget
+    are all the sync agent's; only the model call itself is a coroutine.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.client = None
+
+    async def answer_question(self, question, conversation_history=None, call_sid=None, summary='', context=None):
+        answer = self.agent.faq_answer(question, call_sid)
+        if answer:
+            return answer
+
+        if not self.client:
+            return "I apologize, our system is having trouble right now."
+
+        params = self.agent.message_params(question, conversation_history, summary)
+        outcome, answer, elapsed = await self.agent.budget.run_async(lambda: self.create_message(params, call_sid, context))
+        print(f"LLM {outcome} for {call_sid} in {elapsed * 1000:.0f} ms")
+        if outcome == 'timeout':
+            # The attempts were cancelled at the deadline, which the breaker doesn't see as a failure by itself
+            anthropic_dependency.record_failure(TimeoutError(f"no answer in {self.agent.budget.budget:g}s"))
+        if answer is not None:
+            return answer
+        return self.agent.fallback_answer(question)
+
+    async def stream_answer(self, answer, question, conversation_history=None, call_sid=None, summary='', context=None):
+        """AIAgent.stream_answer on AsyncAnthropic; readers wait on the StreamedAnswer from worker threads."""
+        cached = self.agent.faq_answer(question, call_sid)
+        if cached or not self.client:
+            answer.feed(cached or "I apologize, our system is having trouble right now.")
+            answer.finish()
+            return answer.final_text()
+
+        params = self.agent.message_params(question, conversation_history, summary)
+        started = time.monotonic()
+
+        async def read_stream():
+            with metrics.span('anthropic', 'messages.stream', call_sid):
+                async with self.client.messages.stream(**params) as stream:
+                    async for text in stream.text_stream:
+                        if not answer.feed(text):
+                            raise TimeoutError("nobody is waiting for the rest of the answer")
+                    return await stream.get_final_message()
+
+        try:
+            # Outside wait_for, so running out of time reaches the breaker as a TimeoutError
+            async with anthropic_dependency.acall():
+                message = await asyncio.wait_for(read_stream(), self.agent.budget.budget)
+        except Exception as e:
+            print(f"LLM stream error for {call_sid}: {e}")
+            answer.fail(self.agent.fallback_answer(question))
+            streamed_answers.record(answer, ok=False)
+            return answer.final_text()
+        answer.finish()
+        streamed_answers.record(answer, ok=True)
+        self.agent.record_usage(call_sid, message.usage, time.monotonic() - started, context)
+        return answer.final_text()
+
+    async def create_message(self, params, call_sid, context=None):
+        started = time.monotonic()
+        async with anthropic_dependency.acall():
+            with metrics.span('anthropic', 'messages.create', call_sid):
+                response = await self.client.messages.create(**params)
+        self.agent.record_usage(call_sid, response.usage, time.monotonic() - started, context)
+        return response.content[0].text
+
+
+calendar = AsyncCalendar(google_clients, calendar_cache, GOOGLE_CALENDAR_ID)
+async_agent = AsyncAIAgent(ai_agent)
+
+# Tasks started by a request but not awaited by it (prefetches, ASYNC_TURNS, streamed and speculative answers)
+background = set()
+prefetching = set()
+
+def spawn(coro):
+    task = asyncio.ensure_future(coro)
+    background.add(task)
+    task.add_done_callback(background.discard)
+    return task
+
+def start_prefetch(call_sid, caller_id):
+    if call_sid in prefetching:
+        return
+    prefetching.add(call_sid)
+    spawn(prefetch_slots(call_sid, caller_id))
+
+async def prefetch_slots(call_sid, caller_id):
+    try:
+        slots = await calendar.available_slots(days_ahead=5)
+        if slots:
+            await offload(sessions.update, call_sid, lambda c: c.set_prefetched_slots(slots),
+                          lambda: ConversationManager(caller_id))
+    except Exception as e:
+        print(f"Calendar prefetch error: {e}")
+    finally:
+        prefetching.discard(call_sid)
+
+async def reserve_slot(conversation, call_sid):
+    slots = conversation.fresh_slots(CALENDAR_PREFETCH_TTL) or await calendar.available_slots(days_ahead=5)
+    slot = await offload(slot_leases.offer, slots, call_sid)
+    if slot is None and slots:
+        wider = await calendar.available_slots(days_ahead=5, limit=SLOT_SEARCH_LIMIT)
+        slot = await offload(slot_leases.offer, wider, call_sid)
+    return slot
+
+async def book_slot(conversation, call_sid, caller_id):
+    """The main module's book_slot, with the Calendar insert on the loop."""
+    for _ in range(3):
+        slot = await reserve_slot(conversation, call_sid)
+        if slot is None:
+            return None
+        if await offload(slot_leases.confirm, slot, call_sid):
+            break
+        print(f"Slot {slot} went to another caller before {call_sid} confirmed it")
+    else:
+        return None
+    if not await calendar.book(caller_id, slot):
+        await offload(slot_leases.release, slot, call_sid)
+        return None
+    return slot
+
+async def answer_turn(call_sid, caller_id, question, conversation):
+    history, context = context_window.messages(conversation)
+    print(f"Context for {call_sid}: {context}")
+    ai_answer = await async_agent.answer_question(question, history, call_sid, summary=conversation.summary,
+                                                  context=context)
+    await offload(store_response, call_sid, caller_id, ai_answer)
+    return ai_answer
+
+async def stream_turn(call_sid, caller_id, question, conversation, answer):
+    history, context = context_window.messages(conversation)
+    print(f"Context for {call_sid}: {context}")
+    ai_answer = await async_agent.stream_answer(answer, question, history, call_sid, summary=conversation.summary,
+                                                context=context)
+    await offload(store_response, call_sid, caller_id, ai_answer)
+    return ai_answer
+
+async def finish_speculation(call_sid, caller_id, question, conversation, speculation, final_at):
+    try:
+        ai_answer, done_at = await asyncio.wait_for(asyncio.shield(speculation.handle), LLM_TURN_BUDGET)
+    except Exception as e:
+        print(f"Speculative answer error for {call_sid}: {e}")
+        return await answer_turn(call_sid, caller_id, question, conversation)
+    await offload(use_speculative_answer, call_sid, caller_id, speculation, ai_answer, final_at, done_at)
+    return ai_answer
+
+async def speculative_answer(call_sid, question, conversation):
+    history, context = context_window.messages(conversation)
+    ai_answer = await async_agent.answer_question(question, history, call_sid, summary=conversation.summary,
+                                                  context=context)
+    return ai_answer, time.monotonic()
+
+
+async def handle_incoming_call(values):
+    caller_id = values.get('From', 'Unknown')
+    call_sid = values.get('CallSid', 'Unknown')
+    conversation = await offload(sessions.update, call_sid, no_change, lambda: ConversationManager(caller_id))
+    call_records.call_started(call_sid, caller_id)
+    if conversation.fresh_slots(CALENDAR_PREFETCH_TTL) is None:
+        start_prefetch(call_sid, caller_id)
+    return twiml_templates.greeting
+
+async def process_speech(values):
+    speech_result = values.get('SpeechResult', '').strip()
+    call_sid = values.get('CallSid', 'Unknown')
+    caller_id = values.get('From', 'Unknown')
+    if not speech_result:
+        discard_speculation(call_sid)
+        await offload(sessions.update, call_sid, no_change, lambda: ConversationManager(caller_id))
+        return twiml_templates.repeat
+    # record_caller_turn may run on a worker thread, so prefetches are handed back to the loop
+    loop = asyncio.get_running_loop()
+    prefetch = lambda sid, cid: loop.call_soon_threadsafe(start_prefetch, sid, cid)
+    conversation, turn_intents, wants_booking, escalate = await offload(
+        record_caller_turn, call_sid, caller_id, speech_result, prefetch)
+
+    if escalate:
+        discard_speculation(call_sid)
+        # The notifications go through the outbox's SQLite queue, so build these off the loop
+        if wants_booking:
+            booked_slot = await book_slot(conversation, call_sid, caller_id)
+            return await asyncio.to_thread(booking_response, conversation, call_sid, booked_slot)
+        return await asyncio.to_thread(voicemail_response, conversation, call_sid)
+
+    if INTENT_ROUTING and turn_intents == {'out_of_scope'}:
+        discard_speculation(call_sid)
+        await offload(store_response, call_sid, caller_id, OUT_OF_SCOPE_ANSWER)
+        return answer_response(OUT_OF_SCOPE_ANSWER)
+
+    speculation = speculator.take(call_sid, speech_result) if speculator else None
+    if speculation:
+        final_at = time.monotonic()
+        if (ASYNC_TURNS or STREAM_ANSWERS) and not speculation.handle.done():
+            spawn(finish_speculation(call_sid, caller_id, speech_result, conversation, speculation, final_at))
+            return hold_response(conversation.attempt_count, 1)
+        try:
+            # Shielded so a timeout here doesn't cancel an answer that's nearly done
+            ai_answer, done_at = await asyncio.wait_for(asyncio.shield(speculation.handle), LLM_TURN_BUDGET)
+        except Exception as e:
+            print(f"Speculative answer error for {call_sid}: {e}")
+            ai_answer = None
+        if ai_answer is not None:
+            return await offload(speculative_response, call_sid, caller_id, speculation, ai_answer, final_at, done_at)
+
+    if STREAM_ANSWERS:
+        # The stream is fed and waited for on the loop, without holding a worker thread
+        answer = streamed_answers.start(call_sid, conversation.attempt_count)
+        spawn(stream_turn(call_sid, caller_id, speech_result, conversation, answer))
+        return await first_sentence_response(answer, conversation.attempt_count, speech_result)
+
+    if ASYNC_TURNS:
+        spawn(answer_turn(call_sid, caller_id, speech_result, conversation))
+        return hold_response(conversation.attempt_count, 1)
+
+    return answer_response(await answer_turn(call_sid, caller_id, speech_result, conversation))
+
+async def first_sentence_response(answer, turn, question):
+    """The main module's first_sentence_response, waiting on the loop."""
+    sentences, done = await answer.wait_async(0, LLM_TURN_BUDGET)
+    if not sentences and not done:
+        # Not even a sentence within the budget: give up on the stream
+        answer.fail(ai_agent.fallback_answer(question))
+        sentences, done = answer.wait(0, 0)
+    return streamed_twiml(sentences, done, turn, 0)
+
+async def partial_speech(values):
+    call_sid = values.get('CallSid', 'Unknown')
+    if not speculator:
+        return '', 204
+    text = speculator.observe(call_sid, values.get('StableSpeechResult', ''), values.get('UnstableSpeechResult', ''),
+                              partial_sequence(values))
+    if text:
+        conversation = await offload(sessions.get, call_sid)
+        if conversation and worth_speculating(conversation, text):
+            speculator.started(call_sid, text, spawn(speculative_answer(call_sid, text, conversation)))
+    return '', 204
+
+async def answer_ready(values):
+    call_sid = values.get('CallSid', 'Unknown')
+    position = poll_position(values)
+    if position is None:
+        return twiml_templates.repeat
+    turn, attempt, said = position
+    answer = streamed_answers.get(call_sid, turn)
+    if answer:
+        sentences, done = await answer.wait_async(said, STREAM_POLL_WAIT)
+        response = streamed_twiml(sentences, done, turn, said)
+        if response:
+            return response
+    return poll_response(await offload(sessions.get, call_sid), turn, attempt, said)
+
+async def handle_voicemail(values):
+    return twiml_templates.voicemail_thanks
+
+async def handle_transcription(values):
+    call_sid = values.get('CallSid', 'Unknown')
+    transcription = values.get('TranscriptionText', '')
+    conversation = await offload(sessions.get, call_sid)
+    call_records.voicemail(call_sid, conversation.caller_id if conversation else values.get('From', 'Unknown'),
+                           transcription)
+    if conversation:
+        await asyncio.to_thread(send_email_with_voicemail, conversation, transcription)
+    return ''
+
+async def status(values):
+    return await asyncio.to_thread(status_report)
+
+async def prometheus_metrics(values):
+    return metrics.render(), 200, b'text/plain; version=0.0.4'
+
+async def call_trace(call_sid):
+    spans = metrics.trace(call_sid)
+    if spans is None:
+        return {"error": "no trace for " + call_sid}, 404
+    return {"call_sid": call_sid, "spans": spans}
+
+async def list_calls(values, authorization):
+    # Queries and the flush before them hit SQLite
+    return await asyncio.to_thread(call_records_report, values, authorization)
+
+async def home(values):
+    return {"message": "World Teach Pathways - AI Curriculum Systems & Compliance Strategy"}
+
+ROUTES = {
+    '/voice': (handle_incoming_call, {'GET', 'POST'}),
+    '/process_speech': (process_speech, {'POST'}),
+    '/answer_ready': (answer_ready, {'GET', 'POST'}),
+    '/partial_speech': (partial_speech, {'POST'}),
+    '/handle_voicemail': (handle_voicemail, {'POST'}),
+    '/handle_transcription': (handle_transcription, {'POST'}),
+    '/status': (status, {'GET'}),
+    '/metrics': (prometheus_metrics, {'GET'}),
+    '/': (home, {'GET'}),
+}
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def respond(send, status_code, body, content_type):
+    body = body.encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status_code,
+                'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # The HTTP clients belong to this process's event loop
+            calendar.http = httpx.AsyncClient(timeout=calendar_dependency.timeout)
+            if ANTHROPIC_API_KEY:
+                import anthropic
+                # Retries and the HTTP timeout are bounded by the turn budget instead
+                async_agent.client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, timeout=LLM_TURN_BUDGET,
+                                                              max_retries=0)
+            # Drain any notifications left over from a previous run
+            outbox.start()
+            call_records.start()
+            start_warm_up()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await calendar.http.aclose()
+            if async_agent.client:
+                await async_agent.client.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def dispatch(scope, values):
+    """Returns (body, status, content type) for the request."""
+    path = scope['path']
+    if path.startswith('/traces/') and scope['method'] == 'GET':
+        result = await call_trace(path[len('/traces/'):])
+    elif path == '/calls' and scope['method'] == 'GET':
+        headers = dict(scope['headers'])
+        result = await list_calls(values, headers.get(b'authorization', b'').decode('latin-1'))
+    else:
+        route = ROUTES.get(path)
+        if route is None:
+            return 'Not Found', 404, b'text/plain; charset=utf-8'
+        handler, methods = route
+        if scope['method'] not in methods:
+            return 'Method Not Allowed', 405, b'text/plain; charset=utf-8'
+        result = await handler(values)
+    status_code = 200
+    if isinstance(result, tuple):
+        if len(result) == 3:
+            return result
+        result, status_code = result
+    if isinstance(result, dict):
+        return json.dumps(result), status_code, b'application/json'
+    return result, status_code, b'text/html; charset=utf-8'
+
+async def app(scope, receive, send):
+    """ASGI entry point serving the same webhooks as the Flask app."""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    started = time.time()
+    timer = time.perf_counter()
+    # Like Flask's request.values: query string first, then the form body
+    values = {}
+    for source in (scope['query_string'], await read_body(receive)):
+        for key, items in parse_qs(source.decode('utf-8'), keep_blank_values=True).items():
+            values.setdefault(key, items[0])
+    call_sid = values.get('CallSid')
+    token = current_call.set(call_sid)
+    status_code = 500
+    try:
+        body, status_code, content_type = await dispatch(scope, values)
+        await respond(send, status_code, body, content_type)
+    finally:
+        current_call.reset(token)
+        path = scope['path']
+        endpoint = ('/traces/<call_sid>' if path.startswith('/traces/') else
+                    path if path in ROUTES or path == '/calls' else 'unmatched')
+        metrics.observe_request(endpoint, scope['method'], status_code, started, time.perf_counter() - timer, call_sid)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.environ.get('PORT', 10000))
+    print(f"Starting ASGI server on port {port}")
+    uvicorn.run('asgi_app:app', host='0.0.0.0', port=port, workers=WORKERS, access_log=False, log_level='warning')
@@ -0,0 +1,176 @@
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from metrics import metrics
+from resilience import guarded
+
+
+class AvailabilityCache:
+    """Local copy of the calendar's busy intervals, kept current with sync tokens.
+
+    The first sync lists events from a day ago onwards; after that each sync
+    asks Calendar only for what changed since the last nextSyncToken. Busy
+    intervals are merged into two sorted arrays (starts, ends) so checking a
+    candidate slot is a binary search instead of a scan over every event.
+    """
+
+    def __init__(self, get_service, calendar_id, sync_interval=60, dependency=None):
+        self.get_service = get_service
+        self.calendar_id = calendar_id
+        self.sync_interval = sync_interval
+        self.dependency = dependency
+        self._events = {}
+        self._starts = []
+        self._ends = []
+        self._dirty = False
+        self._sync_token = None
+        self._last_sync = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.counters = {'full_syncs': 0, 'incremental_syncs': 0, 'sync_errors': 0, 'local_inserts': 0, 'queries': 0}
+
+    def _list_pages(self, service, **params):
+        page_token = None
+        while True:
+            with metrics.span('calendar', 'list'):
+                result = service.events().list(calendarId=self.calendar_id, pageToken=page_token, **params).execute()
+            yield result
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+
+    def sync_params(self, full=False):
+        """events().list parameters for the next sync, and whether it is a full one."""
+        if self._sync_token and not full:
+            return {'syncToken': self._sync_token, 'singleEvents': True}, False
+        time_min = (datetime.now().astimezone() - timedelta(days=1)).isoformat()
+        return {'timeMin': time_min, 'singleEvents': True}, True
+
+    def sync(self):
+        """Pull changes from Calendar. Falls back to a full sync if the token has expired."""
+        # Guarded outside the sync lock, so threads queueing behind a slow sync count against the bulkhead
+        with guarded(self.dependency):
+            service = self.get_service()
+            if not service:
+                raise RuntimeError("Google Calendar service unavailable")
+            with self._sync_lock:
+                if not self.is_stale():
+                    # Another thread synced while this one waited for the lock
+                    return
+                params, full = self.sync_params()
+                if not full:
+                    try:
+                        self.apply(self._list_pages(service, **params), full=False)
+                        return
+                    except Exception as e:
+                        if getattr(getattr(e, 'resp', None), 'status', None) != 410:
+                            raise
+                        print("Calendar sync token expired - doing a full resync")
+                params, full = self.sync_params(full=True)
+                self.apply(self._list_pages(service, **params), full=True)
+
+    def apply(self, pages, full):
+        """Merge pages of events().list results into the cache."""
+        events = {} if full else None
+        changes = []
+        next_token = None
+        for page in pages:
+            for event in page.get('items', []):
+                changes.append(event)
+            next_token = page.get('nextSyncToken') or next_token
+        with self._lock:
+            if full:
+                self._events = events
+            for event in changes:
+                event_id = event.get('id')
+                if event.get('status') == 'cancelled':
+                    self._events.pop(event_id, None)
+                    continue
+                start = event.get('start', {}).get('dateTime')
+                end = event.get('end', {}).get('dateTime')
+                if start and end:
+                    self._events[event_id] = (datetime.fromisoformat(start).timestamp(),
+                                              datetime.fromisoformat(end).timestamp())
+                else:
+                    # All-day events don't block hourly slots
+                    self._events.pop(event_id, None)
+            self._sync_token = next_token
+            self._last_sync = time.monotonic()
+            self._dirty = True
+            self.counters['full_syncs' if full else 'incremental_syncs'] += 1
+
+    def is_stale(self):
+        return self._last_sync is None or time.monotonic() - self._last_sync >= self.sync_interval
+
+    def has_data(self):
+        return self._last_sync is not None
+
+    def sync_if_stale(self):
+        """Sync when the cache is older than sync_interval. Returns False if there is no usable cache."""
+        if not self.is_stale():
+            return True
+        try:
+            self.sync()
+        except Exception as e:
+            self.sync_failed(e)
+        return self.has_data()
+
+    def sync_failed(self, error):
+        with self._lock:
+            self.counters['sync_errors'] += 1
+        print(f"Calendar sync error: {error}")
+
+    def add_busy(self, event_id, start, end):
+        """Record an event we just inserted ourselves, without waiting for the next sync."""
+        with self._lock:
+            self._events[event_id or f'local-{start.timestamp()}'] = (start.timestamp(), end.timestamp())
+            self._dirty = True
+            self.counters['local_inserts'] += 1
+
+    def _rebuild(self):
+        # Caller holds self._lock. Merge overlapping intervals and drop ones long past.
+        cutoff = time.time() - 86400
+        starts, ends = [], []
+        for start, end in sorted(self._events.values()):
+            if end < cutoff:
+                continue
+            if starts and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self._starts, self._ends = starts, ends
+        self._dirty = False
+
+    def is_free(self, start, end):
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+            return self._is_free(start.timestamp(), end.timestamp())
+
+    def _is_free(self, start, end):
+        i = bisect_left(self._starts, end) - 1
+        return i < 0 or self._ends[i] <= start
+
+    def free_slots(self, first, until, is_open, length=timedelta(hours=1), limit=4):
+        """Hourly slots from first up to until where is_open(slot) holds and nothing is booked."""
+        slots = []
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+            self.counters['queries'] += 1
+            check = first
+            while check < until and len(slots) < limit:
+                if is_open(check) and self._is_free(check.timestamp(), (check + length).timestamp()):
+                    slots.append(check)
+                check += timedelta(hours=1)
+        return slots
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['busy_events'] = len(self._events)
+            stats['synced_seconds_ago'] = None if self._last_sync is None else round(time.monotonic() - self._last_sync, 1)
+        return stats
@@ -0,0 +1,397 @@
+"""Local call records: every call, turn and outcome in an indexed SQLite database.
+
+    python call_records.py calls [--caller +15551234567] [--since 2026-10-01] [--until 2026-10-08]
+                                 [--type Voicemail] [--limit 50] [--csv calls.csv]
+    python call_records.py show CALL_SID
+    python call_records.py summary [--since ...] [--until ...]
+    python call_records.py export [--worksheet "Call records"] [--settle 30]
+
+export appends the calls that haven't been exported yet (and have had no
+activity for --settle minutes) to a worksheet in the call log spreadsheet.
+The database is CALL_RECORDS_PATH (call_records.db by default).
+"""
+import argparse
+import atexit
+import csv
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+# Sheets' call log columns first, so exported rows line up with log_to_sheets rows
+CALL_RECORD_HEADER = ['Date', 'Time', 'Caller Phone', 'Call Type', 'Conversation', 'Voicemail Transcript',
+                      'Outcome', 'Booked Slot', 'Questions', 'Call SID']
+
+CALL_COLUMNS = ('call_sid', 'caller', 'started', 'updated', 'call_type', 'outcome', 'booked_slot', 'voicemail',
+                'questions', 'exported')
+
+
+class CallRecordStore:
+    """Durable log of calls, turns, escalation outcomes and voicemails.
+
+    The record methods only append to an in-memory queue, so they cost a few
+    microseconds on the webhook path. A writer thread, started by start() in
+    each serving process (never at import, so a pre-fork parent has no
+    thread holding a lock across the fork), commits the queue in one
+    transaction every flush_interval seconds, as soon as max_batch events are
+    waiting, and at shutdown. If a write fails the events go back on the
+    queue for the next flush; past max_buffer queued events the oldest are
+    dropped (and counted). Several processes can share the database: it runs
+    in WAL mode and each process has its own writer.
+    """
+
+    def __init__(self, path='call_records.db', max_batch=200, flush_interval=1.0, max_buffer=10000):
+        self.path = path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._conn = None
+        self._conn_pid = None
+        self._thread = None
+        self._pid = None
+        self.counters = {'events': 0, 'written': 0, 'flushes': 0, 'flush_errors': 0, 'dropped': 0}
+        self.enqueue = {'count': 0, 'total_us': 0, 'max_us': 0}
+        atexit.register(self.close)
+
+    # Recording (webhook path)
+
+    def call_started(self, call_sid, caller):
+        self._record('call', call_sid, caller, None)
+
+    def turn(self, call_sid, caller, role, text, intents=()):
+        """A caller ('user') or receptionist ('assistant') utterance."""
+        self._record('turn', call_sid, caller, (role, text, ','.join(sorted(intents))))
+
+    def outcome(self, call_sid, caller, call_type, outcome, booked_slot=None):
+        """How the call was escalated: its Sheets call type and 'booked', 'callback' or 'voicemail'."""
+        slot = booked_slot.isoformat() if booked_slot else None
+        self._record('outcome', call_sid, caller, (call_type, outcome, slot))
+
+    def voicemail(self, call_sid, caller, transcript):
+        self._record('voicemail', call_sid, caller, transcript)
+
+    def _record(self, kind, call_sid, caller, data):
+        started = time.perf_counter()
+        event = (kind, call_sid, caller, time.time(), data)
+        with self._lock:
+            self.counters['events'] += 1
+            if len(self._queue) >= self.max_buffer:
+                self._queue.popleft()
+                self.counters['dropped'] += 1
+            self._queue.append(event)
+            full = len(self._queue) >= self.max_batch
+            us = round((time.perf_counter() - started) * 1e6)
+            self.enqueue['count'] += 1
+            self.enqueue['total_us'] += us
+            self.enqueue['max_us'] = max(self.enqueue['max_us'], us)
+        if full:
+            self._wakeup.set()
+
+    def start(self):
+        """Start this process's writer thread; each worker process calls it at startup, like outbox.start()."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread:
+                return
+            self._pid = os.getpid()
+            # Events queued by the parent before a fork are the parent's to write
+            self._queue.clear()
+            self._thread = threading.Thread(target=self._run, name='call-records', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    # Storage
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS calls (
+            call_sid TEXT PRIMARY KEY,
+            caller TEXT NOT NULL,
+            started REAL NOT NULL,
+            updated REAL NOT NULL,
+            call_type TEXT NOT NULL DEFAULT 'Answered',
+            outcome TEXT NOT NULL DEFAULT 'answered',
+            booked_slot TEXT,
+            voicemail TEXT,
+            questions INTEGER NOT NULL DEFAULT 0,
+            exported REAL
+        )""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS turns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            call_sid TEXT NOT NULL,
+            role TEXT NOT NULL,
+            text TEXT NOT NULL,
+            intents TEXT NOT NULL DEFAULT '',
+            at REAL NOT NULL
+        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS calls_caller ON calls (caller, started)")
+        conn.execute("CREATE INDEX IF NOT EXISTS calls_started ON calls (started)")
+        conn.execute("CREATE INDEX IF NOT EXISTS calls_type ON calls (call_type, started)")
+        conn.execute("CREATE INDEX IF NOT EXISTS calls_unexported ON calls (exported, updated)")
+        conn.execute("CREATE INDEX IF NOT EXISTS turns_call ON turns (call_sid, id)")
+        return conn
+
+    def _db(self):
+        # Caller holds self._db_lock. Reconnect after fork so child processes never share a parent's handle
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = self._connect()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def flush(self):
+        """Write every queued event in one transaction. Returns the number written."""
+        # Held from taking the events to committing them, so concurrent flushes write in order
+        with self._db_lock:
+            with self._lock:
+                events = list(self._queue)
+                self._queue.clear()
+            if not events:
+                return 0
+            try:
+                self._write(self._db(), events)
+            except Exception as e:
+                self._requeue(events)
+                print(f"Call records write error: {e} ({len(events)} events kept for retry)")
+                return 0
+        with self._lock:
+            self.counters['flushes'] += 1
+            self.counters['written'] += len(events)
+        return len(events)
+
+    def _requeue(self, events):
+        with self._lock:
+            # Back at the front, ahead of anything queued meanwhile, unless that overflows the buffer
+            room = max(0, self.max_buffer - len(self._queue))
+            kept = events[-room:] if room else []
+            self.counters['dropped'] += len(events) - len(kept)
+            self._queue.extendleft(reversed(kept))
+            self.counters['flush_errors'] += 1
+
+    @staticmethod
+    def _write(conn, events):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Every event creates its call if this is the first the store has heard of it
+            conn.executemany(
+                "INSERT INTO calls (call_sid, caller, started, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (call_sid) DO UPDATE SET updated = max(updated, excluded.updated)",
+                [(call_sid, caller, at, at) for _, call_sid, caller, at, _ in events])
+            conn.executemany(
+                "INSERT INTO turns (call_sid, role, text, intents, at) VALUES (?, ?, ?, ?, ?)",
+                [(call_sid, data[0], data[1], data[2], at) for kind, call_sid, _, at, data in events if kind == 'turn'])
+            for kind, call_sid, _, _, data in events:
+                if kind == 'turn' and data[0] == 'user':
+                    conn.execute("UPDATE calls SET questions = questions + 1 WHERE call_sid = ?", (call_sid,))
+                elif kind == 'outcome':
+                    conn.execute("UPDATE calls SET call_type = ?, outcome = ?, booked_slot = ? WHERE call_sid = ?",
+                                 data + (call_sid,))
+                elif kind == 'voicemail':
+                    conn.execute("UPDATE calls SET call_type = 'Voicemail', outcome = 'voicemail', voicemail = ? "
+                                 "WHERE call_sid = ?", (data, call_sid))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        """Write whatever is still queued at shutdown."""
+        if self._pid == os.getpid():
+            self.flush()
+
+    # Queries
+
+    def _query(self, sql, params=()):
+        with self._db_lock:
+            return [dict(row) for row in self._db().execute(sql, params)]
+
+    def calls(self, caller=None, since=None, until=None, call_type=None, limit=100):
+        """Calls newest first, filtered by caller, start time (epoch seconds, until exclusive) and call type."""
+        clauses, params = [], []
+        for clause, value in (('caller = ?', caller), ('started >= ?', since), ('started < ?', until),
+                              ('call_type = ?', call_type)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return self._query(f"SELECT {', '.join(CALL_COLUMNS)} FROM calls{where} ORDER BY started DESC LIMIT ?",
+                           params + [limit])
+
+    def call(self, call_sid):
+        """One call with its turns in order, or None."""
+        found = self._query(f"SELECT {', '.join(CALL_COLUMNS)} FROM calls WHERE call_sid = ?", (call_sid,))
+        if not found:
+            return None
+        record = found[0]
+        record['turns'] = self._query("SELECT role, text, intents, at FROM turns WHERE call_sid = ? ORDER BY id",
+                                      (call_sid,))
+        return record
+
+    def summary(self, since=None, until=None):
+        """Call counts by call type and by outcome."""
+        clauses, params = [], []
+        if since is not None:
+            clauses.append('started >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('started < ?')
+            params.append(until)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        summary = {'calls': 0, 'callers': 0, 'by_type': {}, 'by_outcome': {}}
+        counts = self._query(f"SELECT call_type, outcome, count(*) AS n FROM calls{where} GROUP BY call_type, outcome",
+                             params)
+        for row in counts:
+            summary['calls'] += row['n']
+            summary['by_type'][row['call_type']] = summary['by_type'].get(row['call_type'], 0) + row['n']
+            summary['by_outcome'][row['outcome']] = summary['by_outcome'].get(row['outcome'], 0) + row['n']
+        summary['callers'] = self._query(f"SELECT count(DISTINCT caller) AS n FROM calls{where}", params)[0]['n']
+        return summary
+
+    # Export
+
+    def rows(self, records):
+        """CALL_RECORD_HEADER rows for calls returned by calls(); the conversation is the caller's questions."""
+        rows = []
+        with self._db_lock:
+            conn = self._db()
+            for record in records:
+                questions = [row['text'] for row in conn.execute(
+                    "SELECT text FROM turns WHERE call_sid = ? AND role = 'user' ORDER BY id", (record['call_sid'],))]
+                started = datetime.fromtimestamp(record['started'])
+                rows.append([started.strftime('%Y-%m-%d'), started.strftime('%I:%M %p EST'), record['caller'],
+                             record['call_type'], '\n'.join(questions), record['voicemail'] or '', record['outcome'],
+                             record['booked_slot'] or '', record['questions'], record['call_sid']])
+        return rows
+
+    def export_csv(self, file, **filters):
+        """Write the calls matching filters (see calls()) as CSV. Returns the number of rows."""
+        rows = self.rows(self.calls(**filters))
+        writer = csv.writer(file)
+        writer.writerow(CALL_RECORD_HEADER)
+        writer.writerows(rows)
+        return len(rows)
+
+    def unexported(self, settled_before, limit=5000):
+        """Calls not exported yet whose last activity was before settled_before, oldest first."""
+        return self._query(f"SELECT {', '.join(CALL_COLUMNS)} FROM calls WHERE exported IS NULL AND updated < ? "
+                           "ORDER BY started LIMIT ?", (settled_before, limit))
+
+    def mark_exported(self, call_sids):
+        now = time.time()
+        with self._db_lock:
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE calls SET exported = ? WHERE call_sid = ?", [(now, sid) for sid in call_sids])
+            conn.execute("COMMIT")
+
+    def export_to_worksheet(self, worksheet, settle=1800, chunk=500):
+        """Append settled, not yet exported calls to a gspread worksheet, chunk rows per append_rows call."""
+        if not worksheet.row_values(1):
+            worksheet.append_rows([CALL_RECORD_HEADER])
+        exported = 0
+        while True:
+            records = self.unexported(time.time() - settle, limit=chunk)
+            if not records:
+                return exported
+            worksheet.append_rows(self.rows(records))
+            # Marked only once Sheets has the rows; a failure part-way re-exports this chunk next time
+            self.mark_exported([record['call_sid'] for record in records])
+            exported += len(records)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['queued'] = len(self._queue)
+            stats['enqueue'] = dict(self.enqueue)
+        return stats
+
+
+def parse_day(value, end=False):
+    """Epoch seconds for a date or datetime in local time; a bare date as the end of a range means the whole day."""
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        parsed += timedelta(days=1)
+    return parsed.timestamp()
+
+
+def print_calls(records):
+    print(f"{'started':16s}  {'caller':15s}  {'type':20s}  {'outcome':9s}  {'q':>2s}  call sid")
+    for record in records:
+        started = datetime.fromtimestamp(record['started']).strftime('%Y-%m-%d %H:%M')
+        print(f"{started:16s}  {record['caller']:15s}  {record['call_type']:20s}  {record['outcome']:9s}  "
+              f"{record['questions']:2d}  {record['call_sid']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default=os.environ.get('CALL_RECORDS_PATH', 'call_records.db'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    calls = commands.add_parser('calls', help='list calls, newest first')
+    calls.add_argument('--caller')
+    calls.add_argument('--type', dest='call_type', help="'Answered', 'Consultation Request', 'Inquiry' or 'Voicemail'")
+    calls.add_argument('--limit', type=int, default=50)
+    calls.add_argument('--csv', help="write CSV to this file ('-' for stdout) instead of a table")
+    summary = commands.add_parser('summary', help='call counts by type and outcome')
+    for command in (calls, summary):
+        command.add_argument('--since', help='YYYY-MM-DD[THH:MM], local time')
+        command.add_argument('--until', help='YYYY-MM-DD[THH:MM], local time; a date includes the whole day')
+    show = commands.add_parser('show', help="one call's turns")
+    show.add_argument('call_sid')
+    export = commands.add_parser('export', help='append calls not yet exported to a worksheet')
+    export.add_argument('--worksheet', default=os.environ.get('CALL_RECORDS_WORKSHEET', 'Call records'))
+    export.add_argument('--settle', type=float, default=30, help='minutes since the last activity on a call')
+    args = parser.parse_args(argv)
+
+    store = CallRecordStore(args.db)
+    if args.command == 'calls':
+        filters = dict(caller=args.caller, since=parse_day(args.since), until=parse_day(args.until, end=True),
+                       call_type=args.call_type, limit=args.limit)
+        if args.csv == '-':
+            store.export_csv(sys.stdout, **filters)
+        elif args.csv:
+            with open(args.csv, 'w', newline='') as f:
+                print(f"Wrote {store.export_csv(f, **filters)} calls to {args.csv}")
+        else:
+            print_calls(store.calls(**filters))
+    elif args.command == 'summary':
+        summary = store.summary(parse_day(args.since), parse_day(args.until, end=True))
+        print(f"{summary['calls']} calls from {summary['callers']} callers")
+        for heading, counts in (('By type', summary['by_type']), ('By outcome', summary['by_outcome'])):
+            print(heading)
+            for name, count in sorted(counts.items(), key=lambda item: -item[1]):
+                print(f"  {name:22s} {count:6d}")
+    elif args.command == 'show':
+        record = store.call(args.call_sid)
+        if record is None:
+            sys.exit(f"No call {args.call_sid}")
+        print_calls([record])
+        if record['booked_slot']:
+            print(f"Booked: {record['booked_slot']}")
+        for turn in record['turns']:
+            said = datetime.fromtimestamp(turn['at']).strftime('%H:%M:%S')
+            print(f"  {said}  {'Caller' if turn['role'] == 'user' else 'Agent':6s}  {turn['text']}")
+        if record['voicemail']:
+            print(f"Voicemail: {record['voicemail']}")
+    elif args.command == 'export':
+        from ai_phone_answering_system import export_call_records
+        exported = export_call_records(store, args.worksheet, settle=args.settle * 60)
+        print(f"Exported {exported} calls to the '{args.worksheet}' worksheet")
+
+
+if __name__ == '__main__':
+    main()
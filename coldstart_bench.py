@@ -0,0 +1,109 @@
+"""Cold-start benchmark: module import time and the cost of the first requests.
+
+Each measurement runs in a fresh interpreter against a stub Anthropic API:
+import the app, then time the first /voice, the first and second answered
+/process_speech, and building the first Calendar client (with placeholder
+credentials, so only the client build is timed). With --warm the app's
+warm_up() runs before the first request. --ref runs the same measurement
+on an earlier commit, extracted with git archive, for a before/after.
+
+    python coldstart_bench.py [--runs 5] [--warm] [--ref HEAD~1]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from stub_backends import start_stub_anthropic
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import ai_phone_answering_system as phone
+result = {'import_ms': (time.perf_counter() - started) * 1000}
+if sys.argv[1] == 'warm' and not hasattr(phone, 'warm_up'):
+    result = None
+else:
+    if sys.argv[1] == 'warm':
+        started = time.perf_counter()
+        phone.warm_up()
+        result['warm_up_ms'] = (time.perf_counter() - started) * 1000
+    client = phone.app.test_client()
+    form = {'CallSid': 'CA-coldstart', 'From': '+15550000000'}
+    for name, extra in [('first_voice_ms', {}), ('first_answer_ms', {'SpeechResult': 'What does your company do?'}),
+                        ('second_answer_ms', {'SpeechResult': 'Do you work with universities?'})]:
+        started = time.perf_counter()
+        client.post('/process_speech' if extra else '/voice', data=dict(form, **extra))
+        result[name] = (time.perf_counter() - started) * 1000
+    from google.oauth2.credentials import Credentials
+    phone.google_clients.load_credentials = lambda scopes: Credentials('placeholder')
+    phone.google_clients.invalidate()
+    started = time.perf_counter()
+    phone.get_calendar_service()
+    result['calendar_client_ms'] = (time.perf_counter() - started) * 1000
+with open(sys.argv[2], 'w') as f:
+    json.dump(result, f)
+'''
+
+
+def measure(tree, mode, env, workdir):
+    result_path = os.path.join(workdir, 'result.json')
+    output = subprocess.run([sys.executable, '-c', CHILD, mode, result_path], cwd=tree,
+                            env=dict(env, PYTHONPATH=tree), capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"benchmark child failed in {tree}:\n{output.stderr[-2000:]}")
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def summarize(runs):
+    summary = {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+    summary['import_plus_first_answer_ms'] = round(summary['import_ms'] + summary.get('warm_up_ms', 0)
+                                                   + summary['first_voice_ms'] + summary['first_answer_ms'], 1)
+    return summary
+
+
+def extract(ref, workdir):
+    tree = os.path.join(workdir, 'ref')
+    os.makedirs(tree)
+    archive = subprocess.run(['git', 'archive', ref], capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', tree], input=archive, check=True)
+    return tree
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--llm-latency', type=float, default=0.05)
+    parser.add_argument('--warm', action='store_true', help='also measure with warm_up() before the first request')
+    parser.add_argument('--ref', help='earlier commit to measure for comparison')
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_anthropic(latency=args.llm_latency)
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ,
+                   ANTHROPIC_API_KEY='stub-key',
+                   ANTHROPIC_BASE_URL=stub_url,
+                   FAQ_CACHE_ENABLED='0',
+                   BASE_URL='http://127.0.0.1',
+                   OUTBOX_PATH=os.path.join(workdir, 'outbox.db'),
+                   CALL_RECORDS_PATH=os.path.join(workdir, 'call_records.db'),
+                   SHEETS_SPILL_PATH=os.path.join(workdir, 'sheets_spill.jsonl'),
+                   GOOGLE_CREDENTIALS_FILE=os.path.join(workdir, 'no-credentials.json'),
+                   GOOGLE_CREDENTIALS_JSON='')
+        trees = [('working tree', os.getcwd())]
+        if args.ref:
+            trees.insert(0, (args.ref, extract(args.ref, workdir)))
+        modes = ['cold', 'warm'] if args.warm else ['cold']
+        for label, tree in trees:
+            for mode in modes:
+                runs = [measure(tree, mode, env, workdir) for _ in range(args.runs)]
+                if runs[0] is None:
+                    print(f"{label:14s} {mode}: no warm_up() in this tree")
+                    continue
+                summary = summarize(runs)
+                print(f"{label:14s} {mode}: " + ', '.join(f"{key} {value}" for key, value in summary.items()))
+    stub.shutdown()
@@ -0,0 +1,128 @@
+"""Side-by-side load test: waitress (run.py) vs the ASGI app (asgi_app.py).
+
+Both servers are started against a local stub Anthropic API with a fixed
+latency. Simulated calls (greeting plus two questions) are run at increasing
+concurrency, and the highest concurrency each mode sustains with a p99
+request latency under the target is reported.
+
+    python compare_servers.py [--latency 0.5] [--p99 2.0] [--levels 4,8,16,32,64,128,256]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from stub_backends import start_stub_anthropic
+
+QUESTIONS = ["What does your company actually do?", "Do you work with universities as well as schools?"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return float('inf')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def start_server(script, port, stub_url, workdir):
+    env = dict(os.environ,
+               PORT=str(port),
+               BASE_URL=f'http://127.0.0.1:{port}',
+               ANTHROPIC_API_KEY='stub-key',
+               ANTHROPIC_BASE_URL=stub_url,
+               FAQ_CACHE_ENABLED='0',
+               SESSION_BACKEND='memory',
+               OUTBOX_PATH=os.path.join(workdir, f'outbox-{port}.db'),
+               CALL_RECORDS_PATH=os.path.join(workdir, f'call_records-{port}.db'),
+               GOOGLE_CREDENTIALS_FILE=os.path.join(workdir, 'no-credentials.json'),
+               GOOGLE_CREDENTIALS_JSON='',
+               WEB_CONCURRENCY='1')
+    process = subprocess.Popen([sys.executable, script], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{script} did not start on port {port}")
+
+
+async def simulated_call(client, url, call_sid, latencies, errors):
+    form = {'CallSid': call_sid, 'From': '+15550000000'}
+    for path, extra in [('/voice', {})] + [('/process_speech', {'SpeechResult': q}) for q in QUESTIONS]:
+        started = time.monotonic()
+        try:
+            response = await client.post(url + path, data=dict(form, **extra))
+            response.raise_for_status()
+        except httpx.HTTPError:
+            errors.append(path)
+            return
+        latencies.append(time.monotonic() - started)
+
+
+async def run_level(url, concurrency, calls_per_caller):
+    latencies = []
+    errors = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        async def caller(i):
+            for n in range(calls_per_caller):
+                await simulated_call(client, url, f'CA-{concurrency}-{i}-{n}', latencies, errors)
+        started = time.monotonic()
+        await asyncio.gather(*(caller(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return {'concurrency': concurrency, 'requests': len(latencies), 'errors': len(errors), 'rps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99)}
+
+
+def measure(name, script, stub_url, levels, p99_target, calls_per_caller, workdir):
+    port = free_port()
+    process = start_server(script, port, stub_url, workdir)
+    sustained = 0
+    try:
+        for level in levels:
+            result = asyncio.run(run_level(f'http://127.0.0.1:{port}', level, calls_per_caller))
+            ok = result['p99'] <= p99_target and not result['errors']
+            print(f"{name:8s} {level:5d} concurrent  {result['rps']:7.1f} req/s  p50 {result['p50'] * 1000:6.0f} ms  "
+                  f"p99 {result['p99'] * 1000:6.0f} ms  {result['errors']} errors  {'ok' if ok else 'over target'}")
+            if not ok:
+                break
+            sustained = level
+    finally:
+        process.terminate()
+        process.wait()
+    return sustained
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--latency', type=float, default=0.5, help='stub Anthropic latency in seconds')
+    parser.add_argument('--p99', type=float, default=2.0, help='p99 latency target in seconds')
+    parser.add_argument('--levels', default='4,8,16,32,64,128,256')
+    parser.add_argument('--calls', type=int, default=3, help='calls per simulated caller at each level')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',')]
+    stub, stub_url = start_stub_anthropic(latency=args.latency)
+    print(f"Stub Anthropic latency {args.latency * 1000:.0f} ms, p99 target {args.p99 * 1000:.0f} ms\n")
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {name: measure(name, script, stub_url, levels, args.p99, args.calls, workdir)
+                   for name, script in [('waitress', 'run.py'), ('asgi', 'asgi_app.py')]}
+    stub.shutdown()
+    print()
+    for name, sustained in results.items():
+        print(f"{name:8s} sustains {sustained} concurrent calls at p99 <= {args.p99 * 1000:.0f} ms")
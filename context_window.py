@@ -0,0 +1,60 @@
+def estimate_tokens(text):
+    # Roughly four characters per token for English; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+class ContextWindow:
+    """Caps the conversation sent to the model on each turn.
+
+    The last keep_turns turns are sent verbatim. Older turns are folded into
+    a running summary on the conversation, one turn at a time as they leave
+    the window, so earlier turns are never re-processed. If the verbatim turns
+    alone exceed max_tokens, more of them are folded. The summary itself is
+    trimmed from the oldest line to stay under summary_tokens.
+    """
+
+    def __init__(self, max_tokens=1500, keep_turns=6, summary_tokens=300, line_chars=160):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.line_chars = line_chars
+
+    def _summary_line(self, role, text):
+        speaker = 'Caller' if role == 'user' else 'Receptionist'
+        if len(text) > self.line_chars:
+            text = text[:self.line_chars].rsplit(' ', 1)[0] + '...'
+        return f"{speaker}: {text}"
+
+    def fold(self, conversation):
+        """Move turns that fell out of the window into conversation.summary."""
+        turns = conversation.turns
+        keep_from = max(conversation.summarized, len(turns) - self.keep_turns)
+        while keep_from < len(turns) and (
+                turns[keep_from][0] != 'user'
+                or sum(estimate_tokens(text) for _, text in turns[keep_from:]) > self.max_tokens):
+            keep_from += 1
+        if keep_from >= len(turns):
+            # Always send at least the caller's latest turn
+            keep_from = len(turns) - 1
+        if keep_from <= conversation.summarized:
+            return
+        lines = conversation.summary.split('\n') if conversation.summary else []
+        for role, text in turns[conversation.summarized:keep_from]:
+            lines.append(self._summary_line(role, text))
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        conversation.summary = '\n'.join(lines)
+        conversation.summarized = keep_from
+
+    def messages(self, conversation):
+        """Returns (verbatim messages, token report) for the next model call."""
+        window = conversation.turns[conversation.summarized:]
+        messages = [{"role": role, "content": text} for role, text in window]
+        history_tokens = sum(estimate_tokens(text) for _, text in window)
+        report = {
+            'turns': len(conversation.turns),
+            'verbatim_turns': len(window),
+            'history_tokens': history_tokens,
+            'summary_tokens': estimate_tokens(conversation.summary) if conversation.summary else 0,
+        }
+        return messages, report
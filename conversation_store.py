@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ConversationStore:
+    """Bounded map of CallSid -> ConversationManager.
+
+    Entries are kept in least-recently-used order and evicted when they have
+    been idle longer than idle_ttl, when there are more than max_entries, or
+    when their combined approximate size passes max_bytes. Evicted sessions
+    are passed to the finalizer (if any) and kept read-only for finished_ttl
+    seconds so late callbacks such as transcriptions can still find them.
+    """
+
+    def __init__(self, idle_ttl=1800, max_entries=5000, max_bytes=64 * 1024 * 1024,
+                 finished_ttl=900, max_finished=1000, finalizer=None):
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.finished_ttl = finished_ttl
+        self.max_finished = max_finished
+        self.finalizer = finalizer
+        self._live = OrderedDict()
+        self._finished = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.counters = {'created': 0, 'evicted_idle': 0, 'evicted_size': 0}
+
+    def __contains__(self, call_sid):
+        with self._lock:
+            self._prune()
+            return call_sid in self._live
+
+    def __getitem__(self, call_sid):
+        with self._lock:
+            entry = self._live[call_sid]
+            self._touch(call_sid, entry)
+            return entry[0]
+
+    def __setitem__(self, call_sid, conversation):
+        with self._lock:
+            old = self._live.pop(call_sid, None)
+            if old:
+                self._bytes -= old[2]
+            else:
+                self.counters['created'] += 1
+            size = conversation.approx_size()
+            self._live[call_sid] = [conversation, time.monotonic(), size]
+            self._bytes += size
+            self._prune()
+
+    def __len__(self):
+        return len(self._live)
+
+    def _touch(self, call_sid, entry):
+        self._live.move_to_end(call_sid)
+        entry[1] = time.monotonic()
+        size = entry[0].approx_size()
+        self._bytes += size - entry[2]
+        entry[2] = size
+
+    def get(self, call_sid, default=None):
+        """Live conversation, or a recently finished one, or default."""
+        with self._lock:
+            if call_sid in self._live:
+                return self[call_sid]
+            self._prune()
+            finished = self._finished.get(call_sid)
+            return finished[0] if finished else default
+
+    def get_or_create(self, call_sid, factory):
+        with self._lock:
+            if call_sid in self._live:
+                return self[call_sid]
+            # A call that was evicted mid-conversation picks up where it left off
+            finished = self._finished.pop(call_sid, None)
+            conversation = finished[0] if finished else factory()
+            self[call_sid] = conversation
+            return conversation
+
+    def updated(self, call_sid):
+        """Re-measure a conversation after it has grown."""
+        with self._lock:
+            entry = self._live.get(call_sid)
+            if entry:
+                self._touch(call_sid, entry)
+                self._prune()
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._live:
+            call_sid, entry = next(iter(self._live.items()))
+            if now - entry[1] > self.idle_ttl:
+                self._evict(call_sid, 'evicted_idle')
+            elif len(self._live) > self.max_entries or self._bytes > self.max_bytes:
+                self._evict(call_sid, 'evicted_size')
+            else:
+                break
+        while self._finished:
+            call_sid, finished = next(iter(self._finished.items()))
+            if now - finished[1] > self.finished_ttl or len(self._finished) > self.max_finished:
+                del self._finished[call_sid]
+            else:
+                break
+
+    def _evict(self, call_sid, reason):
+        conversation, _, size = self._live.pop(call_sid)
+        self._bytes -= size
+        self.counters[reason] += 1
+        self._finished[call_sid] = (conversation, time.monotonic())
+        if self.finalizer:
+            try:
+                self.finalizer(call_sid, conversation)
+            except Exception as e:
+                print(f"Conversation finalizer error: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats.update({'live': len(self._live), 'finished': len(self._finished), 'approx_bytes': self._bytes})
+        return stats
@@ -0,0 +1,123 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at for with by from about as is are was were be been am do does did
+i me my we our you your it its this that there what which who how can could would will should please
+hi hello hey yes no ok okay um uh just like so also any some tell know want wanted wondering
+""".split())
+
+
+def normalize(text):
+    text = re.sub(r"[^a-z0-9\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def features(normalized):
+    words = frozenset(w for w in normalized.split() if w not in STOPWORDS)
+    padded = " " + normalized + " "
+    trigrams = frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+    return words, trigrams
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class FAQCache:
+    """Local answer cache for repeat questions, consulted before the LLM.
+
+    Questions are normalized and indexed by content words; a lookup scores
+    candidates that share at least one word using word and character-trigram
+    Jaccard similarity. Only matches at or above the confidence threshold are
+    served. Entries are evicted least-recently-used, and the whole cache is
+    dropped when the knowledge text it was approved against changes.
+    """
+
+    def __init__(self, threshold=0.6, max_entries=500):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._index = {}
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self.counters = {'lookups': 0, 'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def load(self, knowledge, approved):
+        """Invalidate if the knowledge text changed, then add approved (questions, answer) pairs."""
+        fingerprint = hashlib.sha256(knowledge.encode()).hexdigest()
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                if self._fingerprint is not None:
+                    self.counters['invalidations'] += 1
+                self._entries.clear()
+                self._index.clear()
+                self._fingerprint = fingerprint
+        for questions, answer in approved:
+            for question in questions:
+                self.approve(question, answer)
+
+    def approve(self, question, answer):
+        key = normalize(question)
+        words, trigrams = features(key)
+        if not words:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (answer, words, trigrams)
+            for word in words:
+                self._index.setdefault(word, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def _remove(self, key):
+        _, words, _ = self._entries.pop(key)
+        for word in words:
+            keys = self._index.get(word)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._index[word]
+
+    def lookup(self, question, threshold=None, all_terms=False):
+        """Return (answer, confidence) for a match at or above threshold, else None.
+
+        With all_terms, only entries whose content words all appear in the question can match.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        key = normalize(question)
+        words, trigrams = features(key)
+        with self._lock:
+            self.counters['lookups'] += 1
+            best_key, best_score = None, 0.0
+            if key in self._entries:
+                best_key, best_score = key, 1.0
+            else:
+                candidates = set()
+                for word in words:
+                    candidates |= self._index.get(word, set())
+                for candidate in candidates:
+                    _, c_words, c_trigrams = self._entries[candidate]
+                    if all_terms and not c_words <= words:
+                        continue
+                    score = 0.5 * jaccard(words, c_words) + 0.5 * jaccard(trigrams, c_trigrams)
+                    if score > best_score:
+                        best_key, best_score = candidate, score
+            if best_key is None or best_score < threshold:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.counters['hits'] += 1
+            return self._entries[best_key][0], best_score
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+        return stats
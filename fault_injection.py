@@ -0,0 +1,213 @@
+"""Fault injection: circuit breakers and bulkheads against failing and slow stand-ins.
+
+Anthropic and SMTP are the local stub servers; Calendar and Sheets are the
+in-process stand-ins. Each scenario breaks one of them and checks that the
+breaker opens after BREAKER_FAILURES failures, that calls then fail fast
+instead of waiting on the dependency, that the webhook still answers (with
+the fallback), and that a trial call closes the breaker once the dependency
+recovers. The last scenario makes Calendar slow and sends escalations and
+ordinary questions to the app under waitress at the same time, with and
+without the Calendar bulkhead, to show the slow dependency can't take every
+worker thread. Exits non-zero if any check fails.
+
+    python fault_injection.py [--failures 3] [--reset 1] [--threads 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from compare_servers import percentile
+from stub_backends import install_google_stubs, start_stub_anthropic, start_stub_smtp
+
+results = []
+
+
+def check(description, passed, detail=''):
+    results.append(passed)
+    print(f"  {'PASS' if passed else 'FAIL'}  {description}" + (f" ({detail})" if detail else ''))
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args), time.perf_counter() - started
+    except Exception as e:
+        return e, time.perf_counter() - started
+
+
+def ask(client, n, question="Do you set up Moodle for schools?"):
+    # A new call each time, so no turn escalates
+    return client.post('/process_speech', data={'CallSid': f'CA-fault-{n}', 'From': '+15550000000',
+                                                 'SpeechResult': question}).get_data(as_text=True)
+
+
+def wait_for_reset(dependency):
+    time.sleep(dependency.reset_timeout + 0.1)
+
+
+def anthropic_errors(phone, stub, client, args):
+    print("Anthropic returns 500s")
+    dependency = phone.anthropic_dependency
+    stub.status = 500
+    for n in range(args.failures):
+        ask(client, n)
+    check("breaker opens after the failures", dependency.state == 'open', dependency.last_error)
+    rejected = dependency.counters['rejected_open']
+    body, seconds = timed(ask, client, 100)
+    check("open breaker answers with the fallback without calling the API",
+          dependency.counters['rejected_open'] > rejected and '<Say' in body, f"{seconds * 1000:.0f} ms")
+    stub.status = 200
+    wait_for_reset(dependency)
+    ask(client, 101)
+    check("trial call after the reset closes the breaker", dependency.state == 'closed')
+
+
+def anthropic_slow(phone, stub, client, args):
+    print(f"Anthropic slower than the {phone.LLM_TURN_BUDGET:g}s turn budget")
+    dependency = phone.anthropic_dependency
+    stub.latency = phone.LLM_TURN_BUDGET + 1
+    slow = [timed(ask, client, 200 + n)[1] for n in range(args.failures)]
+    # The abandoned requests time out on their own threads just after the turn gives up
+    time.sleep(0.5)
+    check("breaker opens after the timeouts", dependency.state == 'open', dependency.last_error)
+    _, fast = timed(ask, client, 300)
+    check("turns stop waiting for the budget once it is open", fast < 0.1,
+          f"{max(slow) * 1000:.0f} ms -> {fast * 1000:.0f} ms")
+    stub.latency = args.llm_latency
+    wait_for_reset(dependency)
+    ask(client, 301)
+    check("recovers once the API is fast again", dependency.state == 'closed')
+
+
+def smtp_down(phone, smtp_stub, args):
+    print("SMTP refuses connections")
+    dependency = phone.smtp_dependency
+    phone.smtp_pool.close()
+    smtp_stub.refuse = True
+    for _ in range(args.failures):
+        timed(phone.deliver_email, "fault injection", "body")
+    check("breaker opens after the failed sends", dependency.state == 'open', dependency.last_error)
+    error, seconds = timed(phone.deliver_email, "fault injection", "body")
+    check("sends fail fast with DependencyUnavailable, so the outbox retries later",
+          type(error).__name__ == 'DependencyUnavailable' and seconds < 0.05, f"{seconds * 1000:.1f} ms")
+    smtp_stub.refuse = False
+    wait_for_reset(dependency)
+    error, _ = timed(phone.deliver_email, "fault injection", "body")
+    check("trial send after the reset goes through and closes the breaker",
+          error is None and dependency.state == 'closed')
+
+
+def sheets_down(phone, sheets, args):
+    print("Sheets append fails")
+    dependency = phone.sheets_dependency
+    sink = phone.sheets_sink
+    sheets.sheet1.error = RuntimeError("stub sheets outage")
+    rows_before = len(sheets.sheet1.rows)
+    for n in range(args.failures):
+        phone.log_to_sheets('+15550000000', 'Fault injection', f'row {n}')
+        sink.flush()
+    check("breaker opens after the failed flushes", dependency.state == 'open', dependency.last_error)
+    phone.log_to_sheets('+15550000000', 'Fault injection', 'row while open')
+    calls = dependency.counters['calls']
+    written, seconds = timed(sink.flush)
+    check("flushes are skipped while it is open, keeping the rows",
+          written == 0 and dependency.counters['calls'] == calls and sink.stats()['buffered'] == 1,
+          f"{seconds * 1000:.1f} ms")
+    sheets.sheet1.error = None
+    wait_for_reset(dependency)
+    sink.flush()
+    written = len(sheets.sheet1.rows) - rows_before
+    check("every row is written once Sheets recovers", written >= args.failures + 1 and
+          dependency.state == 'closed', f"{written} rows")
+
+
+def calendar_slow(phone, calendar, args, bounded):
+    """Escalations stuck on a slow Calendar alongside ordinary questions, under waitress."""
+    from waitress import create_server
+    from resilience import Dependency
+    max_concurrent = 4 if bounded else 1000
+    dependency = Dependency('calendar', timeout=10, max_concurrent=max_concurrent, max_wait=phone.BULKHEAD_WAIT,
+                            failure_threshold=phone.BREAKER_FAILURES, reset_timeout=phone.BREAKER_RESET)
+    phone.calendar_dependency = phone.calendar_cache.dependency = dependency
+    calendar.latency = args.calendar_latency
+    server = create_server(phone.app, host='127.0.0.1', port=0, threads=args.threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    url = f"http://127.0.0.1:{server.effective_port}"
+
+    def post(call_sid, question):
+        started = time.perf_counter()
+        httpx.post(url + '/process_speech', data={'CallSid': call_sid, 'From': '+15550000000',
+                                                  'SpeechResult': question}, timeout=60)
+        return time.perf_counter() - started
+
+    tag = 'bounded' if bounded else 'unbounded'
+    with ThreadPoolExecutor(max_workers=args.threads * 3) as pool:
+        escalations = [pool.submit(post, f'CA-{tag}-book-{n}', "I want to speak to a person to schedule")
+                       for n in range(args.threads + 2)]
+        time.sleep(0.2)
+        questions = [pool.submit(post, f'CA-{tag}-ask-{n}', "What services do you offer?") for n in range(args.threads)]
+        question_times = [future.result() for future in questions]
+        escalation_times = [future.result() for future in escalations]
+    server.close()
+    calendar.latency = 0.05
+    return question_times, escalation_times, dependency.counters['rejected_full']
+
+
+def run(args):
+    import ai_phone_answering_system as phone
+    anthropic_stub, smtp_stub = args.stubs
+    calendar, sheets = install_google_stubs(phone.google_clients, calendar_latency=0.05, sheets_latency=0.05)
+    client = phone.app.test_client()
+
+    anthropic_errors(phone, anthropic_stub, client, args)
+    anthropic_slow(phone, anthropic_stub, client, args)
+    smtp_down(phone, smtp_stub, args)
+    sheets_down(phone, sheets, args)
+
+    print(f"Calendar takes {args.calendar_latency:g}s: {args.threads + 2} escalations and {args.threads} questions "
+          f"on {args.threads} waitress threads")
+    unbounded, _, _ = calendar_slow(phone, calendar, args, bounded=False)
+    bounded, escalations, rejected = calendar_slow(phone, calendar, args, bounded=True)
+    for label, times in (('without bulkhead', unbounded), ('with bulkhead', bounded)):
+        print(f"    {label:17s} question p50 {percentile(times, 50) * 1000:6.0f} ms   max {max(times) * 1000:6.0f} ms")
+    # Rejected escalations still hold their thread for up to BULKHEAD_WAIT, so questions don't get the
+    # stub's bare latency, but they no longer queue behind every Calendar call
+    check("questions aren't held up behind the slow Calendar calls",
+          max(bounded) < percentile(unbounded, 50) / 2,
+          f"{rejected} Calendar calls rejected, slowest escalation {max(escalations) * 1000:.0f} ms")
+    print(f"Dependency state: {phone.status_report()['dependencies']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--failures', type=int, default=3, help='BREAKER_FAILURES for the run')
+    parser.add_argument('--reset', type=float, default=1.0, help='BREAKER_RESET for the run')
+    parser.add_argument('--threads', type=int, default=8, help='waitress threads in the Calendar scenario')
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--calendar-latency', type=float, default=1.0)
+    args = parser.parse_args()
+
+    anthropic_stub, anthropic_url = start_stub_anthropic(latency=args.llm_latency)
+    smtp_stub, smtp_port = start_stub_smtp(latency=0)
+    args.stubs = anthropic_stub, smtp_stub
+    workdir = tempfile.mkdtemp()
+    os.environ.update(ANTHROPIC_API_KEY='stub-key', ANTHROPIC_BASE_URL=anthropic_url, FAQ_CACHE_ENABLED='0',
+                      WARM_UP='0', SESSION_BACKEND='memory', SLOT_LEASE_DB='', INTENT_ROUTING='1',
+                      SMTP_HOST='127.0.0.1', SMTP_PORT=str(smtp_port), SMTP_STARTTLS='0',
+                      GMAIL_ADDRESS='faults@example.com', GMAIL_APP_PASSWORD='stub',
+                      NOTIFICATION_EMAIL='team@example.com', LLM_TURN_BUDGET='1', CALENDAR_SYNC_INTERVAL='0',
+                      SHEETS_FLUSH_INTERVAL='3600', BREAKER_FAILURES=str(args.failures),
+                      BREAKER_RESET=str(args.reset), OUTBOX_PATH=os.path.join(workdir, 'outbox.db'),
+                      SHEETS_SPILL_PATH=os.path.join(workdir, 'sheets_spill.jsonl'),
+                      CALL_RECORDS_PATH=os.path.join(workdir, 'call_records.db'),
+                      KNOWLEDGE_INDEX_PATH=os.path.join(workdir, 'knowledge_index.json'))
+    run(args)
+    failed = results.count(False)
+    print(f"{len(results) - failed}/{len(results)} checks passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,125 @@
+import os
+import threading
+from datetime import datetime, timezone
+
+
+class GoogleClientRegistry:
+    """Process-wide cache of Google API clients.
+
+    Credentials are loaded once per scope set and shared, so every client reuses
+    the same OAuth token until it is close to expiring; a background thread
+    refreshes it ahead of time. Client objects themselves (gspread sessions,
+    httplib2-backed discovery services) are not thread-safe, so each thread gets
+    its own instance, built once and reused for the life of the thread.
+    """
+
+    def __init__(self, load_credentials, refresh_margin=300):
+        self.load_credentials = load_credentials
+        self.refresh_margin = refresh_margin
+        self._specs = {}
+        self._credentials = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self._refresher = None
+        self._refresher_pid = None
+        self._wakeup = threading.Event()
+        self.counters = {'credential_loads': 0, 'builds': 0, 'hits': 0, 'refreshes': 0, 'refresh_errors': 0}
+
+    def register(self, name, scopes, factory):
+        """Register a client: factory(credentials) builds it for the given scopes."""
+        self._specs[name] = (tuple(scopes), factory)
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def credentials(self, scopes):
+        scopes = tuple(scopes)
+        with self._lock:
+            creds = self._credentials.get(scopes)
+            if creds is None:
+                creds = self.load_credentials(list(scopes))
+                self._credentials[scopes] = creds
+                self.counters['credential_loads'] += 1
+        self._ensure_refresher()
+        return creds
+
+    def get(self, name):
+        """Return this thread's client for name, building it on first use."""
+        clients = getattr(self._local, 'clients', None)
+        if clients is None or getattr(self._local, 'generation', None) != self._generation:
+            clients = self._local.clients = {}
+            self._local.generation = self._generation
+        client = clients.get(name)
+        if client is not None:
+            self._count('hits')
+            return client
+        scopes, factory = self._specs[name]
+        client = factory(self.credentials(scopes))
+        clients[name] = client
+        self._count('builds')
+        return client
+
+    def token(self, scopes):
+        """A current access token for scopes, for callers making their own HTTP requests."""
+        creds = self.credentials(scopes)
+        if self._seconds_left(creds) <= 0:
+            self.refresh(creds)
+        return creds.token
+
+    def invalidate(self):
+        """Drop cached credentials and clients, e.g. after a key rotation."""
+        with self._lock:
+            self._credentials.clear()
+            self._generation += 1
+
+    def refresh(self, creds):
+        from google.auth.transport.requests import Request
+        with self._refresh_lock:
+            try:
+                creds.refresh(Request())
+                self._count('refreshes')
+            except Exception as e:
+                self._count('refresh_errors')
+                print(f"Google credential refresh error: {e}")
+
+    def _seconds_left(self, creds):
+        if not creds.token or not creds.expiry:
+            return 0
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (creds.expiry - now).total_seconds()
+
+    def _ensure_refresher(self):
+        if self._refresher_pid == os.getpid() and self._refresher and self._refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid() and self._refresher and self._refresher.is_alive():
+                return
+            self._refresher_pid = os.getpid()
+            self._refresher = threading.Thread(target=self._refresh_loop, name='google-token-refresh', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            with self._lock:
+                creds_list = list(self._credentials.values())
+            sleep_for = 600
+            for creds in creds_list:
+                if self._seconds_left(creds) <= self.refresh_margin:
+                    self.refresh(creds)
+                left = self._seconds_left(creds)
+                if left > 0:
+                    sleep_for = min(sleep_for, max(30, left - self.refresh_margin))
+                else:
+                    # Refresh failed; try again shortly
+                    sleep_for = min(sleep_for, 30)
+            self._wakeup.wait(sleep_for)
+            self._wakeup.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['credential_sets'] = len(self._credentials)
+        return stats
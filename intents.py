@@ -0,0 +1,55 @@
+import json
+import re
+
+DEFAULT_VOCABULARY = {
+    # Any of these in the escalating turn books a slot
+    'scheduling': ['appointment', 'schedule', 'scheduling', 'meeting', 'reschedule', 'rescheduling', 'book',
+                   'available', 'availability', 'consultation', 'consult', 'discovery call', 'speak with',
+                   'talk to'],
+    # Only these, said in an earlier turn, make a later escalation book one
+    'explicit_booking': ['appointment', 'schedule', 'scheduling', 'reschedule', 'rescheduling', 'consultation',
+                         'discovery call'],
+    'human_handoff': ['speak with someone', 'speak to someone', 'talk to someone', 'talk with someone',
+                      'speak with a person', 'speak to a person', 'talk to a person', 'talk with a person',
+                      'speak to a human', 'talk to a human', 'real person', 'speak to a representative',
+                      'speak with a representative', 'talk to a representative', 'call me back', 'callback'],
+    'pricing': ['price', 'pricing', 'cost', 'how much', 'fee', 'rate', 'charge', 'retainer', 'budget', 'quote'],
+    # Tutoring and test prep for an individual (a GED or ESL program is still a
+    # client, and so is a parent calling about their child's school)
+    'out_of_scope': ['tutor', 'tutoring', 'homework', 'ged prep', 'ged class', 'get my ged', 'esl class',
+                     'esl lessons', 'sat prep', 'test prep'],
+}
+
+
+class IntentMatcher:
+    """Classifies an utterance against every intent vocabulary in one regex pass.
+
+    All phrases are compiled into a single word-bounded alternation (longest
+    phrase first); each match is mapped back to the intents that listed it.
+    A phrase also matches with a plural or past-tense ending on its last word
+    ("consultations", "booked", "discovery calls").
+    """
+
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+        self._intents_for = {}
+        for intent, phrases in vocabulary.items():
+            for phrase in phrases:
+                self._intents_for.setdefault(phrase.lower(), set()).add(intent)
+        alternation = '|'.join(re.escape(p) for p in sorted(self._intents_for, key=len, reverse=True))
+        self._pattern = re.compile(r'\b(' + alternation + r')(?:s|es|d|ed|ing)?\b', re.IGNORECASE)
+
+    def classify(self, text):
+        intents = set()
+        for match in self._pattern.finditer(text):
+            intents |= self._intents_for[match.group(1).lower()]
+        return intents
+
+
+def load_vocabulary(path=None):
+    """DEFAULT_VOCABULARY, with intents overridden or added from a JSON file if given."""
+    vocabulary = {intent: list(phrases) for intent, phrases in DEFAULT_VOCABULARY.items()}
+    if path:
+        with open(path) as f:
+            vocabulary.update(json.load(f))
+    return vocabulary
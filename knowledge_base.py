@@ -0,0 +1,247 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from faq_cache import STOPWORDS, normalize
+
+DOCUMENT_EXTENSIONS = ('.md', '.txt')
+INDEX_FORMAT = 2
+# Crude suffix stripping, enough for 'located'/'location' or 'prices'/'pricing' to meet
+SUFFIXES = ('ations', 'ation', 'ions', 'ion', 'ings', 'ing', 'ed', 'es', 's', 'e')
+
+
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= (3 if suffix == 's' else 4):
+            return word if word.endswith('ss') else word[:-len(suffix)]
+    return word
+
+
+def terms(text):
+    """Stemmed content words of text."""
+    return [stem(word) for word in normalize(text).split() if word not in STOPWORDS]
+
+
+def split_sections(text):
+    """(heading, body) pairs, split on markdown headings; nested headings are joined with ' > '."""
+    sections = []
+    path = []
+    body = []
+
+    def close():
+        content = '\n'.join(body).strip()
+        if content:
+            sections.append((' > '.join(path), content))
+        body.clear()
+
+    for line in text.splitlines():
+        match = re.match(r'^(#{1,6})\s+(.*)$', line)
+        if match:
+            close()
+            depth = len(match.group(1))
+            path[depth - 1:] = [match.group(2).strip()]
+        else:
+            body.append(line)
+    close()
+    return sections
+
+
+def chunk_document(text, max_words=120):
+    """Chunks of at most about max_words, never splitting a paragraph, each labelled with its heading."""
+    chunks = []
+    for heading, body in split_sections(text):
+        current = []
+        size = 0
+        for paragraph in re.split(r'\n\s*\n', body):
+            words = len(paragraph.split())
+            if current and size + words > max_words:
+                chunks.append((heading, '\n\n'.join(current)))
+                current, size = [], 0
+            current.append(paragraph.strip())
+            size += words
+        if current:
+            chunks.append((heading, '\n\n'.join(current)))
+    return chunks
+
+
+class KnowledgeBase:
+    """BM25 search over the business documents in a directory.
+
+    Markdown and text files are split into chunks at headings and paragraph
+    breaks, and each chunk is indexed by its content words (heading included).
+    The chunks and their term counts are saved to index_path with each file's
+    size, mtime and hash, so a restart only re-reads files that changed, and
+    refresh_if_due() rescans the directory at most every check_interval
+    seconds to pick up edits, additions and deletions the same way. version
+    changes whenever the indexed content does.
+    """
+
+    def __init__(self, directory, index_path='knowledge_index.json', chunk_words=120, check_interval=30.0,
+                 k1=1.5, b=0.75):
+        self.directory = directory
+        self.index_path = index_path
+        self.chunk_words = chunk_words
+        self.check_interval = check_interval
+        self.k1 = k1
+        self.b = b
+        self._files = {}
+        self._chunks = []
+        self._df = {}
+        self._avg_length = 0.0
+        self.version = ''
+        self._last_check = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.counters = {'loads': 0, 'files_indexed': 0, 'files_reused': 0, 'files_removed': 0,
+                         'searches': 0, 'empty_results': 0}
+        self._load_index()
+        self.refresh()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get('format') == INDEX_FORMAT and saved.get('chunk_words') == self.chunk_words:
+            self._files = saved['files']
+            self.counters['loads'] += 1
+
+    def _save_index(self):
+        tmp = self.index_path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'format': INDEX_FORMAT, 'chunk_words': self.chunk_words, 'files': self._files}, f)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            print(f"Knowledge index not saved: {e}")
+
+    def _scan(self):
+        found = {}
+        for root, _, names in os.walk(self.directory):
+            for name in sorted(names):
+                if name.endswith(DOCUMENT_EXTENSIONS) and not name.startswith('.'):
+                    path = os.path.join(root, name)
+                    found[os.path.relpath(path, self.directory)] = path
+        return found
+
+    def refresh(self):
+        """Re-index files that were added, changed or removed. Returns True if anything changed."""
+        with self._refresh_lock:
+            self._last_check = time.monotonic()
+            files = {}
+            changed = False
+            for name, path in self._scan().items():
+                try:
+                    stat = os.stat(path)
+                    known = self._files.get(name)
+                    if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+                        files[name] = known
+                        self.counters['files_reused'] += 1
+                        continue
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError as e:
+                    print(f"Knowledge file {name} skipped: {e}")
+                    continue
+                digest = hashlib.sha256(data).hexdigest()
+                if known and known['sha256'] == digest:
+                    # Touched but not edited: keep the chunks, remember the new mtime
+                    files[name] = dict(known, mtime=stat.st_mtime)
+                    changed = True
+                    continue
+                title = os.path.splitext(name)[0].replace('-', ' ')
+                chunks = []
+                for heading, body in chunk_document(data.decode('utf-8', errors='replace'), self.chunk_words):
+                    counts = Counter(terms(heading + '\n' + body))
+                    chunks.append({'heading': heading or title, 'text': body, 'terms': counts,
+                                   'length': sum(counts.values())})
+                files[name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest, 'chunks': chunks}
+                self.counters['files_indexed'] += 1
+                changed = True
+            removed = set(self._files) - set(files)
+            self.counters['files_removed'] += len(removed)
+            if changed or removed or not self.version:
+                self._build(files)
+            if changed or removed:
+                self._save_index()
+            return bool(changed or removed)
+
+    def _build(self, files):
+        chunks = []
+        df = Counter()
+        for name in sorted(files):
+            for chunk in files[name]['chunks']:
+                chunks.append(dict(chunk, source=name))
+                df.update(chunk['terms'].keys())
+        avg_length = sum(chunk['length'] for chunk in chunks) / len(chunks) if chunks else 0.0
+        version = hashlib.sha256(''.join(name + files[name]['sha256'] for name in sorted(files)).encode()).hexdigest()
+        with self._lock:
+            self._files = files
+            self._chunks = chunks
+            self._df = dict(df)
+            self._avg_length = avg_length
+            self.version = version
+
+    def refresh_if_due(self):
+        if self._last_check is None or time.monotonic() - self._last_check >= self.check_interval:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Knowledge refresh error: {e}")
+
+    def search(self, query, k=4, skip=0):
+        """The k best chunks for query as dicts (source, heading, text, score), best first.
+
+        The first skip chunks in document order (already in the prompt) are left out.
+        """
+        query_terms = set(terms(query))
+        with self._lock:
+            chunks, df, avg_length = self._chunks, self._df, self._avg_length
+            self.counters['searches'] += 1
+        total = len(chunks)
+        scored = []
+        for chunk in chunks[skip:]:
+            score = 0.0
+            for term in query_terms:
+                tf = chunk['terms'].get(term)
+                if not tf:
+                    continue
+                idf = math.log(1 + (total - df[term] + 0.5) / (df[term] + 0.5))
+                norm = 1 - self.b + self.b * chunk['length'] / avg_length
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+            if score > 0:
+                scored.append((score, chunk))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        if not scored:
+            with self._lock:
+                self.counters['empty_results'] += 1
+        return [{'source': chunk['source'], 'heading': chunk['heading'], 'text': chunk['text'],
+                 'score': round(score, 3)} for score, chunk in scored[:k]]
+
+    def full_text(self):
+        """Every chunk, in document order, for prompts that include the whole knowledge base."""
+        return format_chunks(self.chunks())
+
+    def chunks(self):
+        """Every chunk as a dict (source, heading, text), in document order."""
+        with self._lock:
+            chunks = self._chunks
+        return [{'source': chunk['source'], 'heading': chunk['heading'], 'text': chunk['text']} for chunk in chunks]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['files'] = len(self._files)
+            stats['chunks'] = len(self._chunks)
+            stats['terms'] = len(self._df)
+        return stats
+
+
+def format_chunks(chunks):
+    return '\n\n'.join(f"{chunk['heading'].upper()}:\n{chunk['text']}" for chunk in chunks)
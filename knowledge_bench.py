@@ -0,0 +1,116 @@
+"""Knowledge benchmark: the whole knowledge base in every prompt vs the top-k chunks.
+
+For a set of typical caller questions, each turn's Messages API request is
+built both ways and sent. Against the local stub (the default), prompt
+tokens are estimated from the request text and every thousand of them adds
+--prefill-ms to the stub's latency, standing in for the model's prefill
+time. With --live the real API is used: tokens come from
+messages.count_tokens and latency from messages.create. Prompt caching is
+not counted, so the full-prompt figures are for an uncached prefix.
+--extra-docs adds that many generated policy documents to a copy of the
+knowledge directory, to see how each approach grows with the content.
+
+    python knowledge_bench.py [--top-k 4] [--rounds 3] [--prefill-ms 40] [--extra-docs 20] [--live]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from compare_servers import percentile
+from context_window import estimate_tokens
+from stub_backends import prompt_text, start_stub_anthropic
+
+QUESTIONS = [
+    "What services do you offer?",
+    "How much do you charge for curriculum consulting?",
+    "Do you set up Moodle or Canvas for schools?",
+    "Where are you located? Can you come to our campus in Orlando?",
+    "Are you open on Saturdays?",
+    "Can you help us get ready for an accreditation review?",
+    "Is the first consultation free?",
+    "What happens if we need to cancel a session?",
+    "Do you work with corporate training departments?",
+    "Can you tutor my son for his GED?",
+]
+
+FILLER = ("policy", "procedure", "review", "documentation", "training", "staff", "records", "audit", "deadline",
+          "onboarding", "assessment", "outcomes", "reporting", "renewal", "standards", "evidence", "portfolio")
+
+
+def add_generated_documents(directory, count):
+    rng = random.Random(0)
+    for n in range(count):
+        sections = []
+        for s in range(4):
+            sentences = [' '.join(rng.choice(FILLER) for _ in range(12)).capitalize() + '.' for _ in range(5)]
+            sections.append(f"## Section {s + 1}\n" + ' '.join(sentences))
+        with open(os.path.join(directory, f'policy-{n:03d}.md'), 'w') as f:
+            f.write(f"# Policy document {n + 1}\n\n" + '\n\n'.join(sections) + '\n')
+
+
+def run(args):
+    import ai_phone_answering_system as phone
+    agents = {
+        'full prompt': phone.AIAgent(phone.BUSINESS_KNOWLEDGE, phone.llm_budget,
+                                     knowledge_base=phone.knowledge_base, top_k=0),
+        f'top-{args.top_k}': phone.AIAgent(phone.BUSINESS_KNOWLEDGE, phone.llm_budget,
+                                           knowledge_base=phone.knowledge_base, top_k=args.top_k),
+    }
+    client = phone.get_anthropic_client()
+    results = {}
+    for label, agent in agents.items():
+        tokens, latencies, build_ms = [], [], []
+        for _ in range(args.rounds):
+            for question in QUESTIONS:
+                started = time.perf_counter()
+                params = agent.message_params(question)
+                build_ms.append((time.perf_counter() - started) * 1000)
+                if args.live:
+                    tokens.append(client.messages.count_tokens(model=params['model'], system=params['system'],
+                                                               messages=params['messages']).input_tokens)
+                else:
+                    tokens.append(estimate_tokens(prompt_text(params)))
+                started = time.perf_counter()
+                agent.create_message(params, None)
+                latencies.append(time.perf_counter() - started)
+        results[label] = {'prompt_tokens': statistics.mean(tokens), 'build_ms': statistics.mean(build_ms),
+                          'p50_ms': percentile(latencies, 50) * 1000, 'p95_ms': percentile(latencies, 95) * 1000}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--top-k', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.3, help='stub latency per call, before prefill')
+    parser.add_argument('--prefill-ms', type=float, default=40, help='stub latency per thousand prompt tokens')
+    parser.add_argument('--extra-docs', type=int, default=0, help='generated documents to add to the knowledge base')
+    parser.add_argument('--live', action='store_true', help='use the real Anthropic API (ANTHROPIC_API_KEY)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    knowledge_dir = os.path.join(workdir, 'knowledge')
+    shutil.copytree(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledge'), knowledge_dir)
+    add_generated_documents(knowledge_dir, args.extra_docs)
+    os.environ.update(FAQ_CACHE_ENABLED='0', KNOWLEDGE_DIR=knowledge_dir, WARM_UP='0',
+                      KNOWLEDGE_INDEX_PATH=os.path.join(workdir, 'knowledge_index.json'),
+                      OUTBOX_PATH=os.path.join(workdir, 'outbox.db'),
+                      CALL_RECORDS_PATH=os.path.join(workdir, 'call_records.db'))
+    if not args.live:
+        stub, stub_url = start_stub_anthropic(latency=args.latency, prefill_latency=args.prefill_ms / 1000)
+        os.environ.update(ANTHROPIC_API_KEY='stub-key', ANTHROPIC_BASE_URL=stub_url)
+
+    results = run(args)
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(f"{len(QUESTIONS)} questions x {args.rounds} rounds, {args.extra_docs} extra documents, "
+          + ("live API" if args.live else f"stub at {args.latency * 1000:.0f} ms + {args.prefill_ms:g} ms per 1k tokens"))
+    print(f"  {'prompt':12s} {'tokens':>8s} {'build ms':>9s} {'p50 ms':>8s} {'p95 ms':>8s}")
+    for label, row in results.items():
+        print(f"  {label:12s} {row['prompt_tokens']:8.0f} {row['build_ms']:9.2f} {row['p50_ms']:8.1f} {row['p95_ms']:8.1f}")
+    full, retrieval = results.values()
+    print(f"  prompt tokens {(retrieval['prompt_tokens'] - full['prompt_tokens']) / full['prompt_tokens'] * 100:+.0f}%, "
+          f"p50 latency {(retrieval['p50_ms'] - full['p50_ms']) / full['p50_ms'] * 100:+.0f}%")
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class LatencyBudget:
+    """Runs a call under a per-turn deadline, optionally hedging it.
+
+    If the first attempt hasn't finished after hedge_after seconds a second,
+    identical attempt is started and whichever returns first wins. Attempts
+    still running when the budget expires are abandoned (their results are
+    discarded), so the caller always gets an answer back within the budget.
+    """
+
+    OUTCOMES = ('fast', 'hedged', 'timeout', 'error')
+
+    def __init__(self, budget, hedge_after=None, max_workers=16, name='llm'):
+        self.budget = budget
+        self.hedge_after = hedge_after if hedge_after and hedge_after < budget else None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{name}-budget')
+        self._lock = threading.Lock()
+        self.counters = {outcome: {'count': 0, 'total_ms': 0, 'max_ms': 0} for outcome in self.OUTCOMES}
+        self.counters['hedges_sent'] = 0
+
+    def run(self, fn):
+        """Returns (outcome, result or None, elapsed seconds)."""
+        started = time.monotonic()
+        deadline = started + self.budget
+        primary = self.executor.submit(fn)
+        pending = {primary}
+        hedge = None
+        error = None
+        while pending:
+            now = time.monotonic()
+            if hedge is None and self.hedge_after is not None:
+                wait_until = min(deadline, started + self.hedge_after)
+            else:
+                wait_until = deadline
+            done, pending = wait(pending, timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return self._record('hedged' if future is hedge else 'fast', future.result(), started)
+                error = future.exception()
+            if time.monotonic() >= deadline:
+                break
+            # Hedge once the delay has passed, or straight away if the first attempt failed fast
+            if hedge is None and self.hedge_after is not None and (
+                    not pending or time.monotonic() >= started + self.hedge_after):
+                hedge = self.executor.submit(fn)
+                pending.add(hedge)
+                with self._lock:
+                    self.counters['hedges_sent'] += 1
+        if pending:
+            return self._record('timeout', None, started)
+        print(f"LLM call failed: {error}")
+        return self._record('error', None, started)
+
+    async def run_async(self, fn):
+        """Like run(), for a coroutine function. Attempts still running at the end are cancelled."""
+        started = time.monotonic()
+        deadline = started + self.budget
+        pending = {asyncio.ensure_future(fn())}
+        hedge = None
+        error = None
+        try:
+            while pending:
+                now = time.monotonic()
+                if hedge is None and self.hedge_after is not None:
+                    wait_until = min(deadline, started + self.hedge_after)
+                else:
+                    wait_until = deadline
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, wait_until - now),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return self._record('hedged' if task is hedge else 'fast', task.result(), started)
+                    error = task.exception()
+                if time.monotonic() >= deadline:
+                    break
+                if hedge is None and self.hedge_after is not None and (
+                        not pending or time.monotonic() >= started + self.hedge_after):
+                    hedge = asyncio.ensure_future(fn())
+                    pending.add(hedge)
+                    with self._lock:
+                        self.counters['hedges_sent'] += 1
+        finally:
+            for task in pending:
+                task.cancel()
+        if pending:
+            return self._record('timeout', None, started)
+        print(f"LLM call failed: {error}")
+        return self._record('error', None, started)
+
+    def _record(self, outcome, result, started):
+        elapsed = time.monotonic() - started
+        ms = round(elapsed * 1000)
+        with self._lock:
+            counter = self.counters[outcome]
+            counter['count'] += 1
+            counter['total_ms'] += ms
+            counter['max_ms'] = max(counter['max_ms'], ms)
+        return outcome, result, elapsed
+
+    def stats(self):
+        with self._lock:
+            return {key: dict(value) if isinstance(value, dict) else value for key, value in self.counters.items()}
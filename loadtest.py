@@ -0,0 +1,258 @@
+"""Replay Twilio call flows against the Flask app with stand-in backends.
+
+Each simulated call is a greeting, two answered questions, and an escalating
+third turn. Half the callers ask to book (Calendar insert, consultation
+email) and half are sent to voicemail, followed by /handle_voicemail and the
+transcription callback. Anthropic and SMTP are local servers. Calendar and
+Sheets are in-process stand-ins inside the app's own process. Each has its
+own injected latency.
+
+The app runs under waitress in a child process so its peak RSS
+can be measured. Results are saved as JSON under loadtest_results/ named
+after the current commit, and --compare prints the change from an earlier
+result.
+
+--session-backend sqlite or redis keeps call state in that backend instead
+of in memory; redis runs against an in-process fakeredis server.
+
+    python loadtest.py --calls 200 --concurrency 20 [--llm-latency 0.4] [--compare loadtest_results/abc1234.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from compare_servers import free_port, percentile
+from stub_backends import install_google_stubs, start_stub_anthropic, start_stub_redis, start_stub_smtp
+
+FLOWS = {
+    'booking': ["Hi, what services do you offer?", "Do you work with universities as well as schools?",
+                "Great, can I book a consultation?"],
+    'voicemail': ["What does your company actually do?", "Do you help with accreditation reviews?",
+                  "Thanks, I'd like someone to follow up with me."],
+}
+
+
+def serve(port):
+    """Child process: the app with Calendar and Sheets pointed at in-process stand-ins."""
+    import ai_phone_answering_system as phone
+    from waitress import serve as waitress_serve
+    install_google_stubs(phone.google_clients,
+                         calendar_latency=float(os.environ['LOADTEST_CALENDAR_LATENCY']),
+                         sheets_latency=float(os.environ['LOADTEST_SHEETS_LATENCY']))
+    phone.outbox.start()
+    phone.call_records.start()
+    waitress_serve(phone.app, host='127.0.0.1', port=port, threads=int(os.environ.get('WAITRESS_THREADS', 4)))
+
+
+def peak_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def simulated_call(client, n, record):
+    flow = 'booking' if n % 2 == 0 else 'voicemail'
+    form = {'CallSid': f'CA-load-{n}', 'From': f'+1555{n:07d}'}
+    steps = [('/voice', {})]
+    steps += [('/process_speech', {'SpeechResult': q}) for q in FLOWS[flow]]
+    if flow == 'voicemail':
+        steps += [('/handle_voicemail', {'RecordingUrl': 'https://example.com/r.wav'}),
+                  ('/handle_transcription', {'TranscriptionText': 'Please call me back about a curriculum review.'})]
+    for i, (path, extra) in enumerate(steps):
+        # The last process_speech turn escalates, which is a different path through the app
+        label = f'{path} [escalation]' if path == '/process_speech' and i == len(FLOWS[flow]) else path
+        started = time.perf_counter()
+        try:
+            response = client.post(path, data=dict(form, **extra))
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        record(label, time.perf_counter() - started, ok)
+        if not ok:
+            return
+
+
+def wait_for_drain(client, timeout=30):
+    """Let the outbox, sheets flusher and call records writer finish the work the calls queued."""
+    deadline = time.monotonic() + timeout
+    status = {}
+    while time.monotonic() < deadline:
+        status = client.get('/status').json()
+        outbox, sheets, records = status['outbox'], status['sheets'], status['call_records']
+        if (not outbox.get('pending_jobs') and not outbox.get('running_jobs') and sheets['rows_written'] >= sheets['rows']
+                and not records['queued']):
+            break
+        time.sleep(0.5)
+    return status
+
+
+def run(args):
+    anthropic_stub, anthropic_url = start_stub_anthropic(latency=args.llm_latency)
+    smtp_stub, smtp_port = start_stub_smtp(latency=args.smtp_latency)
+    redis_stub, redis_url = start_stub_redis() if args.session_backend == 'redis' else (None, '')
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ,
+                   BASE_URL=f'http://127.0.0.1:{port}',
+                   ANTHROPIC_API_KEY='stub-key',
+                   ANTHROPIC_BASE_URL=anthropic_url,
+                   SMTP_HOST='127.0.0.1',
+                   SMTP_PORT=str(smtp_port),
+                   SMTP_STARTTLS='0',
+                   GMAIL_ADDRESS='loadtest@example.com',
+                   GMAIL_APP_PASSWORD='stub',
+                   NOTIFICATION_EMAIL='team@example.com',
+                   OUTBOX_PATH=os.path.join(workdir, 'outbox.db'),
+                   CALL_RECORDS_PATH=os.path.join(workdir, 'call_records.db'),
+                   SHEETS_SPILL_PATH=os.path.join(workdir, 'sheets_spill.jsonl'),
+                   SLOT_LEASE_DB='',
+                   SESSION_BACKEND=args.session_backend,
+                   SESSION_DB_PATH=os.path.join(workdir, 'sessions.db'),
+                   SESSION_REDIS_URL=redis_url,
+                   WAITRESS_THREADS=str(args.threads),
+                   LOADTEST_CALENDAR_LATENCY=str(args.calendar_latency),
+                   LOADTEST_SHEETS_LATENCY=str(args.sheets_latency))
+        child = subprocess.Popen([sys.executable, __file__, '--serve', str(port)], env=env,
+                                 stdout=subprocess.DEVNULL if not args.verbose else None, stderr=subprocess.STDOUT)
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    httpx.get(base_url + '/', timeout=1)
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline or child.poll() is not None:
+                        raise RuntimeError("app did not start")
+                    time.sleep(0.2)
+
+            latencies = defaultdict(list)
+            errors = defaultdict(int)
+            lock = threading.Lock()
+
+            def record(label, seconds, ok):
+                with lock:
+                    if ok:
+                        latencies[label].append(seconds)
+                    else:
+                        errors[label] += 1
+
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            with httpx.Client(base_url=base_url, limits=limits, timeout=60) as client:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    list(pool.map(lambda n: simulated_call(client, n, record), range(args.calls)))
+                elapsed = time.perf_counter() - started
+                status = wait_for_drain(client)
+            peak = peak_rss_mb(child.pid)
+        finally:
+            child.terminate()
+            child.wait()
+    anthropic_stub.shutdown()
+    smtp_stub.shutdown()
+    if redis_stub:
+        redis_stub.shutdown()
+
+    requests = sum(len(values) for values in latencies.values())
+    return {
+        'commit': commit_id(),
+        'when': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'settings': {key: getattr(args, key) for key in ('calls', 'concurrency', 'threads', 'llm_latency',
+                                                         'calendar_latency', 'sheets_latency', 'smtp_latency',
+                                                         'session_backend')},
+        'seconds': round(elapsed, 2),
+        'calls_per_second': round(args.calls / elapsed, 2),
+        'requests_per_second': round(requests / elapsed, 2),
+        'peak_rss_mb': round(peak, 1) if peak else None,
+        'endpoints': {label: {'count': len(latencies[label]), 'errors': errors[label],
+                              'p50_ms': round(percentile(latencies[label], 50) * 1000, 1),
+                              'p95_ms': round(percentile(latencies[label], 95) * 1000, 1),
+                              'p99_ms': round(percentile(latencies[label], 99) * 1000, 1)}
+                      for label in sorted(set(latencies) | set(errors))},
+        'emails_delivered': len(smtp_stub.messages),
+        'app': {key: status.get(key)
+                for key in ('dependencies', 'outbox', 'smtp', 'sheets', 'call_records', 'calendar', 'slot_leases',
+                            'sessions', 'llm')},
+    }
+
+
+def commit_id():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def report(result, baseline=None):
+    print(f"commit {result['commit']}: {result['settings']['calls']} calls at concurrency "
+          f"{result['settings']['concurrency']} in {result['seconds']}s, "
+          f"{result['settings'].get('session_backend', 'memory')} sessions")
+
+    def delta(key, value, base):
+        if not base or base.get(key) in (None, 0) or value is None:
+            return ''
+        return f" ({(value - base[key]) / base[key] * 100:+.0f}%)"
+
+    for key in ('calls_per_second', 'requests_per_second', 'peak_rss_mb'):
+        print(f"  {key:20s} {result[key]}{delta(key, result[key], baseline)}")
+    print(f"  {'endpoint':34s} {'count':>6s} {'errors':>6s} {'p50 ms':>12s} {'p95 ms':>12s} {'p99 ms':>12s}")
+    for label, row in result['endpoints'].items():
+        base = (baseline or {}).get('endpoints', {}).get(label)
+        cells = [f"{row[key]:7.1f}{delta(key, row[key], base):>5s}" for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"  {label:34s} {row['count']:6d} {row['errors']:6d} " + ' '.join(f"{cell:>12s}" for cell in cells))
+    records = result['app'].get('call_records') or {}
+    print(f"  emails delivered {result['emails_delivered']}, sheet rows written "
+          f"{(result['app'].get('sheets') or {}).get('rows_written')}, call record events written "
+          f"{records.get('written')} (slowest enqueue {(records.get('enqueue') or {}).get('max_us')} us)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=4, help='waitress threads in the app')
+    parser.add_argument('--llm-latency', type=float, default=0.4)
+    parser.add_argument('--calendar-latency', type=float, default=0.15)
+    parser.add_argument('--sheets-latency', type=float, default=0.2)
+    parser.add_argument('--smtp-latency', type=float, default=0.1)
+    parser.add_argument('--session-backend', choices=['memory', 'sqlite', 'redis'], default='memory',
+                        help='redis runs against an in-process fakeredis server')
+    parser.add_argument('--results-dir', default='loadtest_results')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--verbose', action='store_true', help="show the app's output")
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        sys.exit(0)
+
+    result = run(args)
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"{result['commit']}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {baseline['commit']} ({args.compare})")
+    report(result, baseline)
+    print(f"saved {path}")
@@ -0,0 +1,122 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Upper bounds in seconds; webhook handling and dependency calls both fall in this range
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+
+# The CallSid of the webhook being handled, so dependency spans land in its trace
+current_call = contextvars.ContextVar('current_call', default=None)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, one series per label set."""
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels, seconds):
+        # Caller holds the registry lock
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            label_text = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metrics:
+    """Request and dependency timings, as Prometheus histograms and per-call traces.
+
+    Each webhook is timed by endpoint and status; each call to an external
+    service (Anthropic, Calendar, Sheets, SMTP) by dependency, operation and
+    outcome. Spans made while a webhook is being handled (or for an explicit
+    call_sid) are also kept in a trace for that CallSid, for the last
+    max_traces calls. Figures are per process.
+    """
+
+    def __init__(self, max_traces=1000, max_spans=200):
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self.requests = Histogram('phone_request_duration_seconds', 'Webhook handling time by endpoint.',
+                                  ('endpoint', 'method', 'status'))
+        self.dependencies = Histogram('phone_dependency_duration_seconds', 'External call time by dependency.',
+                                      ('dependency', 'operation', 'outcome'))
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _trace(self, call_sid, span):
+        # Caller holds self._lock
+        if not call_sid:
+            return
+        spans = self._traces.get(call_sid)
+        if spans is None:
+            spans = self._traces[call_sid] = []
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        else:
+            self._traces.move_to_end(call_sid)
+        if len(spans) < self.max_spans:
+            spans.append(span)
+
+    def observe_request(self, endpoint, method, status, started, elapsed, call_sid=None):
+        with self._lock:
+            self.requests.observe((endpoint, method, str(status)), elapsed)
+            self._trace(call_sid, {'span': f'{method} {endpoint}', 'status': status,
+                                   'at': round(started, 3), 'ms': round(elapsed * 1000, 1)})
+
+    def observe_dependency(self, dependency, operation, outcome, started, elapsed, call_sid=None):
+        with self._lock:
+            self.dependencies.observe((dependency, operation, outcome), elapsed)
+            self._trace(call_sid or current_call.get(), {'span': f'{dependency}.{operation}', 'outcome': outcome,
+                                                         'at': round(started, 3), 'ms': round(elapsed * 1000, 1)})
+
+    @contextmanager
+    def span(self, dependency, operation, call_sid=None):
+        """Time the block as one call to dependency; exceptions are counted as errors and re-raised."""
+        started = time.time()
+        timer = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            self.observe_dependency(dependency, operation, outcome, started, time.perf_counter() - timer, call_sid)
+
+    def trace(self, call_sid):
+        """Spans recorded for call_sid, oldest first, or None if it isn't tracked."""
+        with self._lock:
+            spans = self._traces.get(call_sid)
+            return [dict(span) for span in spans] if spans is not None else None
+
+    def render(self):
+        with self._lock:
+            lines = self.requests.render() + self.dependencies.render()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
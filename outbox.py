@@ -0,0 +1,227 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+
+
+class Outbox:
+    """Persistent SQLite job queue drained by a pool of background worker threads.
+
+    Jobs survive restarts: anything still marked 'running' by a process that is
+    no longer alive is put back to 'pending' when the outbox starts.
+
+    A kind registered with batch=N is handed to its handler as a list: when
+    one job of that kind comes due, every other new job of the same kind
+    (up to N in all) is claimed with it. Enqueueing such jobs with a delay
+    turns the delay into a window for collecting them.
+    """
+
+    def __init__(self, path='outbox.db', workers=2, max_attempts=6, base_delay=2.0, max_delay=300.0):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.handlers = {}
+        self.batches = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._threads = []
+        self._stopping = False
+        self._pid = None
+        self.counters = {'enqueued': 0, 'done': 0, 'retried': 0, 'dead': 0}
+
+    def register(self, kind, handler, batch=None):
+        """Register the function that performs jobs of this kind (raise to retry).
+
+        With batch set, handler is called with a list of up to batch payloads.
+        """
+        self.handlers[kind] = handler
+        if batch:
+            self.batches[kind] = batch
+        else:
+            self.batches.pop(kind, None)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            owner INTEGER,
+            last_error TEXT,
+            created REAL NOT NULL
+        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_attempt)")
+        return conn
+
+    def _db(self):
+        # Reconnect after fork so child processes never share a parent's handle
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = self._connect()
+        return self._conn
+
+    def start(self):
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._conn = None
+            self._stopping = False
+            self._requeue_orphans()
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f'outbox-worker-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _requeue_orphans(self):
+        with self._db_lock:
+            db = self._db()
+            rows = db.execute("SELECT DISTINCT owner FROM jobs WHERE status = 'running'").fetchall()
+            for (owner,) in rows:
+                if owner != os.getpid() and pid_alive(owner):
+                    continue
+                db.execute("UPDATE jobs SET status = 'pending', owner = NULL WHERE status = 'running' AND owner IS ?", (owner,))
+                print(f"Outbox: requeued jobs left running by process {owner}")
+
+    def enqueue(self, kind, payload, delay=0):
+        """Persist a job, due after delay seconds, and wake a worker. Returns the job id."""
+        if self._pid != os.getpid() or not self._threads:
+            self.start()
+        now = time.time()
+        with self._db_lock:
+            cur = self._db().execute(
+                "INSERT INTO jobs (kind, payload, next_attempt, created) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), now + delay, now))
+            job_id = cur.lastrowid
+        with self._lock:
+            self.counters['enqueued'] += 1
+            self._wakeup.notify()
+        return job_id
+
+    def _claim(self):
+        now = time.time()
+        with self._db_lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs WHERE status = 'pending' AND next_attempt <= ? "
+                    "ORDER BY next_attempt, id LIMIT 1", (now,)).fetchone()
+                if row:
+                    rows = [row]
+                    batch = self.batches.get(row[1])
+                    if batch:
+                        # New jobs still inside their collection window ride along; retries wait their turn
+                        rows += db.execute(
+                            "SELECT id, kind, payload, attempts FROM jobs WHERE status = 'pending' AND kind = ? "
+                            "AND id != ? AND (attempts = 0 OR next_attempt <= ?) ORDER BY id LIMIT ?",
+                            (row[1], row[0], now, batch - 1)).fetchall()
+                    db.executemany("UPDATE jobs SET status = 'running', owner = ? WHERE id = ?",
+                                   [(os.getpid(), r[0]) for r in rows])
+                    db.execute("COMMIT")
+                    return rows
+                nxt = db.execute("SELECT MIN(next_attempt) FROM jobs WHERE status = 'pending'").fetchone()[0]
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return nxt
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+            try:
+                claimed = self._claim()
+            except Exception as e:
+                print(f"Outbox database error: {e}")
+                claimed = time.time() + 1.0
+            if isinstance(claimed, list):
+                self._execute(claimed)
+                continue
+            wait = 1.0 if claimed is None else max(0.0, min(1.0, claimed - time.time()))
+            with self._lock:
+                if not self._stopping:
+                    self._wakeup.wait(wait)
+
+    def _execute(self, rows):
+        kind = rows[0][1]
+        handler = self.handlers.get(kind)
+        try:
+            if handler is None:
+                raise RuntimeError(f"no handler registered for '{kind}'")
+            if kind in self.batches:
+                handler([json.loads(payload) for _, _, payload, _ in rows])
+            else:
+                handler(**json.loads(rows[0][2]))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            for job_id, _, _, attempts in rows:
+                self._failed(job_id, kind, attempts + 1, error)
+            return
+        with self._db_lock:
+            self._db().executemany("DELETE FROM jobs WHERE id = ?", [(r[0],) for r in rows])
+        with self._lock:
+            self.counters['done'] += len(rows)
+
+    def _failed(self, job_id, kind, attempts, error):
+        with self._db_lock:
+            if attempts >= self.max_attempts:
+                self._db().execute(
+                    "UPDATE jobs SET status = 'dead', attempts = ?, owner = NULL, last_error = ? WHERE id = ?",
+                    (attempts, error, job_id))
+                print(f"Outbox: giving up on {kind} job {job_id} after {attempts} attempts: {error}")
+                counter = 'dead'
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+                self._db().execute(
+                    "UPDATE jobs SET status = 'pending', attempts = ?, owner = NULL, last_error = ?, next_attempt = ? WHERE id = ?",
+                    (attempts, error, time.time() + delay, job_id))
+                print(f"Outbox: {kind} job {job_id} failed ({error}), retrying in {delay:.1f}s")
+                counter = 'retried'
+        if counter == 'dead':
+            traceback.print_exc()
+        with self._lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self._db_lock:
+            rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        with self._lock:
+            stats = dict(self.counters)
+        stats.update({f'{status}_jobs': count for status, count in rows})
+        return stats
+
+
+def pid_alive(pid):
+    """True if a process with this pid exists (possibly owned by another user)."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class SlotLeaseTable:
+    """In-process slot leases so simultaneous callers are offered different slots.
+
+    offer() places a short lease on the first candidate nobody else holds;
+    confirm() turns the lease into a booking that lasts until the slot has
+    passed and hands the slot to on_booked (e.g. the availability cache), or
+    returns False if the lease ran out and another caller holds the slot now;
+    release() gives the slot back if the booking falls through.
+    """
+
+    def __init__(self, lease_seconds=120, slot_length=3600, on_booked=None):
+        self.lease_seconds = lease_seconds
+        self.slot_length = slot_length
+        self.on_booked = on_booked
+        self._leases = {}
+        self._lock = threading.Lock()
+        self.counters = {'offered': 0, 'contended': 0, 'exhausted': 0, 'confirmed': 0, 'lost': 0, 'released': 0}
+
+    def _purge(self, now):
+        expired = [key for key, (_, expires, _) in self._leases.items() if expires <= now]
+        for key in expired:
+            del self._leases[key]
+
+    def offer(self, candidates, holder):
+        """Lease and return the first free candidate slot, or None if all are taken."""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            for slot in candidates:
+                key = int(slot.timestamp())
+                lease = self._leases.get(key)
+                if lease and lease[0] != holder:
+                    self.counters['contended'] += 1
+                    continue
+                self._leases[key] = (holder, now + self.lease_seconds, 'leased')
+                self.counters['offered'] += 1
+                return slot
+            self.counters['exhausted'] += 1
+            return None
+
+    def confirm(self, slot, holder):
+        key = int(slot.timestamp())
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease[0] != holder:
+                self.counters['lost'] += 1
+                return False
+            self._leases[key] = (holder, key + self.slot_length, 'booked')
+            self.counters['confirmed'] += 1
+        self._booked(slot)
+        return True
+
+    def release(self, slot, holder):
+        key = int(slot.timestamp())
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease[0] == holder:
+                del self._leases[key]
+                self.counters['released'] += 1
+
+    def _booked(self, slot):
+        if self.on_booked:
+            try:
+                self.on_booked(slot)
+            except Exception as e:
+                print(f"Slot booking callback error: {e}")
+
+    def stats(self):
+        with self._lock:
+            self._purge(time.time())
+            stats = dict(self.counters)
+            stats['active_leases'] = len(self._leases)
+        return stats
+
+
+class SQLiteSlotLeaseTable(SlotLeaseTable):
+    """Slot leases shared between worker processes through SQLite."""
+
+    def __init__(self, path, lease_seconds=120, slot_length=3600, on_booked=None):
+        super().__init__(lease_seconds=lease_seconds, slot_length=slot_length, on_booked=on_booked)
+        self.path = path
+        self._local = threading.local()
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS slot_leases (slot INTEGER PRIMARY KEY, holder TEXT NOT NULL, expires REAL NOT NULL, state TEXT NOT NULL)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, fn):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(db)
+            db.execute("COMMIT")
+            return result
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def offer(self, candidates, holder):
+        now = time.time()
+
+        def take(db):
+            db.execute("DELETE FROM slot_leases WHERE expires <= ?", (now,))
+            for slot in candidates:
+                key = int(slot.timestamp())
+                row = db.execute("SELECT holder FROM slot_leases WHERE slot = ?", (key,)).fetchone()
+                if row and row[0] != holder:
+                    self._count('contended')
+                    continue
+                db.execute("INSERT OR REPLACE INTO slot_leases VALUES (?, ?, ?, 'leased')", (key, holder, now + self.lease_seconds))
+                return slot
+            return None
+
+        slot = self._transaction(take)
+        self._count('offered' if slot else 'exhausted')
+        return slot
+
+    def confirm(self, slot, holder):
+        key = int(slot.timestamp())
+
+        def book(db):
+            row = db.execute("SELECT holder FROM slot_leases WHERE slot = ?", (key,)).fetchone()
+            if row and row[0] != holder:
+                return False
+            db.execute("INSERT OR REPLACE INTO slot_leases VALUES (?, ?, ?, 'booked')", (key, holder, key + self.slot_length))
+            return True
+
+        if not self._transaction(book):
+            self._count('lost')
+            return False
+        self._count('confirmed')
+        self._booked(slot)
+        return True
+
+    def release(self, slot, holder):
+        key = int(slot.timestamp())
+        cur = self._transaction(lambda db: db.execute(
+            "DELETE FROM slot_leases WHERE slot = ? AND holder = ?", (key, holder)))
+        if cur.rowcount:
+            self._count('released')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['active_leases'] = self._db().execute("SELECT COUNT(*) FROM slot_leases WHERE expires > ?", (time.time(),)).fetchone()[0]
+        return stats
+
+
+if __name__ == '__main__':
+    # Stress check: many simultaneous escalations go through the app's booking
+    # path (reserve_slot, confirm, book_appointment) against a stub calendar and
+    # must never book two callers into the same slot. The runs with leases that
+    # expire almost at once make callers lose slots between offer and confirm.
+    import contextlib
+    import io
+    import sys
+    import tempfile
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+
+    callers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workdir = tempfile.mkdtemp()
+    os.environ.update(WARM_UP='0', SESSION_BACKEND='memory', SLOT_LEASE_DB='', SLOT_SEARCH_LIMIT=str(callers),
+                      OUTBOX_PATH=os.path.join(workdir, 'outbox.db'),
+                      SHEETS_SPILL_PATH=os.path.join(workdir, 'sheets_spill.jsonl'),
+                      CALL_RECORDS_PATH=os.path.join(workdir, 'call_records.db'),
+                      KNOWLEDGE_INDEX_PATH=os.path.join(workdir, 'knowledge_index.json'))
+    import ai_phone_answering_system as phone
+    from calendar_cache import AvailabilityCache
+    from stub_backends import install_google_stubs
+
+    failed = False
+    for n, (name, lease_seconds) in enumerate([('memory', 120), ('memory', 0.001), ('sqlite', 120), ('sqlite', 0.001)]):
+        if name == 'memory':
+            phone.slot_leases = SlotLeaseTable(lease_seconds=lease_seconds)
+        else:
+            phone.slot_leases = SQLiteSlotLeaseTable(os.path.join(workdir, f'leases-{n}.db'), lease_seconds=lease_seconds)
+        calendar, _ = install_google_stubs(phone.google_clients, calendar_latency=0.005)
+        phone.calendar_cache = AvailabilityCache(phone.get_calendar_service, phone.GOOGLE_CALENDAR_ID)
+
+        def escalate(i):
+            call_sid = f'CA{i}'
+            return phone.book_slot(phone.ConversationManager('+1555000' + str(i)), call_sid, call_sid)
+
+        started = time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=50) as pool:
+            booked = [slot for slot in pool.map(escalate, range(callers)) if slot]
+        starts = Counter(event['start']['dateTime'] for event in calendar.items.values())
+        overlaps = sum(count - 1 for count in starts.values()) + len(booked) - len(set(booked))
+        failed = failed or overlaps > 0 or len(calendar.items) != len(booked)
+        print(f"{name}, {lease_seconds:g}s leases: {callers} simultaneous escalations, {len(booked)} booked, "
+              f"{overlaps} overlaps, {time.monotonic() - started:.2f}s, {phone.slot_leases.stats()}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class DependencyUnavailable(Exception):
+    """Raised instead of calling a dependency whose breaker is open or whose slots are all busy."""
+
+
+class Dependency:
+    """Circuit breaker and bulkhead for one external service.
+
+    Calls go through call() (or acall() on the event loop). At most
+    max_concurrent run at once; a call that can't get a slot within max_wait
+    seconds is rejected rather than queued, so a slow service holds on to a
+    few threads instead of all of them. After failure_threshold consecutive
+    failures the breaker opens and calls are rejected straight away; once
+    reset_timeout seconds have passed a single trial call is let through
+    (half-open), and its outcome closes or re-opens the breaker. timeout is
+    the per-request timeout the service's client should be configured with.
+    """
+
+    def __init__(self, name, timeout, max_concurrent=4, max_wait=0.5, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._in_flight = 0
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'successes': 0, 'failures': 0, 'rejected_open': 0, 'rejected_full': 0,
+                         'opened': 0}
+        self.last_error = None
+
+    def _admit(self):
+        """Whether the call is a half-open trial. Raises if the breaker doesn't let it through."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.counters['rejected_open'] += 1
+        raise DependencyUnavailable(f"{self.name} circuit open")
+
+    def _enter(self, acquired, trial):
+        with self._lock:
+            if not acquired:
+                if trial:
+                    self._trial_running = False
+                self.counters['rejected_full'] += 1
+            else:
+                self.counters['calls'] += 1
+                self._in_flight += 1
+        if not acquired:
+            raise DependencyUnavailable(f"{self.name}: all {self.max_concurrent} slots busy")
+
+    def _exit(self, trial, error, cancelled=False):
+        self._slots.release()
+        with self._lock:
+            self._in_flight -= 1
+            if trial:
+                self._trial_running = False
+            if cancelled:
+                # Abandoned by the caller (e.g. a hedge that lost): neither a success nor a failure
+                return
+            if error is None:
+                self.counters['successes'] += 1
+                self._failures = 0
+                self.state = CLOSED
+            else:
+                self._failed(error, trial)
+
+    def _failed(self, error, trial):
+        # Caller holds self._lock
+        self.counters['failures'] += 1
+        self._failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if trial or self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self.counters['opened'] += 1
+            print(f"{self.name} circuit opened after {self._failures} failures ({self.last_error})")
+
+    def record_failure(self, error):
+        """Count a failure seen outside call(), e.g. a call cancelled because its deadline passed."""
+        with self._lock:
+            self._failed(error, trial=False)
+
+    @contextmanager
+    def call(self, wait=None):
+        """Guard a blocking call; exceptions raised inside count as failures and are re-raised."""
+        trial = self._admit()
+        self._enter(self._slots.acquire(timeout=self.max_wait if wait is None else wait), trial)
+        try:
+            yield
+        except BaseException as e:
+            self._exit(trial, e)
+            raise
+        self._exit(trial, None)
+
+    @asynccontextmanager
+    async def acall(self):
+        """call() for coroutines: never blocks the loop waiting for a slot."""
+        trial = self._admit()
+        self._enter(self._slots.acquire(blocking=False), trial)
+        try:
+            yield
+        except asyncio.CancelledError:
+            # Timeouts arrive as cancellation too; the caller reports those with record_failure()
+            self._exit(trial, None, cancelled=True)
+            raise
+        except BaseException as e:
+            self._exit(trial, e)
+            raise
+        self._exit(trial, None)
+
+    def available(self):
+        """False while the breaker is open and not yet due for a trial call."""
+        with self._lock:
+            return self.state != OPEN or time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['state'] = self.state
+            stats['consecutive_failures'] = self._failures
+            stats['in_flight'] = self._in_flight
+            stats['max_concurrent'] = self.max_concurrent
+            stats['timeout'] = self.timeout
+            stats['last_error'] = self.last_error
+            if self.state == OPEN:
+                stats['retry_in'] = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+        return stats
+
+
+def guarded(dependency):
+    """dependency.call(), or a no-op when there is no dependency to guard."""
+    return dependency.call() if dependency else nullcontext()
@@ -1,8 +1,84 @@
 import os
+import signal
+import socket
+import sys
+import time
+from dotenv import load_dotenv
 from waitress import serve
-from ai_phone_answering_system import app
+
+load_dotenv()
+
+# WEB_CONCURRENCY > 1 pre-forks that many waitress processes sharing one
+# listening socket. Call state then has to live outside any one process.
+WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+if WORKERS > 1 and os.environ.get('SESSION_BACKEND', 'memory') == 'memory':
+    print("WEB_CONCURRENCY > 1 needs a shared session store - using SESSION_BACKEND=sqlite")
+    os.environ['SESSION_BACKEND'] = 'sqlite'
+
+from ai_phone_answering_system import app, call_records, outbox, start_warm_up
+
+def run_worker(sock):
+    # Drain any notifications left over from a previous run
+    outbox.start()
+    call_records.start()
+    start_warm_up()
+    serve(app, sockets=[sock], threads=int(os.environ.get('WAITRESS_THREADS', 4)))
+
+def run_workers(port, workers):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('0.0.0.0', port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                run_worker(sock)
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+        print(f"Started worker process {pid}")
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.pop(pid, None)
+        if not stopping:
+            print(f"Worker process {pid} exited with status {status} - restarting")
+            spawn()
+    sys.exit(0)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 10000))
     print(f"Starting server on port {port}")
-    serve(app, host='0.0.0.0', port=port)
+    if WORKERS > 1:
+        print(f"Running {WORKERS} worker processes")
+        run_workers(port, WORKERS)
+    else:
+        outbox.start()
+        call_records.start()
+        start_warm_up()
+        serve(app, host='0.0.0.0', port=port)
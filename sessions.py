@@ -0,0 +1,166 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from conversation_store import ConversationStore
+
+
+class MemorySessionBackend:
+    """Sessions held in this process only (single-process deployments).
+
+    Like the shared backends, get and update hand out snapshots: changes only
+    reach the stored conversation through update.
+    """
+
+    def __init__(self, store, stripes=64):
+        self.store = store
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _lock_for(self, call_sid):
+        return self._locks[zlib.crc32(call_sid.encode()) % len(self._locks)]
+
+    def get(self, call_sid):
+        with self._lock_for(call_sid):
+            return copy.deepcopy(self.store.get(call_sid))
+
+    def update(self, call_sid, fn, create):
+        """Apply fn to the call's conversation (creating it if needed) atomically per CallSid."""
+        with self._lock_for(call_sid):
+            conversation = self.store.get_or_create(call_sid, create)
+            fn(conversation)
+            self.store.updated(call_sid)
+            return copy.deepcopy(conversation)
+
+    def stats(self):
+        stats = self.store.stats()
+        stats['backend'] = 'memory'
+        return stats
+
+
+class SQLiteSessionBackend:
+    """Sessions in a shared SQLite database (WAL mode) so several worker
+    processes on one host can serve callbacks for the same call."""
+
+    def __init__(self, path, loads, idle_ttl=1800, finished_ttl=900):
+        self.path = path
+        self.loads = loads
+        self.ttl = idle_ttl + finished_ttl
+        self._local = threading.local()
+        self._last_prune = 0
+        self.counters = {'reads': 0, 'updates': 0}
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (call_sid TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, call_sid):
+        self.counters['reads'] += 1
+        row = self._db().execute("SELECT data FROM sessions WHERE call_sid = ? AND updated > ?",
+                                 (call_sid, time.time() - self.ttl)).fetchone()
+        return self.loads(json.loads(row[0])) if row else None
+
+    def update(self, call_sid, fn, create):
+        db = self._db()
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes can't
+        # both read the same turn list and overwrite each other's additions
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT data FROM sessions WHERE call_sid = ?", (call_sid,)).fetchone()
+            conversation = self.loads(json.loads(row[0])) if row else create()
+            fn(conversation)
+            db.execute("INSERT OR REPLACE INTO sessions (call_sid, data, updated) VALUES (?, ?, ?)",
+                       (call_sid, json.dumps(conversation.to_dict()), time.time()))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        self.counters['updates'] += 1
+        self._maybe_prune(db)
+        return conversation
+
+    def _maybe_prune(self, db):
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        db.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+
+    def stats(self):
+        live = self._db().execute("SELECT COUNT(*) FROM sessions WHERE updated > ?", (time.time() - self.ttl,)).fetchone()[0]
+        stats = dict(self.counters)
+        stats.update({'backend': 'sqlite', 'sessions': live})
+        return stats
+
+
+class RedisSessionBackend:
+    """Sessions in Redis, for workers spread across several hosts.
+
+    Takes any client with the redis-py interface, so a local stand-in such as
+    fakeredis can replace the real server in tests.
+    """
+
+    def __init__(self, client, loads, idle_ttl=1800, finished_ttl=900, prefix='call:'):
+        self.client = client
+        self.loads = loads
+        self.ttl = int(idle_ttl + finished_ttl)
+        self.prefix = prefix
+        self.counters = {'reads': 0, 'updates': 0, 'conflicts': 0}
+
+    def get(self, call_sid):
+        self.counters['reads'] += 1
+        data = self.client.get(self.prefix + call_sid)
+        return self.loads(json.loads(data)) if data else None
+
+    def update(self, call_sid, fn, create):
+        from redis.exceptions import WatchError
+        key = self.prefix + call_sid
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic lock: the transaction aborts if another
+                    # worker changed this call in the meantime, then we retry
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    conversation = self.loads(json.loads(data)) if data else create()
+                    fn(conversation)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(conversation.to_dict()), ex=self.ttl)
+                    pipe.execute()
+                    break
+                except WatchError:
+                    self.counters['conflicts'] += 1
+        self.counters['updates'] += 1
+        return conversation
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['backend'] = 'redis'
+        return stats
+
+
+def make_session_backend(kind, loads, idle_ttl=1800, finished_ttl=900, max_entries=5000,
+                         max_bytes=64 * 1024 * 1024, sqlite_path='sessions.db', redis_url=None, finalizer=None):
+    """finalizer(call_sid, conversation) is called as in-memory sessions are evicted; the shared
+    backends expire their rows without it."""
+    if kind == 'sqlite':
+        return SQLiteSessionBackend(sqlite_path, loads, idle_ttl=idle_ttl, finished_ttl=finished_ttl)
+    if kind == 'redis':
+        import redis
+        return RedisSessionBackend(redis.Redis.from_url(redis_url), loads, idle_ttl=idle_ttl, finished_ttl=finished_ttl)
+    if kind != 'memory':
+        raise ValueError(f"Unknown SESSION_BACKEND '{kind}' - use memory, sqlite or redis")
+    store = ConversationStore(idle_ttl=idle_ttl, max_entries=max_entries, max_bytes=max_bytes, finished_ttl=finished_ttl,
+                              finalizer=finalizer)
+    return MemorySessionBackend(store)
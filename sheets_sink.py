@@ -0,0 +1,227 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from metrics import metrics
+from outbox import pid_alive
+from resilience import guarded
+
+
+class SheetsSink:
+    """Buffers call log rows and writes them to Google Sheets in batches.
+
+    The header row is checked once per process and each flush is a single
+    append_rows call, triggered when max_batch rows are waiting, every
+    flush_interval seconds, or at shutdown. add() appends the row to an
+    append-only spill file before returning, so a crash or restart doesn't
+    lose rows that were waiting for a batch. A flush moves the file aside
+    (per process), writes its rows and deletes it only once append_rows has
+    succeeded; failed rows go back into the spill file, and files left behind
+    by a process that died mid-flush are picked up by the next flush. Every
+    worker process shares the spill file, so appends and the move are done
+    under an flock on a sidecar .lock file, which also holds the number of
+    rows waiting. Rows can be written twice after a crash. Once max_buffer
+    rows are waiting (a long Sheets outage), new rows are dropped and counted.
+    While the dependency's circuit breaker is open, rows stay in the file and
+    flushes are skipped.
+    """
+
+    def __init__(self, open_worksheet, header, max_batch=50, flush_interval=5.0, max_buffer=1000,
+                 spill_path='sheets_spill.jsonl', dependency=None):
+        self.open_worksheet = open_worksheet
+        self.dependency = dependency
+        self.header = header
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_path = spill_path
+        self.lock_path = spill_path + '.lock'
+        self._pending = 0
+        self._dropping = False
+        self._lock_file = None
+        self._lock_pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worksheet = None
+        self._header_checked = False
+        self._thread = None
+        self._pid = None
+        self.counters = {'rows': 0, 'flushes': 0, 'rows_written': 0, 'flush_errors': 0, 'spilled': 0,
+                         'flushes_skipped': 0, 'dropped': 0}
+        atexit.register(self.close)
+
+    def add(self, row):
+        """Persist a row for the next batch. Never blocks on the network."""
+        self._ensure_flusher()
+        with self._spill_lock() as lock:
+            self.counters['rows'] += 1
+            waiting = _read_count(lock)
+            dropped = waiting >= self.max_buffer
+            # Log when dropping starts and stops rather than once per row
+            announce = dropped != self._dropping
+            self._dropping = dropped
+            if dropped:
+                self.counters['dropped'] += 1
+            else:
+                self._append([row])
+                _write_count(lock, waiting + 1)
+                self._pending += 1
+            full = self._pending >= self.max_batch
+        if announce and dropped:
+            print(f"Google Sheets spill file is full ({self.max_buffer} rows waiting); dropping call log rows")
+        elif announce:
+            print(f"Google Sheets spill file has room again ({self.counters['dropped']} rows dropped so far)")
+        if full:
+            self._wakeup.set()
+
+    def _ensure_flusher(self):
+        if self._pid == os.getpid() and self._thread:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread:
+                return
+            self._pid = os.getpid()
+            self._pending = 0
+            self._thread = threading.Thread(target=self._run, name='sheets-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    @contextmanager
+    def _spill_lock(self):
+        """Hold the thread lock and an flock shared with the other worker processes."""
+        with self._lock:
+            # A forked child shares the parent's open file, and so its flock
+            if self._lock_file is None or self._lock_pid != os.getpid():
+                self._lock_file = open(self.lock_path, 'a+')
+                self._lock_pid = os.getpid()
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield self._lock_file
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _append(self, rows):
+        # Caller holds _spill_lock
+        with open(self.spill_path, 'a') as f:
+            f.write(''.join(json.dumps(row) + '\n' for row in rows))
+
+    def _spill(self, rows, lock):
+        # Caller holds _spill_lock. Rows being retried go back even over max_buffer
+        self._append(rows)
+        _write_count(lock, _read_count(lock) + len(rows))
+        self.counters['spilled'] += len(rows)
+
+    @staticmethod
+    def _read(path):
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _taken_path(self):
+        return f"{self.spill_path}.{os.getpid()}.flushing"
+
+    def _recover_orphans(self, lock):
+        # Caller holds _spill_lock. Files taken by a process that died before
+        # its flush finished go back into the spill file.
+        for path in glob.glob(glob.escape(self.spill_path) + '.*flushing'):
+            pid = path[len(self.spill_path) + 1:-len('.flushing')]
+            if pid.isdigit() and (int(pid) == os.getpid() or pid_alive(int(pid))):
+                continue
+            self._spill(self._read(path), lock)
+            os.remove(path)
+
+    def _take_spilled(self, lock):
+        # Caller holds _spill_lock. The taken file stays until the rows are written
+        self._recover_orphans(lock)
+        self._pending = 0
+        taken = self._taken_path()
+        if not os.path.exists(self.spill_path):
+            return []
+        os.replace(self.spill_path, taken)
+        _write_count(lock, 0)
+        return self._read(taken)
+
+    def _ensure_header(self, sheet):
+        if self._header_checked:
+            return
+        with metrics.span('sheets', 'header'):
+            first_row = sheet.row_values(1)
+        if not first_row or first_row[0] != self.header[0]:
+            sheet.insert_row(self.header, 1)
+        self._header_checked = True
+
+    def warm_up(self):
+        """Open the worksheet and check the header now instead of on the first flush."""
+        with self._flush_lock, guarded(self.dependency):
+            if self._worksheet is None:
+                with metrics.span('sheets', 'open'):
+                    self._worksheet = self.open_worksheet()
+            self._ensure_header(self._worksheet)
+
+    def flush(self):
+        """Write every row waiting in the spill file with one append_rows call."""
+        with self._flush_lock:
+            if self.dependency and not self.dependency.available():
+                with self._lock:
+                    if self._pending:
+                        self.counters['flushes_skipped'] += 1
+                return 0
+            with self._spill_lock() as lock:
+                rows = self._take_spilled(lock)
+            if not rows:
+                return 0
+            try:
+                with guarded(self.dependency):
+                    if self._worksheet is None:
+                        with metrics.span('sheets', 'open'):
+                            self._worksheet = self.open_worksheet()
+                    self._ensure_header(self._worksheet)
+                    with metrics.span('sheets', 'append'):
+                        self._worksheet.append_rows(rows)
+            except Exception as e:
+                self._worksheet = None
+                with self._spill_lock() as lock:
+                    self.counters['flush_errors'] += 1
+                    self._spill(rows, lock)
+                    os.remove(self._taken_path())
+                print(f"Google Sheets logging error: {e} ({len(rows)} rows kept for retry)")
+                return 0
+            with self._lock:
+                os.remove(self._taken_path())
+                self.counters['flushes'] += 1
+                self.counters['rows_written'] += len(rows)
+            print(f"Logged {len(rows)} rows to Google Sheets")
+            return len(rows)
+
+    def close(self):
+        """Flush at shutdown; anything that can't be written is left in the spill file."""
+        if self._pid == os.getpid():
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['buffered'] = self._pending
+        return stats
+
+
+def _read_count(lock):
+    lock.seek(0)
+    text = lock.read().strip()
+    return int(text) if text.isdigit() else 0
+
+
+def _write_count(lock, count):
+    lock.seek(0)
+    lock.truncate()
+    lock.write(str(count))
+    lock.flush()
@@ -0,0 +1,96 @@
+"""SMTP delivery benchmark: a connection per email vs the pool vs pool plus digest.
+
+Notifications go through a real Outbox (in a temporary database) to a local
+SMTP stand-in that takes --latency seconds for the greeting, AUTH and each
+message, as a remote server's round trips would. For each mode it reports
+notifications delivered per second, the SMTP messages and logins it took,
+and the handshakes saved compared with opening a connection per email.
+
+    python smtp_bench.py [--notifications 200] [--workers 2] [--latency 0.05] [--rate 50] [--digest-window 0.5]
+"""
+import argparse
+import os
+import smtplib
+import tempfile
+import time
+from email.mime.text import MIMEText
+
+from outbox import Outbox
+from smtp_pool import SMTPPool
+from stub_backends import start_stub_smtp
+
+
+def make_message(subject, body):
+    msg = MIMEText(body)
+    msg['From'] = 'bench@example.com'
+    msg['To'] = 'team@example.com'
+    msg['Subject'] = subject
+    return msg
+
+
+def run_mode(mode, args, port, workdir):
+    def connect():
+        server = smtplib.SMTP('127.0.0.1', port, timeout=30)
+        server.login('bench@example.com', 'stub')
+        return server
+
+    pool = SMTPPool(connect, size=args.workers)
+
+    def send_fresh(subject, body):
+        # What deliver_email did before pooling: connect, log in, send, quit
+        server = connect()
+        try:
+            server.send_message(make_message(subject, body))
+        finally:
+            server.quit()
+
+    def send_pooled(subject, body):
+        pool.send(make_message(subject, body))
+
+    def send_digest(messages):
+        body = '\n\n'.join(message['subject'] + '\n' + message['body'] for message in messages)
+        pool.send(make_message(f'{len(messages)} notifications', body))
+
+    outbox = Outbox(os.path.join(workdir, f'{mode}.db'), workers=args.workers)
+    outbox.register('email', send_fresh if mode == 'per-message' else send_pooled)
+    outbox.register('email_digest', send_digest, batch=args.digest_max)
+    kind, delay = ('email_digest', args.digest_window) if mode == 'digest' else ('email', 0)
+
+    started = time.perf_counter()
+    for n in range(args.notifications):
+        outbox.enqueue(kind, {'subject': f'Inquiry {n}', 'body': f'Caller +1555{n:07d} asked about services.'},
+                       delay=delay)
+        if args.rate:
+            time.sleep(1 / args.rate)
+    while outbox.counters['done'] + outbox.counters['dead'] < args.notifications:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    outbox.stop()
+    pool.close()
+    return elapsed, outbox.stats(), pool.stats()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--notifications', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=2, help='outbox workers (and pool size)')
+    parser.add_argument('--latency', type=float, default=0.05, help='stand-in delay per SMTP round trip')
+    parser.add_argument('--rate', type=float, default=0, help='notifications per second to enqueue (0 = all at once)')
+    parser.add_argument('--digest-window', type=float, default=0.5)
+    parser.add_argument('--digest-max', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.notifications} notifications, {args.workers} workers, {args.latency * 1000:.0f} ms per round trip"
+          + (f", {args.rate:g}/s arriving" if args.rate else ", all queued at once"))
+    print(f"  {'mode':12s} {'seconds':>8s} {'notif/s':>8s} {'emails':>7s} {'logins':>7s} {'saved':>7s} {'dead':>5s}")
+    baseline_logins = None
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in ('per-message', 'pooled', 'digest'):
+            server, port = start_stub_smtp(latency=args.latency)
+            elapsed, outbox_stats, pool_stats = run_mode(mode, args, port, workdir)
+            server.shutdown()
+            server.server_close()
+            if baseline_logins is None:
+                baseline_logins = server.logins
+            print(f"  {mode:12s} {elapsed:8.2f} {args.notifications / elapsed:8.1f} {len(server.messages):7d} "
+                  f"{server.logins:7d} {baseline_logins - server.logins:7d} {outbox_stats['dead']:5d}")
@@ -0,0 +1,138 @@
+import os
+import smtplib
+import socket
+import threading
+import time
+
+from metrics import metrics
+
+# Errors that mean the connection itself is gone rather than the message being
+# refused. Not OSError: every smtplib.SMTPException (refused recipients, bad
+# data, auth failures) is one
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+class SMTPPool:
+    """Authenticated SMTP connections kept open and reused across messages.
+
+    connect() opens, secures and logs in one connection. Idle connections are
+    handed out most-recently-used first. One that has sat idle for longer
+    than check_after is sent a NOOP before reuse; one idle for longer than
+    max_idle (providers drop quiet sessions after a few minutes) is closed
+    and replaced. If a send fails because the connection dropped, the message
+    is retried once on a fresh connection; other errors propagate so the
+    outbox can retry the job. At most size connections are open at once.
+    """
+
+    def __init__(self, connect, size=2, check_after=30.0, max_idle=240.0):
+        self.connect = connect
+        self.size = size
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._pid = os.getpid()
+        self.counters = {'connects': 0, 'reuses': 0, 'health_checks': 0, 'health_failures': 0,
+                         'expired': 0, 'reconnects': 0, 'sent': 0, 'errors': 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _open(self):
+        server = self.connect()
+        self._count('connects')
+        return server
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if self._pid != os.getpid():
+                        # Never share a parent's sockets after fork
+                        self._idle = []
+                        self._pid = os.getpid()
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._open()
+                server, last_used = entry
+                idle = time.monotonic() - last_used
+                if idle > self.max_idle:
+                    self._count('expired')
+                    self._close(server)
+                    continue
+                if idle > self.check_after and not self._healthy(server):
+                    continue
+                self._count('reuses')
+                return server
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _healthy(self, server):
+        self._count('health_checks')
+        try:
+            with metrics.span('smtp', 'noop'):
+                code = server.noop()[0]
+            if code == 250:
+                return True
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._count('health_failures')
+        self._close(server)
+        return False
+
+    def _release(self, server):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._idle.append((server, time.monotonic()))
+        self._slots.release()
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def send(self, msg):
+        """Send an email.message.Message on a pooled connection."""
+        server = self._acquire()
+        try:
+            try:
+                with metrics.span('smtp', 'send'):
+                    server.send_message(msg)
+            except CONNECTION_ERRORS:
+                self._close(server)
+                server = None
+                self._count('reconnects')
+                server = self._open()
+                with metrics.span('smtp', 'send'):
+                    server.send_message(msg)
+        except BaseException:
+            self._count('errors')
+            if server is not None:
+                # The session may be mid-transaction; don't hand it to the next sender
+                self._close(server)
+            self._slots.release()
+            raise
+        self._count('sent')
+        self._release(server)
+
+    def close(self):
+        """Log out of every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['idle'] = len(self._idle)
+            stats['handshakes_saved'] = stats['reuses']
+        return stats
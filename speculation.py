@@ -0,0 +1,137 @@
+import threading
+import time
+
+from faq_cache import features, jaccard, normalize
+
+
+def similarity(a, b):
+    """Word and character-trigram Jaccard of two utterances, as the FAQ cache scores questions."""
+    a, b = normalize(a), normalize(b)
+    if a == b:
+        return 1.0
+    a_words, a_trigrams = features(a)
+    b_words, b_trigrams = features(b)
+    return 0.5 * jaccard(a_words, b_words) + 0.5 * jaccard(a_trigrams, b_trigrams)
+
+
+class Speculation:
+    __slots__ = ('text', 'handle', 'started')
+
+    def __init__(self, text, handle):
+        self.text = text
+        self.handle = handle
+        self.started = time.monotonic()
+
+
+class Speculator:
+    """Starts answering from Twilio's interim transcripts before the caller stops talking.
+
+    observe() is fed each partial result. Once the recognizer's stable prefix
+    has at least min_words words and no more than max_unstable words are
+    still in flux, the transcript is worth answering and observe() returns
+    it; the caller starts the work and registers its handle with started().
+    A later transcript that has drifted below the match threshold from the
+    one being answered replaces it, up to max_attempts per turn. When the
+    final SpeechResult arrives, take() hands back the speculation if its text
+    matches closely enough and counts a hit; anything else is discarded.
+    Speculations live in this process only and expire after max_age seconds.
+    Calls that never send a final result (the caller hung up mid-sentence)
+    are dropped once they have been quiet for max_age seconds.
+    """
+
+    def __init__(self, threshold=0.85, min_words=3, max_unstable=2, max_attempts=2, max_age=30.0):
+        self.threshold = threshold
+        self.min_words = min_words
+        self.max_unstable = max_unstable
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+        self.counters = {'partials': 0, 'started': 0, 'superseded': 0, 'hits': 0, 'misses': 0, 'expired': 0,
+                         'finals_without': 0, 'abandoned': 0}
+        self.saved = {'count': 0, 'total_ms': 0, 'max_ms': 0}
+
+    def observe(self, call_sid, stable, unstable, sequence=None):
+        """Record a partial result. Returns the text to speculate on, or None."""
+        text = ' '.join(part for part in (stable.strip(), unstable.strip()) if part)
+        now = time.monotonic()
+        with self._lock:
+            self.counters['partials'] += 1
+            self._prune(now)
+            state = self._calls.setdefault(call_sid, {'sequence': -1, 'attempts': 0, 'current': None})
+            state['seen'] = now
+            if sequence is not None:
+                # Callbacks can arrive out of order; an older transcript is never more useful
+                if sequence <= state['sequence']:
+                    return None
+                state['sequence'] = sequence
+            if len(stable.split()) < self.min_words or len(unstable.split()) > self.max_unstable:
+                return None
+            current = state['current']
+            if current and similarity(current.text, text) >= self.threshold:
+                return None
+            if state['attempts'] >= self.max_attempts:
+                return None
+            state['attempts'] += 1
+            if current:
+                self.counters['superseded'] += 1
+            # Reserve the slot so concurrent callbacks don't start a second copy
+            state['current'] = Speculation(text, None)
+            return text
+
+    def _prune(self, now):
+        # Caller holds self._lock. At most once a second, forget calls quiet for longer than max_age
+        if now - self._pruned_at < 1.0:
+            return
+        self._pruned_at = now
+        for call_sid in [sid for sid, state in self._calls.items() if now - state['seen'] > self.max_age]:
+            del self._calls[call_sid]
+            self.counters['abandoned'] += 1
+
+    def started(self, call_sid, text, handle):
+        with self._lock:
+            state = self._calls.get(call_sid)
+            if state and state['current'] and state['current'].text == text:
+                state['current'].handle = handle
+                self.counters['started'] += 1
+
+    def take(self, call_sid, final_text):
+        """The speculation for this call if it matches final_text, else None. Ends the turn either way."""
+        with self._lock:
+            state = self._calls.pop(call_sid, None)
+            speculation = state['current'] if state else None
+            if speculation is None or speculation.handle is None:
+                self.counters['finals_without'] += 1
+                return None
+            if time.monotonic() - speculation.started > self.max_age:
+                self.counters['expired'] += 1
+                return None
+            if similarity(speculation.text, final_text) < self.threshold:
+                self.counters['misses'] += 1
+                return None
+            self.counters['hits'] += 1
+            return speculation
+
+    def discard(self, call_sid):
+        """Forget the call's turn without counting it, e.g. when the final turn doesn't need an answer."""
+        with self._lock:
+            self._calls.pop(call_sid, None)
+
+    def record_saved(self, speculation, final_at, done_at):
+        """Count the time saved: how far the answer had got when the final result came in (monotonic times)."""
+        saved = max(0.0, min(final_at, done_at) - speculation.started)
+        ms = round(saved * 1000)
+        with self._lock:
+            self.saved['count'] += 1
+            self.saved['total_ms'] += ms
+            self.saved['max_ms'] = max(self.saved['max_ms'], ms)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['saved'] = dict(self.saved)
+            finals = stats['hits'] + stats['misses'] + stats['expired'] + stats['finals_without']
+            stats['hit_rate'] = round(stats['hits'] / finals, 3) if finals else None
+            stats['in_flight'] = len(self._calls)
+        return stats
@@ -0,0 +1,80 @@
+"""Streaming benchmark: time to the first spoken sentence, blocking vs STREAM_ANSWERS.
+
+Answers a series of calls through the Flask app against the local stub
+Anthropic API, which waits --latency seconds before the first word and
+--token-ms between words. The blocking path returns TwiML once the whole
+reply is written; the streaming path returns the first sentence as soon as
+it is complete and the rest from /answer_ready, which this script follows
+the way Twilio would. It reports when the first <Say> was ready and when the
+last one was, and checks that the streamed parts add up to the full answer.
+
+    python stream_bench.py [--turns 20] [--latency 0.4] [--token-ms 25]
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+from html import unescape
+from urllib.parse import urlparse
+
+from compare_servers import percentile
+from stub_backends import start_stub_anthropic
+
+ANSWER = ("Yes, we set up and integrate Canvas, Moodle and ProProfs for schools and training providers. "
+          "That usually starts with a short review of your current courses and compliance requirements. "
+          "From there we design the course structure, migrate your content and train your staff. "
+          "Would you like to schedule a free discovery call to talk it through?")
+QUESTIONS = ["Do you set up Moodle for schools?", "Can you help with our Canvas rollout?"]
+
+
+def said(twiml):
+    return ' '.join(unescape(text) for text in re.findall(r'<Say[^>]*>([^<]*)</Say>', twiml))
+
+
+def answer_turn(client, call_sid, question):
+    """Returns (seconds to the first <Say>, seconds to the last, spoken text)."""
+    form = {'CallSid': call_sid, 'From': '+15550000000'}
+    started = time.perf_counter()
+    twiml = client.post('/process_speech', data=dict(form, SpeechResult=question)).get_data(as_text=True)
+    first = time.perf_counter() - started
+    # The closing goodbye after the <Gather> isn't part of the answer
+    spoken = [said(twiml.split('<Gather')[0])]
+    while '<Redirect>' in twiml:
+        url = urlparse(unescape(re.search(r'<Redirect>([^<]*)</Redirect>', twiml).group(1)))
+        twiml = client.post(f'{url.path}?{url.query}', data=form).get_data(as_text=True)
+        spoken.append(said(twiml.split('<Gather')[0]))
+    return first, time.perf_counter() - started, ' '.join(part for part in spoken if part)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.4, help='stub delay before the first word')
+    parser.add_argument('--token-ms', type=float, default=25, help='stub delay between words')
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_anthropic(latency=args.latency, token_latency=args.token_ms / 1000, answer=ANSWER)
+    workdir = tempfile.mkdtemp()
+    os.environ.update(ANTHROPIC_API_KEY='stub-key', ANTHROPIC_BASE_URL=stub_url, FAQ_CACHE_ENABLED='0',
+                      WARM_UP='0', SESSION_BACKEND='memory', OUTBOX_PATH=os.path.join(workdir, 'outbox.db'),
+                      CALL_RECORDS_PATH=os.path.join(workdir, 'call_records.db'),
+                      KNOWLEDGE_INDEX_PATH=os.path.join(workdir, 'knowledge_index.json'))
+    import ai_phone_answering_system as phone
+    client = phone.app.test_client()
+
+    print(f"{args.turns} turns, stub {args.latency * 1000:.0f} ms to the first word + {args.token_ms:g} ms per word, "
+          f"{len(ANSWER.split())} words")
+    print(f"  {'mode':10s} {'first p50':>10s} {'first p95':>10s} {'last p50':>9s} {'complete':>9s}")
+    for mode in ('blocking', 'streaming'):
+        phone.STREAM_ANSWERS = mode == 'streaming'
+        firsts, lasts, complete = [], [], 0
+        for n in range(args.turns):
+            # Two questions per call, so no turn escalates
+            first, last, text = answer_turn(client, f'CA-{mode}-{n // 2}', QUESTIONS[n % 2])
+            firsts.append(first)
+            lasts.append(last)
+            complete += text == ANSWER
+        print(f"  {mode:10s} {percentile(firsts, 50) * 1000:8.0f}ms {percentile(firsts, 95) * 1000:8.0f}ms "
+              f"{percentile(lasts, 50) * 1000:7.0f}ms {complete:5d}/{args.turns}")
+    stub.shutdown()
@@ -0,0 +1,346 @@
+import base64
+import json
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from context_window import estimate_tokens
+
+STUB_ANSWER = ("We design AI-governed curriculum systems and help institutions with compliance and "
+               "accreditation. Would you like to schedule a free discovery call?")
+
+
+def prompt_text(request):
+    """The text of a Messages API request's system prompt and messages."""
+    parts = []
+    for block in [request.get('system', '')] + [m.get('content', '') for m in request.get('messages', [])]:
+        if isinstance(block, str):
+            parts.append(block)
+        else:
+            parts.extend(item.get('text', '') for item in block)
+    return '\n'.join(parts)
+
+
+class StubAnthropicHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1/messages like the Messages API (and GET /v1/models), after the server's latency.
+
+    Input tokens are estimated from the prompt text, and each thousand of
+    them adds the server's prefill_latency on top of its fixed latency. The
+    answer is generated a word at a time, token_latency apart; with
+    "stream": true the words are sent as server-sent events as they are made.
+    Setting the server's status to an error code makes every call fail with it.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        # models.list, used by the app's warm-up
+        body = json.dumps({'data': [{'id': 'stub', 'type': 'model', 'display_name': 'Stub',
+                                     'created_at': '2025-01-01T00:00:00Z'}],
+                           'has_more': False, 'first_id': 'stub', 'last_id': 'stub'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        input_tokens = estimate_tokens(prompt_text(request))
+        time.sleep(self.server.latency + self.server.prefill_latency * input_tokens / 1000)
+        if self.server.status != 200:
+            self.error(self.server.status)
+            return
+        words = [word + ' ' for word in self.server.answer.split(' ')]
+        words[-1] = words[-1].rstrip()
+        if request.get('stream'):
+            try:
+                self.stream(request, words, input_tokens)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client gave up on the stream
+            return
+        time.sleep(self.server.token_latency * len(words))
+        body = json.dumps({
+            'id': 'msg_stub',
+            'type': 'message',
+            'role': 'assistant',
+            'model': request.get('model', 'stub'),
+            'content': [{'type': 'text', 'text': self.server.answer}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {'input_tokens': input_tokens, 'output_tokens': 30,
+                      'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0},
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out first
+
+    def stream(self, request, words, input_tokens):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        message = {'id': 'msg_stub', 'type': 'message', 'role': 'assistant', 'model': request.get('model', 'stub'),
+                   'content': [], 'stop_reason': None, 'stop_sequence': None,
+                   'usage': {'input_tokens': input_tokens, 'output_tokens': 1}}
+        self.event('message_start', {'type': 'message_start', 'message': message})
+        self.event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                           'content_block': {'type': 'text', 'text': ''}})
+        for word in words:
+            time.sleep(self.server.token_latency)
+            self.event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                               'delta': {'type': 'text_delta', 'text': word}})
+        self.event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        self.event('message_delta', {'type': 'message_delta',
+                                     'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                     'usage': {'output_tokens': len(words)}})
+        self.event('message_stop', {'type': 'message_stop'})
+
+    def error(self, status):
+        body = json.dumps({'type': 'error', 'error': {'type': 'api_error', 'message': 'stub fault'}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def event(self, name, data):
+        self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_stub_anthropic(port=0, latency=0.5, prefill_latency=0.0, token_latency=0.0, answer=STUB_ANSWER):
+    """Start the stub on a background thread; point ANTHROPIC_BASE_URL at the returned URL."""
+    server = StubServer(('127.0.0.1', port), StubAnthropicHandler)
+    server.answer = answer
+    server.latency = latency
+    server.prefill_latency = prefill_latency
+    server.token_latency = token_latency
+    server.status = 200
+    threading.Thread(target=server.serve_forever, name='stub-anthropic', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough ESMTP for smtplib: EHLO, AUTH PLAIN, MAIL/RCPT/DATA, NOOP, RSET, QUIT."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        time.sleep(server.latency)
+        if server.refuse:
+            self.reply('421 stub unavailable')
+            return
+        self.reply('220 stub ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply('250-stub')
+                self.reply('250 AUTH PLAIN')
+            elif verb == 'HELO':
+                self.reply('250 stub')
+            elif verb == 'AUTH':
+                time.sleep(server.latency)
+                credentials = base64.b64decode(command.split()[-1]).split(b'\0')
+                with server.lock:
+                    server.logins += 1
+                    server.last_login = credentials[1].decode() if len(credentials) > 1 else ''
+                self.reply('235 authenticated')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 go ahead')
+                body = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    body.append(data)
+                time.sleep(server.latency)
+                with server.lock:
+                    server.messages.append(b''.join(body))
+                self.reply('250 queued')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency):
+        super().__init__(address, StubSMTPHandler)
+        self.latency = latency
+        self.refuse = False
+        self.lock = threading.Lock()
+        self.messages = []
+        self.logins = 0
+        self.last_login = None
+
+
+def start_stub_smtp(port=0, latency=0.1):
+    """Start a local SMTP stand-in; use SMTP_HOST=127.0.0.1, SMTP_PORT=<port>, SMTP_STARTTLS=0."""
+    server = StubSMTPServer(('127.0.0.1', port), latency)
+    threading.Thread(target=server.serve_forever, name='stub-smtp', daemon=True).start()
+    return server, server.server_address[1]
+
+
+class StubRequest:
+    def __init__(self, latency, fn):
+        self.latency = latency
+        self.fn = fn
+
+    def execute(self):
+        time.sleep(self.latency)
+        return self.fn()
+
+
+class StubCalendarService:
+    """In-process stand-in for the Calendar discovery client (events().list/insert)."""
+
+    def __init__(self, latency=0.15):
+        self.latency = latency
+        self.error = None
+        self.lock = threading.Lock()
+        self.items = {}
+
+    def events(self):
+        return self
+
+    def list(self, calendarId, pageToken=None, **params):
+        def page():
+            if self.error:
+                raise self.error
+            with self.lock:
+                return {'items': list(self.items.values()), 'nextSyncToken': 'stub-sync-token'}
+        return StubRequest(self.latency, page)
+
+    def insert(self, calendarId, body):
+        def create():
+            if self.error:
+                raise self.error
+            with self.lock:
+                event = dict(body, id=f'stub-{len(self.items) + 1}')
+                self.items[event['id']] = event
+                return event
+        return StubRequest(self.latency, create)
+
+
+class StubWorksheet:
+    def __init__(self, latency):
+        self.latency = latency
+        self.error = None
+        self.lock = threading.Lock()
+        self.rows = []
+
+    def row_values(self, index):
+        time.sleep(self.latency)
+        with self.lock:
+            return list(self.rows[index - 1]) if len(self.rows) >= index else []
+
+    def insert_row(self, values, index):
+        time.sleep(self.latency)
+        with self.lock:
+            self.rows.insert(index - 1, list(values))
+
+    def append_rows(self, rows):
+        time.sleep(self.latency)
+        if self.error:
+            raise self.error
+        with self.lock:
+            self.rows.extend(rows)
+
+
+class StubSheetsClient:
+    """In-process stand-in for a gspread client: open_by_key(...).sheet1 and named worksheets."""
+
+    def __init__(self, latency=0.2):
+        self.latency = latency
+        self.sheet1 = StubWorksheet(latency)
+        self.worksheets = {}
+
+    def open_by_key(self, key):
+        time.sleep(self.latency)
+        return self
+
+    def worksheet(self, title):
+        from gspread import WorksheetNotFound
+        if title not in self.worksheets:
+            raise WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self.worksheets[title] = StubWorksheet(self.latency)
+        return self.worksheets[title]
+
+
+def start_stub_redis(port=0):
+    """In-process Redis stand-in (fakeredis, a test-only dependency) for SESSION_BACKEND=redis.
+
+    Returns (server, url); server.shutdown() stops it.
+    """
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(('127.0.0.1', port))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"redis://127.0.0.1:{server.server_address[1]}/0"
+
+
+class StubCredentials:
+    token = 'stub-token'
+
+    def __init__(self):
+        self.expiry = datetime.utcnow() + timedelta(days=1)
+
+    def refresh(self, request):
+        self.expiry = datetime.utcnow() + timedelta(days=1)
+
+
+def install_google_stubs(registry, calendar_latency=0.15, sheets_latency=0.2):
+    """Point a GoogleClientRegistry's 'calendar' and 'sheets' clients at in-process stand-ins."""
+    calendar = StubCalendarService(calendar_latency)
+    sheets = StubSheetsClient(sheets_latency)
+    registry.load_credentials = lambda scopes: StubCredentials()
+    registry.register('calendar', ['https://www.googleapis.com/auth/calendar'], lambda creds: calendar)
+    registry.register('sheets', ['https://www.googleapis.com/auth/spreadsheets'], lambda creds: sheets)
+    registry.invalidate()
+    return calendar, sheets
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    server, url = start_stub_anthropic(port, latency)
+    print(f"Stub Anthropic API on {url} ({latency * 1000:.0f} ms per call) - set ANTHROPIC_BASE_URL={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
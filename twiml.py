@@ -0,0 +1,168 @@
+import time
+from xml.sax.saxutils import escape
+
+from twilio.twiml.voice_response import VoiceResponse, Gather
+
+VOICE = 'Google.en-US-Neural2-F'
+
+
+# Reference builders - the twilio library output these are rendered from and
+# verified against.
+
+def partial_callback_args(base_url, partial_callback):
+    # Interim transcripts go to /partial_speech while the caller is still talking
+    return {'partial_result_callback': base_url + '/partial_speech'} if partial_callback else {}
+
+
+def greeting_response(base_url, partial_callback=False):
+    response = VoiceResponse()
+    response.say("Hi! Thanks for calling World Teach Pathways. How can I help you today?", voice=VOICE, language='en-US')
+    # Use absolute URL so Twilio can find your server
+    gather = Gather(input='speech', action=base_url + '/process_speech', speech_timeout='auto', language='en-US',
+                    **partial_callback_args(base_url, partial_callback))
+    response.append(gather)
+    response.redirect(base_url + '/voice')
+    return response
+
+
+def repeat_response(base_url):
+    response = VoiceResponse()
+    response.say("Sorry, I didn't catch that. Could you repeat that?", voice=VOICE)
+    response.redirect(base_url + '/voice')
+    return response
+
+
+def voicemail_thanks_response():
+    response = VoiceResponse()
+    response.say("Thank you. We'll call you back as soon as possible. Goodbye!", voice=VOICE)
+    response.hangup()
+    return response
+
+
+def answer_response(base_url, ai_answer, partial_callback=False):
+    response = VoiceResponse()
+    response.say(ai_answer, voice=VOICE, language='en-US')
+    # Let Claude's response end naturally - no robotic follow-up phrase added
+    gather = Gather(input='speech', action=base_url + '/process_speech', speech_timeout='auto', timeout=6,
+                    **partial_callback_args(base_url, partial_callback))
+    response.append(gather)
+    response.say("Thanks for calling World Teach Pathways! Have a great day!", voice=VOICE)
+    response.hangup()
+    return response
+
+
+def hold_response(base_url, turn, attempt, pause, said=0):
+    response = VoiceResponse()
+    response.pause(length=pause)
+    response.redirect(f"{base_url}/answer_ready?turn={turn}&attempt={attempt}&said={said}")
+    return response
+
+
+def partial_response(base_url, text, turn, said):
+    # The start of a streamed answer; /answer_ready speaks what comes after sentence `said`
+    response = VoiceResponse()
+    response.say(text, voice=VOICE, language='en-US')
+    response.redirect(f"{base_url}/answer_ready?turn={turn}&said={said}")
+    return response
+
+
+class Template:
+    """A TwiML document pre-rendered once, with holes for text-node values.
+
+    The reference builder is rendered with marker strings in place of the
+    values and split on them; rendering is then a join of the literal parts
+    with the XML-escaped values (escaped exactly as ElementTree escapes text).
+    """
+
+    def __init__(self, build, arity):
+        markers = [f'@@twiml-slot-{i}@@' for i in range(arity)]
+        xml = str(build(*markers))
+        self.parts = []
+        for marker in markers:
+            head, xml = xml.split(marker)
+            self.parts.append(head)
+        self.parts.append(xml)
+
+    def render(self, *values):
+        out = [self.parts[0]]
+        for value, part in zip(values, self.parts[1:]):
+            out.append(escape(str(value)))
+            out.append(part)
+        return ''.join(out)
+
+
+class TwimlTemplates:
+    """Static responses pre-rendered at startup plus fast templates for dynamic ones."""
+
+    def __init__(self, base_url, pause=1, partial_callback=False):
+        self.base_url = base_url
+        self.pause = pause
+        self.partial_callback = partial_callback
+        self.greeting = str(greeting_response(base_url, partial_callback))
+        self.repeat = str(repeat_response(base_url))
+        self.voicemail_thanks = str(voicemail_thanks_response())
+        self._answer = Template(lambda text: answer_response(base_url, text, partial_callback), 1)
+        self._hold = Template(lambda turn, attempt, said: hold_response(base_url, turn, attempt, pause, said), 3)
+        self._partial = Template(lambda text, turn, said: partial_response(base_url, text, turn, said), 3)
+        mismatches = self.verify()
+        self.verified = not mismatches
+        if mismatches:
+            print(f"TwiML templates differ from the twilio library output for {mismatches} - rendering with the library instead")
+
+    def answer(self, ai_answer):
+        if not ai_answer or not self.verified:
+            # An empty <Say> renders as a self-closing tag, which the template can't express
+            return str(answer_response(self.base_url, ai_answer, self.partial_callback))
+        return self._answer.render(ai_answer)
+
+    def hold(self, turn, attempt, said=0):
+        if not self.verified:
+            return str(hold_response(self.base_url, turn, attempt, self.pause, said))
+        return self._hold.render(int(turn), int(attempt), int(said))
+
+    def partial(self, text, turn, said):
+        if not text or not self.verified:
+            return str(partial_response(self.base_url, text, turn, said))
+        return self._partial.render(text, int(turn), int(said))
+
+    def verify(self, samples=("Hello there.", "Pricing & scope <depends> on \"needs\" it's 100% custom",
+                              "Café – naïve résumé ✓", "  spaced\nnewline\ttab  ")):
+        """Compare every template byte-for-byte with the twilio library's output."""
+        mismatches = []
+        for text in samples:
+            if self._answer.render(text) != str(answer_response(self.base_url, text, self.partial_callback)):
+                mismatches.append(('answer', text))
+            if self._partial.render(text, 2, 1) != str(partial_response(self.base_url, text, 2, 1)):
+                mismatches.append(('partial', text))
+        for turn, attempt, said in [(1, 1, 0), (3, 12, 2)]:
+            if self._hold.render(turn, attempt, said) != str(hold_response(self.base_url, turn, attempt, self.pause, said)):
+                mismatches.append(('hold', (turn, attempt, said)))
+        return mismatches
+
+
+if __name__ == '__main__':
+    # Micro-benchmark: per-request rendering cost, twilio object tree vs template
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    base_url = 'https://example.onrender.com'
+    templates = TwimlTemplates(base_url)
+    mismatches = templates.verify()
+    print(f"byte-for-byte verification: {'OK' if not mismatches else mismatches}")
+    answer = ("We offer curriculum design, AI-governed compliance consulting and LMS integration for "
+              "schools & training providers. Would you like to schedule a free discovery call?")
+    cases = [
+        ('greeting', lambda: str(greeting_response(base_url)), lambda: templates.greeting),
+        ('repeat', lambda: str(repeat_response(base_url)), lambda: templates.repeat),
+        ('voicemail', lambda: str(voicemail_thanks_response()), lambda: templates.voicemail_thanks),
+        ('answer', lambda: str(answer_response(base_url, answer)), lambda: templates.answer(answer)),
+        ('hold', lambda: str(hold_response(base_url, 2, 3, 1)), lambda: templates.hold(2, 3)),
+        ('partial', lambda: str(partial_response(base_url, answer, 2, 1)), lambda: templates.partial(answer, 2, 1)),
+    ]
+    for name, before, after in cases:
+        timings = []
+        for fn in (before, after):
+            started = time.perf_counter()
+            for _ in range(n):
+                fn()
+            timings.append((time.perf_counter() - started) / n * 1e6)
+        print(f"{name:10s} twilio {timings[0]:7.2f} us   template {timings[1]:6.2f} us   {timings[0] / timings[1]:6.1f}x")